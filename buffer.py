@@ -1,108 +1,389 @@
 from lstore.table import *
 from lstore.db import *
 from lstore.page import Page
+from lstore.replacement import make_policy
+from lstore.stats import stats
 import lstore.config
 import lstore.table
 import math
 import os
 import threading
+import time
 
-#page_map: contains a list of base or tail ranges
+#page_map: contains one column page of a base or tail range per frame
+#the pool is shared by every table of the database, frames are keyed by (table name, range offset, column) and the table owning
+#a frame is the one its page is written back through. Column pages are loaded on demand: a select only brings in the columns
+#it projects and a range whose cold columns are evicted keeps its hot ones in memory
+#frame_map, page_map, slot_map, the free frames, the frame counts and the replacement policy are guarded by the pool latch, only held for map updates
+#a range hashes to one of the striped latches, which guards the pins of its pages and which of them are in the pool. The stripe
+#is held while missing pages are read from disk, so threads missing on the same range wait for that single read and then hit (single-flight)
+#a table can be given a minimum number of frames other tables can't evict below and a maximum it can't grow past (see set_quota)
 class Bufferpool():
     def __init__(self, db):
         self.db = db
-        self.frame_map = {} # page slot number to frame id
+        self.frame_map = {} # (table name, page slot number, column) to frame id
         self.page_map = {}  # frame id to page
-        self.size = lstore.config.buffersize
-        self.accesses = [0] * self.size
-        self.pins = [0] * self.size #TODO: for milestone 3, make pins an int
+        self.slot_map = {}  # frame id to (table name, page slot number, column)
+        self.frame_counts = {} # table name to number of frames it owns
+        self.widths = {} # table name to the column indexes of its ranges
+        self.quotas = dict(lstore.config.BufferQuotas) # table name to (min frames, max frames)
+        self.size = lstore.config.BufferPages if lstore.config.BufferPages > 0 else lstore.config.buffersize * (lstore.config.Offset + 5)
+        self.pins = [0] * self.size
+        self.free_frames = list(range(self.size - 1, -1, -1))
+        self.policy = make_policy(lstore.config.EvictionPolicy, self.size)
+        self.latch = threading.Lock()
+        self.stripes = [threading.RLock() for stripe in range(lstore.config.BufferStripes)]
+        self.hits = 0
+        self.misses = 0
+        self.writer = None
+        self.wake_writer = threading.Event()
+        self.stop_writer_event = threading.Event()
+
+    def __stripe__(self, name, page_slot):
+        return self.stripes[hash((name, page_slot)) % len(self.stripes)]
+
+    #every column index of the table's ranges, metadata columns included
+    def __columns__(self, name):
+        if name not in self.widths:
+            self.widths[name] = range(self.db.get_table(name).num_columns + lstore.config.Offset)
+        return self.widths[name]
+
+    #frames of the table that other tables can't evict, and the most frames it may hold (None for no limit)
+    def set_quota(self, name, min_frames = 0, max_frames = None):
+        if max_frames is not None and max_frames < max(1, min_frames):
+            raise ValueError("maximum frames of " + name + " must be at least 1 and its minimum")
+        with self.latch:
+            self.quotas[name] = (min_frames, max_frames)
+
+    def __quota__(self, name):
+        return self.quotas.get(name, (0, None))
+
+    def __at_max__(self, name):
+        max_frames = self.__quota__(name)[1]
+        return max_frames is not None and self.frame_counts.get(name, 0) >= max_frames
 
     def must_evict(self):
-        return len(self.page_map) == self.size
-
-    #fetches the range and returns, while putting it in a frame index
-    def fetch_range(self, name, page_slot):
-        if page_slot in self.frame_map: #if in memory, just return
-            self.accesses[self.frame_map[page_slot]] += 1
-            self.pin_range(name, page_slot) #pin this page
-            return self.page_map[self.frame_map[page_slot]]
-        else:
-            new_range = self.get_range(name, page_slot)
-            if self.must_evict(): #must evict a page and store a new one from disk
-                frame_num = self.evict(name)
-                self.frame_map[page_slot] = frame_num
-                self.page_map[frame_num] = new_range
-            else: #there is space in the buffer pool to fit a new set of ranges
-                self.frame_map[page_slot] = len(self.page_map)
-                self.page_map[self.frame_map[page_slot]] = new_range
-
-
-        self.accesses[self.frame_map[page_slot]] += 1 #increase num accesses for this frame
-        self.pin_range(name, page_slot) #pin this page
-        return self.page_map[self.frame_map[page_slot]]
-
-    #check to see if the range is pinned
+        return len(self.free_frames) == 0
+
+    #fetches the pages of the range at the given columns (all of them by default) and returns them pinned, while putting them
+    #in frames. The list is indexed by column, columns that weren't asked for are None
+    def fetch_range(self, name, page_slot, columns = None):
+        columns = self.__columns__(name) if columns is None else columns
+        stripe = self.__stripe__(name, page_slot)
+        if not stripe.acquire(blocking = False): #someone is loading, pinning or writing a range of this stripe
+            started = time.perf_counter()
+            stripe.acquire()
+            if stats.enabled:
+                stats.count(name, "pin_wait", time.perf_counter() - started)
+        try:
+            pages = [None] * len(self.__columns__(name))
+            missing = []
+            hit_frames = []
+            for column_index in columns:
+                frame_num = self.frame_map.get((name, page_slot, column_index))
+                if frame_num is None:
+                    missing.append(column_index)
+                    continue
+                self.pins[frame_num] += 1 #if in memory, just pin
+                hit_frames.append(frame_num)
+                pages[column_index] = self.page_map[frame_num]
+
+            if len(missing) != 0:
+                if self.writer is not None and self.must_evict():
+                    self.wake_writer.set() #clean frames are running out
+                placed = []
+                try:
+                    for column_index, page in zip(missing, self.get_pages(name, page_slot, missing)):
+                        frame_num = self.__place__(name, page_slot, column_index, page)
+                        self.pins[frame_num] += 1 #pin this page
+                        placed.append(frame_num)
+                        pages[column_index] = page
+                except BaseException: #no frame left for a page, the fetch pins nothing
+                    for frame_num in hit_frames + placed:
+                        self.pins[frame_num] -= 1
+                    raise
+
+            with self.latch:
+                for frame_num in hit_frames:
+                    self.policy.access(frame_num)
+                self.hits += len(hit_frames)
+                self.misses += len(missing)
+            if stats.enabled:
+                if len(hit_frames) != 0:
+                    stats.count(name, "hits", len(hit_frames))
+                if len(missing) != 0:
+                    stats.count(name, "misses", len(missing))
+            return pages
+        finally:
+            stripe.release()
+
+    #put a page in a free frame, or in the frame of an evicted page once the pool is full or the table is at its maximum
+    #called with the stripe of the range held
+    def __place__(self, name, page_slot, column_index, page):
+        key = (name, page_slot, column_index)
+        with self.latch:
+            frame_num = self.free_frames.pop() if not self.must_evict() and not self.__at_max__(name) else None
+        if frame_num is None: #must evict a page and store a new one
+            frame_num = self.evict(name)
+
+        with self.latch:
+            self.frame_map[key] = frame_num
+            self.slot_map[frame_num] = key
+            self.page_map[frame_num] = page
+            self.frame_counts[name] = self.frame_counts.get(name, 0) + 1
+            self.policy.admit(frame_num, key)
+        return frame_num
+
+    def hit_ratio(self):
+        return self.hits / max(1, self.hits + self.misses)
+
+    #frames of the range's pages that are in the pool
+    def __frames__(self, name, page_slot):
+        frames = []
+        for column_index in self.__columns__(name):
+            frame_num = self.frame_map.get((name, page_slot, column_index))
+            if frame_num is not None:
+                frames.append(frame_num)
+        return frames
+
+    #check to see if any page of the range is pinned
     def is_pinned(self, name, page_slot):
-        frame_num = self.frame_map[page_slot]
-        return self.pins[frame_num] > 0
+        return any(self.pins[frame_num] > 0 for frame_num in self.__frames__(name, page_slot))
 
-    #TODO: for milestone 3, make pins an int
-    def pin_range(self, name, page_slot):
-        frame_num = self.frame_map[page_slot]
-        self.pins[frame_num] += 1
+    def pin_range(self, name, page_slot, columns = None):
+        with self.__stripe__(name, page_slot):
+            for column_index in (self.__columns__(name) if columns is None else columns):
+                self.pins[self.frame_map[(name, page_slot, column_index)]] += 1
 
     def get_pins(self, name, page_slot):
-        return self.pins[self.frame_map[page_slot]]
+        return max([self.pins[frame_num] for frame_num in self.__frames__(name, page_slot)] + [0])
 
-    #TODO: for milestone 3, make pins an int
-    def unpin_range(self, name, page_slot):
-        frame_num = self.frame_map[page_slot]
-        self.pins[frame_num] -= 1
+    #unpin the pages fetch_range pinned, columns has to be the same as in the fetch
+    def unpin_range(self, name, page_slot, columns = None):
+        with self.__stripe__(name, page_slot):
+            for column_index in (self.__columns__(name) if columns is None else columns):
+                self.pins[self.frame_map[(name, page_slot, column_index)]] -= 1
 
-    #get the specified page_index
-    def get_range(self, name, page_index):
-        curr_table = self.db.get_table(name)
-        new_range = []
-        for column_index in range(lstore.config.Offset + curr_table.num_columns):
-            new_page = curr_table.disk.fetch_page(name, column_index, page_index) #fetch page from disk
-            new_range.append(new_page)
+    #number of frames each table holds
+    def frames(self):
+        with self.latch:
+            return dict(self.frame_counts)
 
-        return new_range
+    #read the pages of the range at the given columns
+    def get_pages(self, name, page_index, columns):
+        curr_table = self.db.get_table(name)
+        return curr_table.disk.fetch_pages(name, page_index, columns) #a single read for a whole segment
 
     def add_range(self, name, page_slot):
         curr_table = self.db.get_table(name)
-        new_range = []
+        with self.__stripe__(name, page_slot):
+            new_range = curr_table.disk.new_range(name, page_slot) #empty pages, mapped in place in mmap mode
+            for column_index, page in enumerate(new_range):
+                self.__place__(name, page_slot, column_index, page)
 
-        for column_index in range(lstore.config.Offset + curr_table.num_columns):
-            new_page = Page()
-            new_range.append(new_page)
+    #install new pages for a range, readers still holding the old pages finish with them. Pages that aren't buffered are written
+    #to disk, columns that are None in new_range are left as they are
+    def swap_range(self, name, page_slot, new_range):
+        with self.__stripe__(name, page_slot):
+            unbuffered = [None] * len(new_range)
+            for column_index, page in enumerate(new_range):
+                if page is None:
+                    continue
+                frame_num = self.frame_map.get((name, page_slot, column_index))
+                if frame_num is None:
+                    unbuffered[column_index] = page
+                else:
+                    with self.latch:
+                        self.page_map[frame_num] = page
+            if any(page is not None for page in unbuffered):
+                if self.db.logger is not None: #log records describing the range must reach the disk before it does
+                    self.db.logger.flush()
+                self.db.get_table(name).disk.write_pages(name, page_slot, unbuffered, [column_index for column_index, page in enumerate(unbuffered) if page is not None])
 
-        if self.must_evict(): #need to evict a page to add the new range from memory
-            frame_num = self.evict(name)
-            self.frame_map[page_slot] = frame_num
-            self.page_map[frame_num]= new_range
-            self.accesses[frame_num] += 1 #increase num accesses for this frame
-        else: #space in the buffer pool to add a new range from memory
-            self.frame_map[page_slot] = len(self.page_map)
-            self.page_map[self.frame_map[page_slot]] = new_range
-            self.accesses[self.frame_map[page_slot]] += 1 #increase num accesses for this frame
+    #buffered pages of the range indexed by column, None for the others. Called with the stripe of the range held
+    def __buffered__(self, name, page_slot, unpinned_only = False):
+        pages = [None] * len(self.__columns__(name))
+        for column_index in self.__columns__(name):
+            frame_num = self.frame_map.get((name, page_slot, column_index))
+            if frame_num is not None and not (unpinned_only and self.pins[frame_num] > 0):
+                pages[column_index] = self.page_map[frame_num]
+        return pages
 
-    def evict(self, name):
-        count = math.inf
-        evict_page_slot = None
-        for fk in self.frame_map.keys():
-            frame_num = self.frame_map[fk]
-            num_accesses = self.accesses[frame_num]
-            num_pins = self.pins[frame_num]
-            if num_accesses < count and num_pins == 0:
-                count = num_accesses
-                evict_page_slot = fk
+    #write every buffered page of the table, only the dirty ones if dirty_only is set. With unpinned_only set (fuzzy checkpoints)
+    #pinned frames, which may be in the middle of a change, are left out like the background writer does. Returns True if a dirty
+    #page was left out, the log records of its changes are still needed
+    def write_back(self, name, dirty_only, unpinned_only = False):
+        skipped = False
+        for page_slot in sorted(set(key[1] for key in list(self.frame_map.keys()) if key[0] == name)):
+            with self.__stripe__(name, page_slot): #held, nobody can pin the range while it is written
+                pages = self.__buffered__(name, page_slot)
+                if unpinned_only:
+                    unpinned = self.__buffered__(name, page_slot, True)
+                    skipped = skipped or any(page is not None and page.dirty and unpinned[column_index] is None for column_index, page in enumerate(pages))
+                    pages = unpinned
+                if dirty_only:
+                    self.__write_dirty__(name, page_slot, pages)
+                else:
+                    self.__write_range__(name, page_slot, pages)
+        return skipped
 
+    def __write_range__(self, name, page_slot, pages):
         curr_table = self.db.get_table(name)
-        for column_index in range(lstore.config.Offset + curr_table.num_columns):
-            page_to_write = self.page_map[self.frame_map[evict_page_slot]][column_index]
-            curr_table.disk.write(name, column_index, evict_page_slot, page_to_write)
+        if self.db.logger is not None: #log records describing the range must reach the disk before it does
+            self.db.logger.flush()
+        curr_table.disk.write_pages(name, page_slot, pages, [column_index for column_index, page in enumerate(pages) if page is not None])
+
+    #write the dirty pages of a range (a list indexed by column, None for the pages left out), returns False if there were none
+    #pages that weren't changed are the same as on disk
+    def __write_dirty__(self, name, page_slot, pages, flush_log = True):
+        column_indexes = [column_index for column_index, page in enumerate(pages) if page is not None and page.dirty]
+        if len(column_indexes) == 0:
+            return False
+        for column_index in column_indexes:
+            pages[column_index].dirty = False #cleared first, the page writers set it after their change so one racing with the write marks the page again
+        if flush_log and self.db.logger is not None: #WAL rule
+            self.db.logger.flush()
+        self.db.get_table(name).disk.write_pages(name, page_slot, pages, column_indexes)
+        if stats.enabled:
+            stats.count(name, "dirty_writebacks")
+            stats.count(name, "pages_written", len(column_indexes))
+        return True
+
+    """
+    # Background writer
+    # Each round builds the dirty page table of the ranges with unpinned dirty pages and, while fewer than CleanFrames frames
+    # are free or clean, writes a batch of them in (table, offset) order so the writes walk each file forwards. The log is forced
+    # once per batch. Eviction then mostly finds clean victims and a miss doesn't pay for a write-back
+    """
+    def start_writer(self):
+        if self.writer is not None or lstore.config.WriterInterval <= 0:
+            return
+        self.stop_writer_event.clear()
+        self.writer = threading.Thread(name = "buffer_writer", target = self.__writer_loop__, daemon = True)
+        self.writer.start()
+
+    def stop_writer(self):
+        if self.writer is None:
+            return
+        self.stop_writer_event.set()
+        self.wake_writer.set()
+        self.writer.join()
+        self.writer = None
+
+    def __writer_loop__(self):
+        while not self.stop_writer_event.is_set():
+            self.wake_writer.wait(lstore.config.WriterInterval)
+            self.wake_writer.clear()
+            while not self.stop_writer_event.is_set() and self.write_dirty_batch() != 0:
+                pass
+
+    #write one batch of dirty ranges if clean frames are short, returns the number of ranges written
+    def write_dirty_batch(self):
+        with self.latch:
+            clean = len(self.free_frames)
+            dirty_page_table = set() # (table name, page slot) of ranges with unpinned dirty pages
+            for frame_num, key in self.slot_map.items():
+                if self.pins[frame_num] > 0: #in use, would likely be dirtied again right away
+                    continue
+                if self.page_map[frame_num].dirty:
+                    dirty_page_table.add(key[:2])
+                else:
+                    clean += 1
+        if clean >= lstore.config.CleanFrames or len(dirty_page_table) == 0:
+            return 0
+
+        if self.db.logger is not None:
+            self.db.logger.flush()
+        written = 0
+        for name, page_slot in sorted(dirty_page_table)[:lstore.config.WriterBatch]:
+            stripe = self.__stripe__(name, page_slot)
+            if not stripe.acquire(blocking = False): #busy, a later round gets it
+                continue
+            try:
+                if self.__write_dirty__(name, page_slot, self.__buffered__(name, page_slot, True), False):
+                    written += 1
+                    if stats.enabled:
+                        stats.count(name, "background_writebacks")
+            finally:
+                stripe.release()
+        return written
+
+    #frames the policy may not pick when the table needs a frame: pinned ones, those skipped earlier in the same eviction, those
+    #of other tables when it is at its maximum and, unless protect_minimums is off, those of tables that are down to their minimum
+    def __unavailable__(self, name, protect_minimums, skipped = ()):
+        at_max = self.__at_max__(name)
+        def unavailable(frame_num):
+            if self.pins[frame_num] > 0 or frame_num in skipped:
+                return True
+            owner = self.slot_map[frame_num][0]
+            if at_max:
+                return owner != name
+            return protect_minimums and owner != name and self.frame_counts[owner] <= self.__quota__(owner)[0]
+        return unavailable
+
+    """
+    # Write back the page chosen by the replacement policy and return its frame for reuse
+    # The stripe of the victim's range is only tried, a busy stripe means someone is using the range. The victim is then kept
+    # out of the policy as skipped and another one is picked, skipped frames are admitted again once the eviction is over
+    # (admitting them right away would make LFU or LRU-K pick the same frame again and again). When only skipped frames are
+    # left they are given back to the policy and tried again after a short wait, the eviction only fails once every frame
+    # the table can take is pinned, or its ranges stayed busy for LockTimeout seconds.
+    # When every candidate is down to its table's minimum the minimums give way, the table would otherwise fail to get a frame
+    """
+    def evict(self, name):
+        protect_minimums = True
+        skipped = {} # frame to key of the victims whose stripe was busy
+        deadline = None
+        try:
+            while True:
+                with self.latch:
+                    victim = self.policy.victim(self.__unavailable__(name, protect_minimums, skipped))
+                    if victim is None and protect_minimums and not self.__at_max__(name):
+                        protect_minimums = False
+                        victim = self.policy.victim(self.__unavailable__(name, protect_minimums, skipped))
+                    if victim is None:
+                        if len(skipped) == 0: #every frame the table can take is pinned
+                            break
+                        for frame_num, key in skipped.items():
+                            self.policy.admit(frame_num, key)
+                        skipped.clear()
+                    else:
+                        evict_key = self.slot_map[victim]
+                if victim is None:
+                    deadline = time.monotonic() + lstore.config.LockTimeout if deadline is None else deadline
+                    if time.monotonic() > deadline:
+                        break
+                    time.sleep(0.001) #let the threads using the busy ranges finish with them
+                    continue
+
+                stripe = self.__stripe__(*evict_key[:2])
+                if not stripe.acquire(blocking = False):
+                    skipped[victim] = evict_key
+                    continue
+                try:
+                    if self.pins[victim] > 0 or self.frame_map.get(evict_key) != victim: #pinned since the policy looked at it
+                        with self.latch:
+                            self.policy.admit(victim, evict_key)
+                        continue
+
+                    owner, evict_page_slot, evict_column = evict_key
+                    pages = [None] * (evict_column + 1)
+                    pages[evict_column] = self.page_map[victim]
+                    written = self.__write_dirty__(owner, evict_page_slot, pages) #through the disk of the table owning the frame, clean victims cost nothing
+                    if stats.enabled:
+                        stats.count(owner, "evictions")
+                        stats.count(owner, "dirty_evictions" if written else "clean_evictions")
+                    with self.latch:
+                        del self.frame_map[evict_key] #need to remove the key from the map to prevent an access from happening again
+                        del self.slot_map[victim]
+                        self.frame_counts[owner] -= 1
+                    return victim
+                finally:
+                    stripe.release()
+        finally:
+            if len(skipped) != 0:
+                with self.latch:
+                    for frame_num, key in skipped.items():
+                        self.policy.admit(frame_num, key)
 
-        evicted_key = self.frame_map[evict_page_slot]
-        del self.frame_map[evict_page_slot] #need to remove the key from the map to prevent an access from happening again
-        return evicted_key
+        raise Exception("buffer pool is full and every frame " + name + " can take is pinned")
@@ -0,0 +1,62 @@
+from collections import OrderedDict
+import threading
+
+ENTRY_OVERHEAD = 120 #bytes of an entry besides its values: the dict slot, the key and the list object
+
+"""
+# Latest version cache of a table, base rid -> values of the newest version of every data column
+# A hit answers a point read without the buffer pool: no page of the base or tail range is fetched or pinned. The values
+# are the stored ones (string columns hold their codes), the reader projects and decodes them.
+# Updates put the values of the tail record they write, rollbacks and deletes drop the entry and a read of every column
+# fills a missing one, unless an update of the record hasn't pointed its base record at the tail yet (the read would find
+# the version before it). The table does all three under the tail latch of the base range (see Table.__read__).
+# Entries are evicted least recently used first once they take more than the byte budget
+"""
+class LatestVersionCache():
+    def __init__(self, num_columns, budget):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.capacity = max(1, budget // (ENTRY_OVERHEAD + 8 * num_columns)) #entries of the budget, they all have the same size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, rid):
+        with self.lock:
+            values = self.entries.get(rid)
+            if values is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(rid)
+            self.hits += 1
+            return values
+
+    #newest values of the record, replacing the cached ones
+    def put(self, rid, values):
+        with self.lock:
+            self.entries[rid] = values
+            self.entries.move_to_end(rid)
+            self.__evict__()
+
+    #values a read found, only kept if no update put newer ones meanwhile
+    def fill(self, rid, values):
+        with self.lock:
+            if rid not in self.entries:
+                self.entries[rid] = values
+                self.__evict__()
+
+    def discard(self, rid):
+        with self.lock:
+            self.entries.pop(rid, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __evict__(self):
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last = False)
+            self.evictions += 1
+
+    def stats(self):
+        return {"entries": len(self.entries), "capacity": self.capacity, "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
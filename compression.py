@@ -0,0 +1,85 @@
+import lstore.config
+
+"""
+# Compression of cold column pages
+# A page is stored as its tps word followed by the values of its records, encoded with whichever scheme is smallest:
+#   FOR: frame of reference, every value minus the smallest one bit packed at the width of the largest difference
+#   DELTA: the first value then the differences between neighbours as FOR, small for keys that grow steadily
+#   RLE: (value, run length) pairs, for columns that repeat the same value
+# The first byte of an encoded page is the scheme, values are unsigned 64 bit words as Page stores them
+"""
+FOR = 1
+DELTA = 2
+RLE = 3
+
+#frame of reference: minimum (signed, deltas can be negative), bit width, count, then the packed differences
+def encode_for(values):
+    minimum = min(values) if len(values) != 0 else 0
+    width = (max(values) - minimum).bit_length() if len(values) != 0 else 0
+    packed = 0
+    for index, value in enumerate(values):
+        packed |= (value - minimum) << (index * width)
+    return minimum.to_bytes(9, "big", signed = True) + width.to_bytes(1, "big") + len(values).to_bytes(2, "big") + packed.to_bytes((width * len(values) + 7) // 8, "little")
+
+#returns the values and the number of bytes they took
+def decode_for(blob, position = 0):
+    minimum = int.from_bytes(blob[position : position + 9], "big", signed = True)
+    width = blob[position + 9]
+    count = int.from_bytes(blob[position + 10 : position + 12], "big")
+    length = (width * count + 7) // 8
+    packed = int.from_bytes(blob[position + 12 : position + 12 + length], "little")
+    mask = (1 << width) - 1
+    return [minimum + ((packed >> (index * width)) & mask) for index in range(count)], 12 + length
+
+def encode_delta(values):
+    if len(values) == 0:
+        return encode_for(values)
+    return values[0].to_bytes(8, "big") + encode_for([values[index] - values[index - 1] for index in range(1, len(values))])
+
+def decode_delta(blob, position = 0):
+    value = int.from_bytes(blob[position : position + 8], "big")
+    deltas, length = decode_for(blob, position + 8)
+    values = [value]
+    for delta in deltas:
+        value += delta
+        values.append(value)
+    return values, 8 + length
+
+def encode_rle(values):
+    runs = []
+    for value in values:
+        if len(runs) != 0 and runs[-1][0] == value:
+            runs[-1][1] += 1
+        else:
+            runs.append([value, 1])
+    return len(runs).to_bytes(2, "big") + b"".join(value.to_bytes(8, "big") + length.to_bytes(2, "big") for value, length in runs)
+
+def decode_rle(blob, position = 0):
+    count = int.from_bytes(blob[position : position + 2], "big")
+    values = []
+    for run in range(count):
+        start = position + 2 + run * 10
+        values.extend([int.from_bytes(blob[start : start + 8], "big")] * int.from_bytes(blob[start + 8 : start + 10], "big"))
+    return values, 2 + 10 * count
+
+Encoders = {FOR: encode_for, DELTA: encode_delta, RLE: encode_rle}
+Decoders = {FOR: decode_for, DELTA: decode_delta, RLE: decode_rle}
+
+#encoded page data holding num_records words (the tps included), None if it wouldn't save at least half of the page
+def compress_page(data, num_records):
+    words = [int.from_bytes(data[slot * 8 : (slot + 1) * 8], "big") for slot in range(num_records)]
+    best = None
+    for scheme, encode in Encoders.items():
+        blob = bytes([scheme]) + words[0].to_bytes(8, "big") + encode(words[1:])
+        if best is None or len(blob) < len(best):
+            best = blob
+    return best if len(best) <= lstore.config.PageLength // 2 else None
+
+#page data rebuilt from compress_page, slots past the records are zero
+def decompress_page(blob):
+    values, length = Decoders[blob[0]](blob, 9)
+    data = bytearray(lstore.config.PageLength)
+    data[0 : 8] = blob[1 : 9]
+    for slot, value in enumerate(values, 1):
+        data[slot * 8 : (slot + 1) * 8] = value.to_bytes(8, "big")
+    return data
@@ -10,4 +10,67 @@ buffersize = 100
 DBName = ""
 #Increment buffersize from 1-10, by 1 increments. Default 3
 TailMergeLimit = 3
-merge_thread = -1
\ No newline at end of file
+#maximum number of column files kept open at once across all tables
+MaxOpenFiles = 256
+#storage layout of new tables, "column" keeps a file per column and "segment" keeps whole ranges together in one file
+DefaultLayout = "column"
+#map the storage files and buffer pages as views of the mapping instead of copies
+MmapStorage = False
+#group commit: the leader of a commit group waits at most this many seconds for LogBatchSize log records before the fsync
+LogFlushInterval = 0.002
+LogBatchSize = 64
+#seconds between two background fuzzy checkpoints, 0 turns them off
+CheckpointInterval = 5
+#checkpoints whose page directory deltas are appended before the full directory is rewritten
+CheckpointCompaction = 8
+#replacement policy of the buffer pool: "LFU" (baseline), "CLOCK", "LRU-K" or "2Q"
+EvictionPolicy = "CLOCK"
+
+#number of latches the buffer pool stripes its page slots over
+BufferStripes = 64
+
+#frame quotas of the shared buffer pool per table name, (minimum, maximum) with None for no maximum
+#other tables can't evict a table below its minimum and a table at its maximum evicts its own frames
+BufferQuotas = {}
+
+#background writer of the buffer pool: seconds between rounds (0 disables it), most ranges written per round and
+#number of free or clean frames it keeps so misses rarely write back a victim themselves
+WriterInterval = 0.05
+WriterBatch = 16
+CleanFrames = 8
+
+#collect buffer pool and disk io statistics (Database.stats), off leaves only a flag test in the hooks
+CollectStats = True
+
+#frames of the buffer pool, each holds one column page. 0 for the pages of buffersize ranges of a five column table
+BufferPages = 0
+
+#store merged base data pages compressed in the column layout (frame of reference, delta or RLE, see compression.py)
+CompressColdPages = True
+
+#partitions of a table's lock table, each has its own latch and condition variable
+LockPartitions = 64
+#deadlock avoidance of the lock tables: "no-wait", "wait-die" or "wound-wait" (see lock.py)
+LockPolicy = "no-wait"
+#most seconds a conflicting lock request the policy lets wait is blocked before it fails
+LockTimeout = 0.05
+
+#runs TransactionWorker gives a transaction aborted by a lock conflict, 1 never restarts it
+TransactionAttempts = 5
+#backoff before restart n is random up to RetryBackoff * 2 ** (n - 1) seconds, at most RetryBackoffMax
+RetryBackoff = 0.001
+RetryBackoffMax = 0.05
+
+#concurrency control of transactions that don't choose one: "2pl" (locking), "occ" (optimistic, see occ.py) or
+#"snapshot" (reads of the versions visible at the start without locks, see mvcc.py)
+Concurrency = "2pl"
+#record locks a transaction takes in one base range before its next one locks the whole range instead
+LockEscalation = 32
+#merge daemon (see merge.py): seconds between two looks at the merge queues when no update wakes it, fraction of its
+#time it may spend merging and tail chain length from which it merges without resting
+MergeInterval = 0.1
+MergeDutyCycle = 0.5
+MergeChainLimit = 6
+#bytes of the latest version cache of each table, newest values of recently read or updated records by base rid
+#point reads of cached records skip the buffer pool. 0 turns it off (see cache.py)
+LatestCacheBytes = 0
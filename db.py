@@ -2,15 +2,31 @@ from lstore.table import *
 from lstore.disk import *
 from lstore.buffer import *
 from lstore.page import Page
+from lstore.logger import Logger
+from lstore.merge import MergeDaemon
+from lstore.cache import LatestVersionCache
+from lstore.stats import stats
+from lstore.lock import Lock_policies
+from lstore.occ import Concurrency_modes
 import lstore.config
 import lstore.table
 import math
 import os
+import threading
 
 class Database():
     def __init__(self):
         self.tables = []
         self.buffer_pool = Bufferpool(self)
+        self.logger = None
+        self.checkpointer = None
+        self.checkpoint_lock = threading.Lock()
+        self.stop_checkpoints = threading.Event()
+        self.checkpoints = 0
+        self.merger = MergeDaemon(self)
+        self.lock_policy = lstore.config.LockPolicy
+        self.concurrency = lstore.config.Concurrency
+        self.cache_budget = lstore.config.LatestCacheBytes
         pass
 
     def open(self, db_name):
@@ -24,35 +40,206 @@ class Database():
                 table_name = name
                 table = Table(table_name, 0, 0, self.buffer_pool)
                 table.page_directory = read_page_directory(table.name)
-                table.key, table.num_columns, table.base_RID, table.tail_RID, table.base_offset_counter, table.tail_offset_counter = lstore.table.read_counters(table.name)
-                table.disk = Disk(table.name, table.num_columns)
+                table.directory_deltas = len(read_page_directory_deltas(table.name))
+                counters = lstore.table.read_counters(table.name)
+                table.key, table.num_columns, table.base_RID, table.tail_RID, table.base_offset_counter, table.tail_offset_counter = counters[:6]
+                table.layout = Layout_names[counters[6]] if len(counters) > 6 else "column" #databases written before segments existed are column files
+                table.disk = open_disk(table.name, table.num_columns, table.layout)
+                read_tail_directory(table)
+                table.set_types([Column_types[column_type] for column_type in counters[7:]] if len(counters) > 7 else [INTEGER] * table.num_columns)
+                table.dictionary = Dictionary(table.name)
+                table.lock_manager.policy = self.lock_policy
+                table.concurrency = self.concurrency
                 self.tables.append(table)
 
+        self.logger = Logger(path_name)
+        if self.logger.recover(self) != 0: #a crash left work in the log, store the recovered state before dropping it
+            self.__flush__()
+            self.logger.truncate()
+        for table in self.tables:
+            table.logger = self.logger
+            self.__attach_cache__(table) #recovery writes records behind the cache's back, it starts empty
+            table.merger = self.merger #merges the recovery queued start now, redo never runs along one
+            if not table.merge_queue.empty():
+                self.merger.wake()
+
+        self.buffer_pool.start_writer()
+        if lstore.config.CheckpointInterval > 0:
+            self.stop_checkpoints.clear()
+            self.checkpointer = threading.Thread(name = "checkpointer", target = self.__checkpoint_loop__, daemon = True)
+            self.checkpointer.start()
+
     def close(self):
+        if self.checkpointer is not None:
+            self.stop_checkpoints.set()
+            self.checkpointer.join()
+            self.checkpointer = None
+        self.merger.stop()
+        self.buffer_pool.stop_writer()
+        self.__flush__()
+        for table in self.tables:
+            table.disk.close()
+        if self.logger is not None:
+            self.logger.close() #everything in the log is now in the table files
+            self.logger = None
+
+    #write the counters, page directory and buffered pages of every table, the log is forced first (WAL rule)
+    def __flush__(self):
+        if self.logger is not None:
+            self.logger.flush()
         for table in self.tables:
             write_page_directory(table.name, table.page_directory) #write page_directory to file
-            write_counters(table.name, [table.key, table.num_columns, table.base_RID, table.tail_RID, table.base_offset_counter, table.tail_offset_counter])
+            write_tail_directory(table)
+            table.directory_deltas = 0
+            self.__write_counters__(table)
+            table.dictionary.save()
 
-            #write pages to disk only if dirty
-            for page_index in self.buffer_pool.frame_map.keys():
-                for column_index in range(table.num_columns + lstore.config.Offset):
-                    frame_num = self.buffer_pool.frame_map[page_index]
-                    page_to_write = self.buffer_pool.page_map[frame_num][column_index]
-                    table.disk.write(table.name, column_index, page_index, page_to_write)
+            self.__flush_frames__(table, True) #clean pages are the same as on disk
+            table.disk.flush()
+
+    #write back the buffered ranges, only the ones with a dirty page if dirty_only is set. Returns True if unpinned_only
+    #left out a dirty pinned page
+    def __flush_frames__(self, table, dirty_only, unpinned_only = False):
+        return self.buffer_pool.write_back(table.name, dirty_only, unpinned_only) #each range is written under its buffer latch
+
+    """
+    # Fuzzy checkpoint, transactions keep running while it happens
+    # Unpinned dirty frames are written back and only the page directory entries changed since the last checkpoint are appended
+    # to the delta file, which is folded back into the full directory every CheckpointCompaction checkpoints.
+    # The log is then cut at the checkpoint so recovery only replays what happened after it, unless a dirty pinned frame
+    # was left out, the next checkpoint cuts it then
+    """
+    def checkpoint(self):
+        with self.checkpoint_lock:
+            if self.logger is None:
+                return
+            redo_lsn = self.logger.last_lsn() #everything logged up to here is in the buffer pool
+            self.logger.flush()
+            skipped = False
+            for table in list(self.tables):
+                #pages first. Pinned pages may be mid change and are left out
+                skipped = self.__flush_frames__(table, True, True) or skipped
+                table.disk.flush()
+                #taken after the pages: a record logged before redo_lsn sets its entry while its range is pinned, so the entry is
+                #either in the delta or its page was left out and the log is kept. Entries of later records are redone anyway
+                delta = table.page_directory.take_changes() #chunks changed meanwhile stay for the next checkpoint
+                if table.directory_deltas >= lstore.config.CheckpointCompaction:
+                    write_page_directory(table.name, table.page_directory)
+                    table.directory_deltas = 0
+                elif len(delta) != 0:
+                    append_page_directory_delta(table.name, delta)
+                    table.directory_deltas += 1
+                self.__write_counters__(table)
+                write_tail_directory(table) #holds every range allocated before redo_lsn, redo places the others again
+                table.dictionary.save() #the codes logged before redo_lsn are dropped from the log next
+            if not skipped: #otherwise redo still needs the log to rebuild the pages that were left out
+                self.logger.truncate_before(redo_lsn + 1)
+            self.checkpoints += 1
+
+    def __checkpoint_loop__(self):
+        while not self.stop_checkpoints.wait(lstore.config.CheckpointInterval):
+            self.checkpoint()
+    def __write_counters__(self, table):
+        write_counters(table.name, [table.key, table.num_columns, table.base_RID, table.tail_RID, table.base_offset_counter, table.tail_offset_counter, Layout_names.index(table.layout)] + [Column_types.index(column_type) for column_type in table.types])
+
+    #keep at least min_frames of the shared buffer pool for the table and at most max_frames (None for no limit)
+    def set_buffer_quota(self, name, min_frames = 0, max_frames = None):
+        self.buffer_pool.set_quota(name, min_frames, max_frames)
+
+    #deadlock avoidance of every table: "no-wait", "wait-die" or "wound-wait"
+    def set_lock_policy(self, policy):
+        if policy not in Lock_policies:
+            raise ValueError("unknown lock policy " + str(policy))
+        self.lock_policy = policy
+        for table in self.tables:
+            table.lock_manager.policy = policy
+
+    #bytes of the latest version cache of every table, 0 turns the caches off
+    def set_cache_budget(self, budget):
+        self.cache_budget = budget
+        for table in self.tables:
+            self.__attach_cache__(table)
+
+    def __attach_cache__(self, table):
+        table.latest = LatestVersionCache(table.num_columns, self.cache_budget) if self.cache_budget > 0 else None
+
+    #concurrency control of the transactions that don't choose one: "2pl", "occ" or "snapshot"
+    def set_concurrency(self, mode):
+        if mode not in Concurrency_modes:
+            raise ValueError("unknown concurrency control " + str(mode))
+        self.concurrency = mode
+        for table in self.tables:
+            table.concurrency = mode
+
+    #descriptor pool statistics shared by every table's disk
+    def disk_stats(self):
+        return disk_stats()
+
+    """
+    # Buffer pool and disk io statistics since the last reset_stats
+    # tables: per table hits, misses, pin_wait (seconds waited on buffer latches), evictions (dirty and clean),
+    #         dirty_writebacks, pages_written and background_writebacks
+    # files: bytes read and written per table file, pages of mmap tables are read and written without any syscall
+    # latency: histograms of the fetch_page and write calls (fetch_range and write_range for segments)
+    # locks: per table lock table entries, lock owners, conflicting requests and waits
+    # merge: merge daemon queue depth, merges done, deferred and failed (with the last failure), duplicate requests, seconds
+    #        throttled and merge latency histogram
+    # cache: per table latest version cache entries, capacity, hits, misses and evictions
+    """
+    def stats(self):
+        snapshot = stats.snapshot()
+        snapshot["buffer"] = {"size": self.buffer_pool.size, "hit_ratio": self.buffer_pool.hit_ratio(), "frames": self.buffer_pool.frames()}
+        snapshot["file_pool"] = disk_stats()
+        snapshot["locks"] = dict((table.name, table.lock_manager.stats()) for table in self.tables)
+        snapshot["merge"] = self.merger.stats()
+        snapshot["cache"] = dict((table.name, table.latest.stats()) for table in self.tables if table.latest is not None)
+        if self.logger is not None:
+            snapshot["log"] = self.logger.stats()
+        return snapshot
+
+    def reset_stats(self):
+        stats.reset()
+
+    #turn statistics collection on or off, off leaves only a flag test in the hooks
+    def collect_stats(self, enabled):
+        stats.enabled = enabled
 
 
     """
     # Creates a new table
     :param name: string         #Table name
-    :param num_columns: int     #Number of Columns: all columns are integer
+    :param num_columns: int     #Number of Columns
     :param key: int             #Index of table key in columns
+    :param layout: string       #Storage layout, "column" for a file per column or "segment" for a file of whole ranges
+    :param types: list          #Type of every column, INTEGER (the default) or STRING (stored as dictionary codes)
     """
-    def create_table(self, name, num_columns, key):
+    def create_table(self, name, num_columns, key, layout = lstore.config.DefaultLayout, types = None):
+        types = [INTEGER] * num_columns if types is None else list(types)
+        if len(types) != num_columns or any(column_type not in Column_types for column_type in types):
+            raise ValueError("schema needs one of " + str(Column_types) + " for each of the " + str(num_columns) + " columns")
         table = Table(name, num_columns, key, self.buffer_pool)
-        table.disk = Disk(table.name, table.num_columns)
+        table.layout = layout
+        table.set_types(types)
+        table.disk = open_disk(table.name, table.num_columns, table.layout)
+        table.dictionary = Dictionary(table.name)
+        table.lock_manager.policy = self.lock_policy
+        table.concurrency = self.concurrency
+        table.logger = self.logger
+        table.merger = self.merger
+        self.__attach_cache__(table)
+        self.__write_counters__(table) #a table survives a crash before the first close
         self.tables.append(table)
         return table
 
+    """
+    # Moves the stored ranges of a table to another storage layout, buffered frames stay valid
+    """
+    def migrate_table(self, name, layout):
+        table = self.get_table(name)
+        last_offset = max(table.base_offset_counter, table.tail_offset_counter)
+        table.disk = migrate_disk(table.disk, layout, last_offset)
+        table.layout = layout
+
     """
     # Deletes the specified table
     """
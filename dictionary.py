@@ -0,0 +1,82 @@
+import lstore.config
+import os
+import threading
+
+NULL_CODE = 0 #code of a string cell never written, real strings get codes from 1
+
+"""
+# String dictionary of a table, every distinct string value gets a dense integer code
+# Pages store the code, so string columns are plain int64 columns for the page, the index and scans: equal strings
+# have equal codes. Codes are handed out in arrival order and never reused, the file is an append only list of
+# (length, utf-8 bytes) entries and the code of an entry is its position in the file.
+# New codes are logged before the records using them, save() is called by every flush and checkpoint
+"""
+class Dictionary():
+    def __init__(self, name):
+        self.file_name = os.getcwd() + lstore.config.DBName + "/" + name + "/dictionary"
+        self.values = [None] #code -> string
+        self.codes = {} #string -> code
+        self.saved = 1 #codes below this one are in the file
+        self.lock = threading.Lock()
+        if os.path.exists(self.file_name):
+            self.__load__()
+
+    def __load__(self):
+        with open(self.file_name, "rb") as file:
+            data = file.read()
+        position = 0
+        while position + 4 <= len(data):
+            length = int.from_bytes(data[position : position + 4], "big")
+            if position + 4 + length > len(data): #torn append, the log still holds the entry
+                break
+            self.__assign__(data[position + 4 : position + 4 + length].decode("utf-8"))
+            position += 4 + length
+        self.saved = len(self.values)
+
+    def __assign__(self, value):
+        self.values.append(value) #readers find the code without the lock, the value must be there first
+        self.codes[value] = len(self.values) - 1
+        return len(self.values) - 1
+
+    def __len__(self):
+        return len(self.values) - 1
+
+    #code of the value, a new one is assigned (and returned as the second item) the first time a value is seen
+    def encode(self, value):
+        code = self.codes.get(value)
+        if code is not None:
+            return code, False
+        with self.lock:
+            code = self.codes.get(value)
+            if code is not None:
+                return code, False
+            return self.__assign__(value), True
+
+    #code of the value if it was ever stored, None otherwise (no record can hold it)
+    def lookup(self, value):
+        return self.codes.get(value)
+
+    def decode(self, code):
+        return self.values[code] if NULL_CODE < code < len(self.values) else None
+
+    #place a code again during recovery, entries already loaded from the file are skipped
+    def restore(self, code, value):
+        with self.lock:
+            while len(self.values) <= code:
+                self.values.append(None)
+            self.values[code] = value
+            self.codes[value] = code
+
+    #append the codes assigned since the last save
+    def save(self):
+        with self.lock:
+            pending = self.values[self.saved:]
+            if len(pending) == 0:
+                return
+            with open(self.file_name, "ab") as file:
+                for value in pending:
+                    encoded = value.encode("utf-8")
+                    file.write(len(encoded).to_bytes(4, "big") + encoded)
+                file.flush()
+                os.fsync(file.fileno())
+            self.saved = len(self.values)
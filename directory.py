@@ -0,0 +1,266 @@
+import lstore.config
+from array import array
+import os
+import sys
+import threading
+
+MAGIC = b"LSPDIR" #page directory file header, followed by the byte order and the array lengths
+EMPTY = -1 #entry of a rid that has no record (yet)
+SLOT_BITS = 16 #low bits of an entry hold the slot, the rest the range offset
+CHUNK_ENTRIES = 1024 #entries per chunk, checkpoints track and write the changed entries a chunk at a time
+
+"""
+# Page directory of a table, RID -> (range offset, slot)
+# Base RIDs count up from StartBaseRID and tail RIDs count down from StartTailRID, so both are dense: each side is a
+# growable int64 array indexed by the distance of the rid from its start, with offset and slot packed into one word.
+# That is 8 bytes per record instead of a dict entry and a tuple, and the arrays are saved and loaded as raw bytes.
+# Changes are tracked per chunk of CHUNK_ENTRIES entries of either array, a set of chunk indexes stays small however
+# many records a bulk load or a long run between checkpoints touches
+"""
+class PageDirectory():
+    def __init__(self):
+        self.base = array('q')
+        self.tail = array('q')
+        self.count = 0
+        self.changed = (set(), set()) #indexes of the base and tail chunks changed since the last checkpoint took them
+        self.lock = threading.Lock()
+
+    #array and index holding the entry of a rid
+    def __locate__(self, rid):
+        if rid >= lstore.config.StartBaseRID and rid < lstore.config.StartTailRID // 2:
+            return self.base, rid - lstore.config.StartBaseRID
+        return self.tail, lstore.config.StartTailRID - rid
+
+    def __mark__(self, entries, first, last): #called with the lock held
+        self.changed[0 if entries is self.base else 1].update(range(first // CHUNK_ENTRIES, last // CHUNK_ENTRIES + 1))
+
+    #rid of the entry at index of one of the arrays
+    def __rid__(self, entries, index):
+        return index + lstore.config.StartBaseRID if entries is self.base else lstore.config.StartTailRID - index
+
+    def __grow__(self, entries, index):
+        missing = max(index + 1, 2 * len(entries)) - len(entries) #doubling keeps appends amortized O(1)
+        entries.extend(array('q', [EMPTY]) * missing)
+
+    def __getitem__(self, rid):
+        entries, index = self.__locate__(rid)
+        entry = entries[index] if 0 <= index < len(entries) else EMPTY
+        if entry == EMPTY:
+            raise KeyError(rid)
+        return entry >> SLOT_BITS, entry & ((1 << SLOT_BITS) - 1)
+
+    #slots of a batch of base rids that all have an entry
+    def slots(self, rids):
+        mask = (1 << SLOT_BITS) - 1
+        entries, start = self.base, lstore.config.StartBaseRID
+        return [entries[rid - start] & mask for rid in rids]
+
+    def __setitem__(self, rid, location):
+        offset, slot = location
+        entries, index = self.__locate__(rid)
+        with self.lock:
+            if index >= len(entries):
+                self.__grow__(entries, index)
+            if entries[index] == EMPTY:
+                self.count += 1
+            entries[index] = (offset << SLOT_BITS) | slot
+            self.__mark__(entries, index, index)
+
+    #entries of count consecutive base rids placed in consecutive slots of one range, set in one slice
+    def set_range(self, first_rid, offset, first_slot, count):
+        entries, index = self.__locate__(first_rid)
+        packed = (offset << SLOT_BITS) | first_slot
+        with self.lock:
+            if index + count > len(entries):
+                self.__grow__(entries, index + count - 1)
+            self.count += entries[index : index + count].count(EMPTY)
+            entries[index : index + count] = array('q', range(packed, packed + count))
+            self.__mark__(entries, index, index + count - 1)
+
+    def __delitem__(self, rid):
+        entries, index = self.__locate__(rid)
+        with self.lock:
+            if 0 <= index < len(entries) and entries[index] != EMPTY:
+                entries[index] = EMPTY
+                self.count -= 1
+                self.__mark__(entries, index, index)
+
+    def __contains__(self, rid):
+        entries, index = self.__locate__(rid)
+        return 0 <= index < len(entries) and entries[index] != EMPTY
+
+    def __len__(self):
+        return self.count
+
+    def get(self, rid, default = None):
+        return self[rid] if rid in self else default
+
+    def items(self):
+        for index, entry in enumerate(self.base):
+            if entry != EMPTY:
+                yield index + lstore.config.StartBaseRID, (entry >> SLOT_BITS, entry & ((1 << SLOT_BITS) - 1))
+        for index, entry in enumerate(self.tail):
+            if entry != EMPTY:
+                yield lstore.config.StartTailRID - index, (entry >> SLOT_BITS, entry & ((1 << SLOT_BITS) - 1))
+
+    def update(self, entries):
+        for rid, location in entries.items():
+            self[rid] = location
+
+    """
+    # Entries of every chunk changed since the last call, chunks changed meanwhile stay for the next one. Each chunk is a
+    # run: -count, the rid of its first entry, then its count packed entries in array order (tail rids count down)
+    """
+    def take_changes(self):
+        delta = array('q')
+        with self.lock:
+            changed = self.changed
+            self.changed = (set(), set())
+            for entries, chunks in zip((self.base, self.tail), changed):
+                for chunk in sorted(chunks):
+                    run = entries[chunk * CHUNK_ENTRIES : (chunk + 1) * CHUNK_ENTRIES]
+                    if len(run) != 0:
+                        delta.append(-len(run))
+                        delta.append(self.__rid__(entries, chunk * CHUNK_ENTRIES))
+                        delta.extend(run)
+        return delta
+
+    #apply a delta written by take_changes, or the (rid, packed entry) pairs written before the chunks
+    def apply_changes(self, delta):
+        position = 0
+        while position < len(delta):
+            if delta[position] < 0:
+                count = -delta[position]
+                self.__apply_run__(delta[position + 1], delta[position + 2 : position + 2 + count])
+                position += 2 + count
+                continue
+            rid, entry = delta[position], delta[position + 1]
+            if entry == EMPTY:
+                del self[rid]
+            else:
+                self[rid] = (entry >> SLOT_BITS, entry & ((1 << SLOT_BITS) - 1))
+            position += 2
+
+    def __apply_run__(self, first_rid, run):
+        entries, index = self.__locate__(first_rid)
+        with self.lock:
+            if index + len(run) > len(entries):
+                self.__grow__(entries, index + len(run) - 1)
+            old = entries[index : index + len(run)]
+            self.count += old.count(EMPTY) - run.count(EMPTY)
+            entries[index : index + len(run)] = run
+            self.__mark__(entries, index, index + len(run) - 1)
+
+    #header then the raw base and tail arrays, the file can be read (or mapped) straight into the arrays
+    def save(self, file_name):
+        with self.lock:
+            base_length, tail_length = self.__used__(self.base), self.__used__(self.tail)
+            with open(file_name + ".tmp", "wb") as file:
+                file.write(MAGIC + (b"L" if sys.byteorder == "little" else b"B") + b"\0")
+                file.write(base_length.to_bytes(8, "big") + tail_length.to_bytes(8, "big"))
+                file.write(memoryview(self.base)[:base_length])
+                file.write(memoryview(self.tail)[:tail_length])
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(file_name + ".tmp", file_name)
+            self.changed = (set(), set())
+
+    #length of the array without the unused tail of the last growth
+    def __used__(self, entries):
+        length = len(entries)
+        while length > 0 and entries[length - 1] == EMPTY:
+            length -= 1
+        return length
+
+    @staticmethod
+    def load(file_name):
+        page_directory = PageDirectory()
+        with open(file_name, "rb") as file:
+            header = file.read(24)
+            if header[:6] != MAGIC:
+                raise ValueError(file_name + " is not a page directory file")
+            base_length = int.from_bytes(header[8:16], "big")
+            tail_length = int.from_bytes(header[16:24], "big")
+            page_directory.base.frombytes(file.read(8 * base_length))
+            page_directory.tail.frombytes(file.read(8 * tail_length))
+        if header[6:7] != (b"L" if sys.byteorder == "little" else b"B"): #written on a machine of the other byte order
+            page_directory.base.byteswap()
+            page_directory.tail.byteswap()
+        page_directory.count = len(page_directory.base) - page_directory.base.count(EMPTY) + len(page_directory.tail) - page_directory.tail.count(EMPTY)
+        return page_directory
+
+TAIL_MAGIC = b"LSTAIL" #tail directory file header, followed by the byte order
+
+"""
+# Tail chains of a table, base range offset -> offsets of its tail ranges, oldest first
+# The last range of a chain is the one updates append to. Ranges are appended under the tail latch of their base
+# range and a merge drops the ranges it consolidated from the front, so a chain only changes under that latch.
+# It stands in for the next range pointers at the front of every range on disk, which are still written: a database
+# saved without the directory rebuilds it from them. Saved as (base offset, length, tail offsets...) int64 words
+"""
+class TailDirectory():
+    def __init__(self):
+        self.chains = {} #base offset -> tail range offsets
+        self.owners = {} #tail range offset -> base offset
+
+    def chain(self, base_offset):
+        return self.chains.get(base_offset, ())
+
+    #range updates of the base range append to, the base range itself while it has no tail range
+    def current(self, base_offset):
+        chain = self.chains.get(base_offset)
+        return chain[-1] if chain else base_offset
+
+    #base range of a range, a base range is its own
+    def owner(self, offset):
+        return self.owners.get(offset, offset)
+
+    def append(self, base_offset, tail_offset):
+        if tail_offset in self.owners: #placed again by redo
+            return
+        self.owners[tail_offset] = base_offset
+        self.chains[base_offset] = list(self.chain(base_offset)) + [tail_offset] #readers without the latch keep the list they got
+
+    #the merge consolidated the first count ranges of the chain
+    def drop(self, base_offset, count):
+        chain = self.chains.get(base_offset, [])
+        for tail_offset in chain[:count]:
+            self.owners.pop(tail_offset, None)
+        self.chains[base_offset] = chain[count:]
+
+    #whether a tail range is chained to a base range
+    def __contains__(self, tail_offset):
+        return tail_offset in self.owners
+
+    def __len__(self):
+        return len(self.chains)
+
+    def save(self, file_name):
+        words = array('q')
+        for base_offset, chain in list(self.chains.items()):
+            words.extend([base_offset, len(chain)] + list(chain))
+        with open(file_name + ".tmp", "wb") as file:
+            file.write(TAIL_MAGIC + (b"L" if sys.byteorder == "little" else b"B") + b"\0")
+            file.write(memoryview(words))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(file_name + ".tmp", file_name)
+
+    @staticmethod
+    def load(file_name):
+        tail_directory = TailDirectory()
+        with open(file_name, "rb") as file:
+            header = file.read(8)
+            if header[:6] != TAIL_MAGIC:
+                raise ValueError(file_name + " is not a tail directory file")
+            words = array('q')
+            words.frombytes(file.read())
+        if header[6:7] != (b"L" if sys.byteorder == "little" else b"B"):
+            words.byteswap()
+        position = 0
+        while position + 2 <= len(words):
+            base_offset, length = words[position], words[position + 1]
+            for tail_offset in words[position + 2 : position + 2 + length]:
+                tail_directory.append(base_offset, tail_offset)
+            position += 2 + length
+        return tail_directory
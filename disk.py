@@ -1,64 +1,509 @@
 from lstore.page import *
+from lstore.compression import compress_page, decompress_page
+from array import array
 from time import time
 import lstore.config
+from lstore.stats import stats, timed
+from collections import OrderedDict
 from pathlib import Path
+import math
+import mmap
 import os
 import sys
 import pickle
 import threading
 
+#bounded pool of open descriptors shared by every table, one descriptor per (table, column) file
+#descriptors are opened lazily and the least recently used idle one is closed when the pool is full
+class FilePool():
+    def __init__(self, max_open):
+        self.max_open = max_open
+        self.files = OrderedDict() # path to [fd, users]
+        self.lock = threading.Lock()
+        self.opens = 0
+        self.hits = 0
+        self.closes = 0
+
+    #return an open descriptor for the path, the caller must release it once the io is done
+    def acquire(self, path_name):
+        with self.lock:
+            entry = self.files.get(path_name)
+            if entry is not None:
+                self.hits += 1
+                self.files.move_to_end(path_name)
+            else:
+                if len(self.files) >= self.max_open:
+                    self.__close_idle__()
+                entry = [os.open(path_name, os.O_RDWR | os.O_CREAT, 0o644), 0]
+                self.files[path_name] = entry
+                self.opens += 1
+            entry[1] += 1
+            return entry[0]
+
+    def release(self, path_name):
+        with self.lock:
+            self.files[path_name][1] -= 1
+
+    #close the least recently used descriptor that is not in the middle of an io, can go over max_open if all are busy
+    def __close_idle__(self):
+        for path_name, (fd, users) in self.files.items():
+            if users == 0:
+                os.close(fd)
+                del self.files[path_name]
+                self.closes += 1
+                return
+
+    #close every idle descriptor under the directory, used when a table is closed
+    def close(self, prefix = ""):
+        with self.lock:
+            for path_name in list(self.files.keys()):
+                fd, users = self.files[path_name]
+                if path_name.startswith(prefix) and users == 0:
+                    os.close(fd)
+                    del self.files[path_name]
+                    self.closes += 1
+
+    #fsync every open descriptor under the directory
+    def sync(self, prefix = ""):
+        with self.lock:
+            for path_name, (fd, users) in self.files.items():
+                if path_name.startswith(prefix):
+                    os.fsync(fd)
+
+    def stats(self):
+        with self.lock:
+            return {"open": len(self.files), "max_open": self.max_open, "opens": self.opens, "hits": self.hits, "closes": self.closes}
+
+file_pool = FilePool(lstore.config.MaxOpenFiles)
+
+#a storage file mapped in fixed size chunks, new chunks are mapped (and the file grown) as ranges are added past the end
+#chunks are a whole number of ranges and a multiple of the allocation granularity so no page view ever straddles two maps
+#a chunk is never remapped, pages keep pointing into it for as long as they are buffered
+class MappedFile():
+    def __init__(self, path_name, stride):
+        self.path_name = path_name
+        self.chunk_length = stride * (mmap.ALLOCATIONGRANULARITY // math.gcd(stride, mmap.ALLOCATIONGRANULARITY))
+        self.chunks = {} # chunk index to mmap
+        self.lock = threading.Lock()
+
+    #writable view of length bytes at position in the file
+    def view(self, position, length):
+        chunk_index = position // self.chunk_length
+        chunk = self.chunks.get(chunk_index)
+        if chunk is None:
+            with self.lock:
+                chunk = self.chunks.get(chunk_index)
+                if chunk is None:
+                    chunk = self.__map__(chunk_index)
+        start = position - chunk_index * self.chunk_length
+        return memoryview(chunk)[start : start + length]
+
+    def __map__(self, chunk_index):
+        fd = file_pool.acquire(self.path_name)
+        try:
+            end = (chunk_index + 1) * self.chunk_length
+            if os.fstat(fd).st_size < end: #grow the file so the whole chunk is backed, unwritten parts stay sparse
+                os.ftruncate(fd, end)
+            chunk = mmap.mmap(fd, self.chunk_length, offset = chunk_index * self.chunk_length)
+        finally:
+            file_pool.release(self.path_name)
+        self.chunks[chunk_index] = chunk
+        return chunk
+
+    #msync every mapped chunk
+    def flush(self):
+        for chunk in list(self.chunks.values()):
+            chunk.flush()
+
+    #unmap the chunks no page points into anymore, the rest are unmapped once their pages are dropped
+    def close(self):
+        self.flush()
+        for chunk_index in list(self.chunks.keys()):
+            try:
+                self.chunks[chunk_index].close()
+                del self.chunks[chunk_index]
+            except BufferError:
+                pass
+
+COMPRESSED = 1 << 31 #num records header flag of a compressed page, bits 16 to 30 hold the length of the compressed data
+
 class Disk():
-    def __init__(self, name, num_columns):
-        path_name = os.getcwd() + lstore.config.DBName + "/" + name
-        if not os.path.exists(path_name):
-            os.makedirs(path_name)
+    def __init__(self, name, num_columns, mapped = False):
+        self.name = name
+        self.num_columns = num_columns
+        self.mapped = mapped
+        self.maps = {} # file name to MappedFile, only used in mmap mode
+        self.path_name = os.getcwd() + lstore.config.DBName + "/" + name
+        if not os.path.exists(self.path_name):
+            os.makedirs(self.path_name)
+        self.cold = self.__read_cold__() # (column, offset) to compressed length, lets a fetch read only the compressed bytes
+        self.cold_changed = False
+        self.cold_lock = threading.Lock() #fetches, write backs and flushes of several threads update the lengths
 
         for column_index in range(num_columns + lstore.config.Offset):
-            filename = path_name + "/" + str(column_index) #name of the table / column number
+            filename = self.__file_name__(column_index) #name of the table / column number
             if not os.path.isfile(filename):
-                file = open(filename, 'wb')
                 empty_page = Page()
-                file.write((0).to_bytes(4, "big"))
-                file.write((empty_page.num_records).to_bytes(4, "big")) #this data is the number of records in the page
+                header = (0).to_bytes(4, "big") + (empty_page.num_records).to_bytes(4, "big") #tail pointer and the number of records in the page
+                self.__pwrite__(filename, header + empty_page.data, 0)
+
+    def __file_name__(self, column_index):
+        return self.path_name + "/" + str(column_index)
+
+    #the lengths are only a hint: the page header is what says a page is compressed, a stale entry costs a second read
+    def __read_cold__(self):
+        cold = {}
+        if os.path.isfile(self.path_name + "/cold"):
+            entries = array('q')
+            with open(self.path_name + "/cold", "rb") as file:
+                entries.frombytes(file.read())
+            for position in range(0, len(entries) - 2, 3):
+                cold[(entries[position], entries[position + 1])] = entries[position + 2]
+        return cold
+
+    def __write_cold__(self):
+        entries = array('q')
+        with self.cold_lock:
+            for (column_index, offset), length in self.cold.items():
+                entries.extend((column_index, offset, length))
+            self.cold_changed = False #a change made while the file is written sets it again
+        with open(self.path_name + "/cold.tmp", "wb") as file:
+            file.write(entries.tobytes())
+        os.replace(self.path_name + "/cold.tmp", self.path_name + "/cold")
+
+    #compressed data of a cold page, None for the pages stored whole
+    def __compress__(self, page):
+        if not lstore.config.CompressColdPages or not page.cold:
+            return None
+        blob = page.__dict__.get("blob") #still compressed as it was read
+        return blob if blob is not None else compress_page(page.data, page.num_records)
 
-                file.write(empty_page.data)
+    #file, position of the page data and position of the num records of a column page in the range at offset
+    def __page_location__(self, column_index, offset):
+        return self.__file_name__(column_index), offset + 8, offset + 4
+
+    #distance between two ranges in the file holding the column
+    def __stride__(self):
+        return lstore.config.FilePageLength
+
+    def __view__(self, path_name, position, length):
+        if path_name not in self.maps:
+            self.maps[path_name] = MappedFile(path_name, self.__stride__())
+        return self.maps[path_name].view(position, length)
+
+    #page whose data is a view into the mapped file, loading it copies nothing
+    def __mapped_page__(self, column_index, offset):
+        temp_page = Page()
+        path_name, data_position, count_position = self.__page_location__(column_index, offset)
+        num_records = int.from_bytes(self.__view__(path_name, count_position, 4), "big")
+        if num_records & COMPRESSED: #written by the column layout without mmap, expand it in place
+            data = self.__view__(path_name, data_position, lstore.config.PageLength)
+            data[:] = decompress_page(bytes(data[: (num_records >> 16) & 0x7fff]))
+            num_records &= 0xffff
+            self.__view__(path_name, count_position, 4)[:] = num_records.to_bytes(4, "big")
+        temp_page.num_records = num_records if num_records != 0 else temp_page.num_records
+        temp_page.data = self.__view__(path_name, data_position, lstore.config.PageLength)
+        return temp_page
+
+    #mapped pages already live in the file, only the num records header has to be stored
+    def __write_mapped__(self, column_index, offset, page_to_write):
+        path_name, data_position, count_position = self.__page_location__(column_index, offset)
+        self.__view__(path_name, count_position, 4)[:] = page_to_write.num_records.to_bytes(4, "big")
+        target = self.__view__(path_name, data_position, lstore.config.PageLength)
+        if not (isinstance(page_to_write.data, memoryview) and page_to_write.data.obj is target.obj): #page built in memory or mapped from another file
+            target[:] = page_to_write.data
+
+    #pages for a range that was just allocated, in mmap mode the mapping grows to cover it
+    def new_range(self, name, offset):
+        if not self.mapped:
+            return [Page() for column_index in range(self.num_columns + lstore.config.Offset)]
+
+        new_range = []
+        for column_index in range(self.num_columns + lstore.config.Offset):
+            new_page = self.__mapped_page__(column_index, offset)
+            new_page.data[:] = bytes(lstore.config.PageLength) #clear whatever an older run left at this offset
+            new_page.num_records = Page().num_records
+            new_page.dirty = True #the num records header in the file is still the old one
+            new_range.append(new_page)
+        return new_range
+
+    #positional io through the shared pool, no seek so concurrent callers never share a file position
+    def __pread__(self, path_name, size, offset):
+        fd = file_pool.acquire(path_name)
+        try:
+            data = os.pread(fd, size, offset)
+            if stats.enabled:
+                stats.io(path_name, read = len(data))
+            return data
+        finally:
+            file_pool.release(path_name)
+
+    def __pwrite__(self, path_name, data, offset):
+        fd = file_pool.acquire(path_name)
+        try:
+            written = os.pwrite(fd, data, offset)
+            if stats.enabled:
+                stats.io(path_name, written = written)
+        finally:
+            file_pool.release(path_name)
 
     #fetch a page from disk at the column specified and directed to the offset
     def fetch_page(self, name, column_index, offset):
-        path_name = os.getcwd() + lstore.config.DBName + "/" + name+ "/" + str(column_index)
+        return timed("fetch_page", self.__fetch_page__, name, column_index, offset)
+
+    def write(self, name, column_index, offset, page_to_write):
+        return timed("write", self.__write_page__, name, column_index, offset, page_to_write)
+
+    def __fetch_page__(self, name, column_index, offset):
+        if self.mapped:
+            return self.__mapped_page__(column_index, offset)
         temp_page = Page()
-        file = open(path_name, 'rb')
+        with self.cold_lock:
+            length = self.cold.get((column_index, offset))
+        raw = self.__pread__(self.__file_name__(column_index), lstore.config.FilePageLength if length is None else 8 + length, offset)
 
-        file.seek(offset)
-        tail_offset = int.from_bytes(file.read(4), "big")
-        num_records = int.from_bytes(file.read(4), "big") #get first 8 bytes, convert to int to get num records
-        page_data = bytearray(file.read(lstore.config.PageLength)) #binary file for the page data
+        num_records = int.from_bytes(raw[4:8], "big") #skip the tail pointer, next 4 bytes are the num records
+        if num_records & COMPRESSED:
+            length = (num_records >> 16) & 0x7fff
+            if len(raw) < 8 + length:
+                raw = self.__pread__(self.__file_name__(column_index), 8 + length, offset)
+            with self.cold_lock:
+                if self.cold.get((column_index, offset)) != length:
+                    self.cold[(column_index, offset)] = length
+                    self.cold_changed = True
+            return CompressedPage(num_records & 0xffff, bytes(raw[8 : 8 + length]))
+        if length is not None: #stored whole since the hint was taken
+            with self.cold_lock:
+                if self.cold.pop((column_index, offset), None) is not None:
+                    self.cold_changed = True
+            raw = self.__pread__(self.__file_name__(column_index), lstore.config.FilePageLength, offset)
+            num_records = int.from_bytes(raw[4:8], "big")
+        page_data = bytearray(raw[8:]) #binary file for the page data
+        if len(page_data) < lstore.config.PageLength: #range was never fully written out
+            page_data.extend(bytes(lstore.config.PageLength - len(page_data)))
 
-        temp_page.num_records = num_records
+        temp_page.num_records = num_records if num_records != 0 else temp_page.num_records
         temp_page.data = page_data
 
         return temp_page
 
-    def write(self, name, column_index, offset, page_to_write):
-        path_name = os.getcwd() + lstore.config.DBName + "/" + name + "/" + str(column_index)
-        file = open(path_name, 'r+b')
-
-        file.seek(offset + 4) #skip the first parameter
-        file.write(page_to_write.num_records.to_bytes(4, "big"))
-        file.write(page_to_write.data)
+    def __write_page__(self, name, column_index, offset, page_to_write):
+        if self.mapped:
+            return self.__write_mapped__(column_index, offset, page_to_write)
+        blob = self.__compress__(page_to_write)
+        if blob is not None:
+            header = COMPRESSED | (len(blob) << 16) | page_to_write.num_records
+            self.__pwrite__(self.__file_name__(column_index), header.to_bytes(4, "big") + blob, offset + 4)
+            with self.cold_lock:
+                self.cold[(column_index, offset)] = len(blob)
+                self.cold_changed = True
+            return
+        with self.cold_lock:
+            if self.cold.pop((column_index, offset), None) is not None:
+                self.cold_changed = True
+        #skip the first parameter, the tail pointer is only changed through update_offset
+        self.__pwrite__(self.__file_name__(column_index), page_to_write.num_records.to_bytes(4, "big") + page_to_write.data, offset + 4)
 
     def update_offset(self, name, column_index, offset, offset_to_write):
-        path_name = os.getcwd() + lstore.config.DBName + "/" + name + "/" + str(column_index)
-        file = open(path_name, 'r+b')
+        self.__pwrite__(self.__file_name__(column_index), offset_to_write.to_bytes(4, "big"), offset)
+
+    #return the offset pointer for the specified disk
+    def get_offset(self, name, column_index, offset):
+        tail_offset = int.from_bytes(self.__pread__(self.__file_name__(column_index), 4, offset), "big")
+        return tail_offset
 
-        file.seek(offset)
-        file.write(offset_to_write.to_bytes(4, "big"))
+    #fetch every column page of the range, one read per column file
+    def fetch_range(self, name, offset):
+        return [self.fetch_page(name, column_index, offset) for column_index in range(self.num_columns + lstore.config.Offset)]
+
+    #write every column page of the range, one write per column file
+    def write_range(self, name, offset, pages):
+        for column_index in range(self.num_columns + lstore.config.Offset):
+            self.write(name, column_index, offset, pages[column_index])
+
+    #fetch the pages of the range at the given columns, in the same order
+    def fetch_pages(self, name, offset, column_indexes):
+        return [self.fetch_page(name, column_index, offset) for column_index in column_indexes]
+
+    #write the pages of the range at the given columns, the other pages are unchanged since they were read
+    def write_pages(self, name, offset, pages, column_indexes):
+        for column_index in column_indexes:
+            self.write(name, column_index, offset, pages[column_index])
+
+    #point the range at offset to its next tail range, every column file keeps its own copy of the pointer
+    def update_range_offset(self, name, offset, offset_to_write):
+        for column_index in range(self.num_columns + lstore.config.Offset):
+            self.update_offset(name, column_index, offset, offset_to_write)
+
+    #remove the files of this layout once the table has been migrated to another one
+    def remove(self):
+        self.close()
+        for column_index in range(self.num_columns + lstore.config.Offset):
+            os.remove(self.__file_name__(column_index))
+        if os.path.isfile(self.path_name + "/cold"):
+            os.remove(self.path_name + "/cold")
+
+    #msync the mapped files and fsync the others, dirty mapped pages otherwise reach the disk whenever the os writes them back
+    def flush(self):
+        for mapped_file in self.maps.values():
+            mapped_file.flush()
+        if self.cold_changed:
+            self.__write_cold__()
+        file_pool.sync(self.path_name + "/")
+
+    #close the pooled descriptors of this table
+    def close(self):
+        for mapped_file in self.maps.values():
+            mapped_file.close()
+        file_pool.close(self.path_name + "/")
+
+#every column page of a range is stored next to the others in a single segments file, behind one range header
+#the header holds the tail pointer of the range followed by the number of records of every column page
+#range offsets keep the same values as the column layout (multiples of FilePageLength) and are mapped to segment positions
+class SegmentDisk(Disk):
+    def __init__(self, name, num_columns, mapped = False):
+        self.name = name
+        self.num_columns = num_columns
+        self.mapped = mapped
+        self.maps = {}
+        self.path_name = os.getcwd() + lstore.config.DBName + "/" + name
+        self.cold = {} #segments store every page whole
+        self.cold_changed = False
+        self.cold_lock = threading.Lock()
+        self.header_length = 4 + 4 * (num_columns + lstore.config.Offset)
+        self.segment_length = self.header_length + lstore.config.PageLength * (num_columns + lstore.config.Offset)
+        if not os.path.exists(self.path_name):
+            os.makedirs(self.path_name)
+
+        if not os.path.isfile(self.__segment_file__()):
+            self.__pwrite__(self.__segment_file__(), self.__header__([Page() for column_index in range(num_columns + lstore.config.Offset)]), 0)
+
+    def __segment_file__(self):
+        return self.path_name + "/segments"
+
+    #file position of the range header for a range offset
+    def __position__(self, offset):
+        return (offset // lstore.config.FilePageLength) * self.segment_length
+
+    def __page_location__(self, column_index, offset):
+        position = self.__position__(offset)
+        return self.__segment_file__(), position + self.header_length + column_index * lstore.config.PageLength, position + 4 + 4 * column_index
+
+    def __stride__(self):
+        return self.segment_length
+
+    #tail pointer followed by the num records of each column page
+    def __header__(self, pages, tail_offset = 0):
+        header = bytearray(tail_offset.to_bytes(4, "big"))
+        for page in pages:
+            header += page.num_records.to_bytes(4, "big")
+        return header
+
+    def __fetch_page__(self, name, column_index, offset):
+        if self.mapped:
+            return self.__mapped_page__(column_index, offset)
+        temp_page = Page()
+        position = self.__position__(offset)
+        num_records = int.from_bytes(self.__pread__(self.__segment_file__(), 4, position + 4 + 4 * column_index), "big")
+        page_data = bytearray(self.__pread__(self.__segment_file__(), lstore.config.PageLength, position + self.header_length + column_index * lstore.config.PageLength))
+        if len(page_data) < lstore.config.PageLength:
+            page_data.extend(bytes(lstore.config.PageLength - len(page_data)))
+
+        temp_page.num_records = num_records if num_records != 0 else temp_page.num_records
+        temp_page.data = page_data
+        return temp_page
+
+    #the header and every column page land in their own buffers with a single preadv
+    def fetch_range(self, name, offset):
+        if self.mapped:
+            return Disk.fetch_range(self, name, offset)
+        return timed("fetch_range", self.__fetch_segment__, name, offset)
+
+    def __fetch_segment__(self, name, offset):
+        header = bytearray(self.header_length)
+        pages = [Page() for column_index in range(self.num_columns + lstore.config.Offset)]
+        fd = file_pool.acquire(self.__segment_file__())
+        try:
+            read = os.preadv(fd, [header] + [page.data for page in pages], self.__position__(offset)) #zero filled past the end of the file
+            if stats.enabled:
+                stats.io(self.__segment_file__(), read = read)
+        finally:
+            file_pool.release(self.__segment_file__())
+
+        for column_index, page in enumerate(pages):
+            num_records = int.from_bytes(header[4 + 4 * column_index : 8 + 4 * column_index], "big")
+            page.num_records = num_records if num_records != 0 else page.num_records
+        return pages
+
+    def __write_page__(self, name, column_index, offset, page_to_write):
+        if self.mapped:
+            return self.__write_mapped__(column_index, offset, page_to_write)
+        position = self.__position__(offset)
+        self.__pwrite__(self.__segment_file__(), page_to_write.num_records.to_bytes(4, "big"), position + 4 + 4 * column_index)
+        self.__pwrite__(self.__segment_file__(), page_to_write.data, position + self.header_length + column_index * lstore.config.PageLength)
+
+    #the header minus the tail pointer and every column page go out with a single pwritev
+    def write_range(self, name, offset, pages):
+        if self.mapped:
+            return Disk.write_range(self, name, offset, pages)
+        return timed("write_range", self.__write_segment__, name, offset, pages)
+
+    def __write_segment__(self, name, offset, pages):
+        fd = file_pool.acquire(self.__segment_file__())
+        try:
+            written = os.pwritev(fd, [self.__header__(pages)[4:]] + [page.data for page in pages], self.__position__(offset) + 4)
+            if stats.enabled:
+                stats.io(self.__segment_file__(), written = written)
+        finally:
+            file_pool.release(self.__segment_file__())
+
+    #a whole range is read with its single preadv, a few columns page by page
+    def fetch_pages(self, name, offset, column_indexes):
+        if len(column_indexes) == self.num_columns + lstore.config.Offset and not self.mapped:
+            pages = self.fetch_range(name, offset)
+            return [pages[column_index] for column_index in column_indexes]
+        return Disk.fetch_pages(self, name, offset, column_indexes)
+
+    #a whole range goes out with its single pwritev, a few columns page by page
+    def write_pages(self, name, offset, pages, column_indexes):
+        if len(column_indexes) == self.num_columns + lstore.config.Offset and not self.mapped:
+            return self.write_range(name, offset, pages)
+        Disk.write_pages(self, name, offset, pages, column_indexes)
+
+    #a range has a single tail pointer, the column index is only kept for compatibility with the column layout
+    def update_offset(self, name, column_index, offset, offset_to_write):
+        self.__pwrite__(self.__segment_file__(), offset_to_write.to_bytes(4, "big"), self.__position__(offset))
 
-    #return the offset pointer for the specified disk 
     def get_offset(self, name, column_index, offset):
-        path_name = os.getcwd() + lstore.config.DBName + "/" + name + "/" + str(column_index)
-        file = open(path_name, 'rb')
+        return int.from_bytes(self.__pread__(self.__segment_file__(), 4, self.__position__(offset)), "big")
+
+    def update_range_offset(self, name, offset, offset_to_write):
+        self.update_offset(name, 0, offset, offset_to_write)
+
+    def remove(self):
+        self.close()
+        os.remove(self.__segment_file__())
+
+Layouts = {"column": Disk, "segment": SegmentDisk}
+Layout_names = ["column", "segment"] #position is the layout id stored in the counters file
+
+#create the disk of a table for the storage layout chosen at create_table
+#mapped selects the mmap mode where buffered pages are views of the mapped files
+def open_disk(name, num_columns, layout = "column", mapped = None):
+    if layout not in Layouts:
+        raise ValueError("unknown storage layout " + str(layout))
+    return Layouts[layout](name, num_columns, lstore.config.MmapStorage if mapped is None else mapped)
+
+#copy every range of a table from its current disk into a disk of the new layout, frames still buffered stay valid since offsets are kept
+def migrate_disk(disk, layout, last_offset):
+    if type(disk) is Layouts[layout]: #already stored in this layout
+        return disk
+    new_disk = open_disk(disk.name, disk.num_columns, layout, disk.mapped)
+    for offset in range(0, last_offset + 1, lstore.config.FilePageLength):
+        new_disk.write_range(disk.name, offset, disk.fetch_range(disk.name, offset))
+        new_disk.update_range_offset(disk.name, offset, disk.get_offset(disk.name, 0, offset))
+    disk.remove()
+    return new_disk
 
-        file.seek(offset)
-        tail_offset = int.from_bytes(file.read(4), "big")
-        return tail_offset
\ No newline at end of file
+def disk_stats():
+    return file_pool.stats()
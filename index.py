@@ -1,6 +1,7 @@
 from lstore.table import Table
 import lstore.config
 from collections import defaultdict
+from itertools import compress
 from lstore.btree import BTreeNode, BPTree
 import threading
 
@@ -81,6 +82,38 @@ class Index:
                 self.index_dict[column_index][cols[column_index]].append(RID_entry) #add to the list entry
         return 0
 
+    #add_index of a batch of records given by columns, a record whose key is indexed already is skipped like add_index skips it
+    def add_many(self, RID_entries, columns):
+        kept = []
+        key_index = self.index_dict[self.table.key]
+        for key, RID_entry in zip(columns[self.table.key], RID_entries):
+            entry = key_index.get(key)
+            if entry is None:
+                key_index[key] = [RID_entry]
+            elif len(entry) != 0:
+                kept.append(False)
+                continue
+            else:
+                entry.append(RID_entry)
+            kept.append(True)
+        skipped = kept.count(False)
+        if skipped != 0: #the other columns only see the records added
+            RID_entries = list(compress(RID_entries, kept))
+            columns = [list(compress(column, kept)) for column in columns]
+
+        for column_index in range(len(columns)):
+            if column_index == self.table.key:
+                continue
+            column_index_dict = self.index_dict[column_index]
+            get = column_index_dict.get
+            for value, RID_entry in zip(columns[column_index], RID_entries):
+                entry = get(value)
+                if entry is None:
+                    column_index_dict[value] = [RID_entry]
+                else:
+                    entry.append(RID_entry)
+        return -1 if skipped != 0 else 0
+
     def update_index(self, RID_entry, cols): #drop the index and add the updated record
         self.drop_index(cols[self.table.key])
         self.add_index(RID_entry, cols)
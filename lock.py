@@ -0,0 +1,276 @@
+import lstore.config
+import itertools
+import threading
+import time
+
+#lock modes, intention modes are taken on the table and the page range above a record lock
+INTENTION_SHARED = "IS"
+INTENTION_EXCLUSIVE = "IX"
+SHARED = "S"
+SHARED_INTENTION_EXCLUSIVE = "SIX" #read the whole granule and write some records of it
+EXCLUSIVE = "X"
+
+#modes other owners may hold along with a mode
+Compatible = {INTENTION_SHARED: set([INTENTION_SHARED, INTENTION_EXCLUSIVE, SHARED, SHARED_INTENTION_EXCLUSIVE]),
+              INTENTION_EXCLUSIVE: set([INTENTION_SHARED, INTENTION_EXCLUSIVE]),
+              SHARED: set([INTENTION_SHARED, SHARED]),
+              SHARED_INTENTION_EXCLUSIVE: set([INTENTION_SHARED]),
+              EXCLUSIVE: set()}
+
+#modes whose requests holding a mode already grants
+Covers = {INTENTION_SHARED: set([INTENTION_SHARED]),
+          INTENTION_EXCLUSIVE: set([INTENTION_SHARED, INTENTION_EXCLUSIVE]),
+          SHARED: set([INTENTION_SHARED, SHARED]),
+          SHARED_INTENTION_EXCLUSIVE: set([INTENTION_SHARED, INTENTION_EXCLUSIVE, SHARED, SHARED_INTENTION_EXCLUSIVE]),
+          EXCLUSIVE: set(Compatible.keys())}
+
+#mode of an owner holding held that is granted requested too
+def combine(held, requested):
+    if held is None or requested in Covers[held]:
+        return requested if held is None else held
+    if held in Covers[requested]:
+        return requested
+    return SHARED_INTENTION_EXCLUSIVE if EXCLUSIVE not in (held, requested) else EXCLUSIVE #S with IX, or SIX with X
+
+#intention mode taken on the granules above a lock
+def intention(mode):
+    return INTENTION_SHARED if mode in (INTENTION_SHARED, SHARED) else INTENTION_EXCLUSIVE
+
+#lock granules of a table besides the records (keyed by rid)
+TABLE = ("table",)
+
+def range_key(offset):
+    return ("range", offset)
+
+#deadlock avoidance policies, a transaction that may not wait fails its request and aborts
+NO_WAIT = "no-wait" #every conflict aborts the requester
+WAIT_DIE = "wait-die" #an older requester waits for younger holders, a younger one aborts (dies)
+WOUND_WAIT = "wound-wait" #an older requester aborts (wounds) younger holders and waits, a younger one waits
+Lock_policies = [NO_WAIT, WAIT_DIE, WOUND_WAIT]
+
+#timestamps of the running transactions by owner, smaller is older. Owners without one (queries run outside of a
+#transaction) never wait. Shared by the lock tables of every table since a transaction can span tables
+transaction_timestamps = itertools.count(1)
+timestamps = {}
+wounded = set() #timestamps of transactions an older one wounded, their next lock request fails
+failures = threading.local() #why the last lock request of the thread failed
+
+#abort causes of a failed lock request
+CONFLICT = "conflict" #no-wait, or a query outside of a transaction
+DIED = "died"
+WOUNDED = "wounded"
+TIMEOUT = "timeout"
+
+def next_timestamp():
+    return next(transaction_timestamps)
+
+#register the timestamp of the transaction the calling thread runs, kept by a restarted transaction so it ages
+def begin(timestamp):
+    timestamps[threading.get_ident()] = timestamp
+    failures.cause = None
+
+def end():
+    wounded.discard(timestamps.pop(threading.get_ident(), None))
+
+#True if an older transaction wounded the one running on this thread, long scans check it between their lock requests
+def is_wounded():
+    if timestamps.get(threading.get_ident()) in wounded:
+        failures.cause = WOUNDED
+        return True
+    return False
+
+#cause of the last failed lock request of the running transaction, None if none failed
+def last_failure():
+    return getattr(failures, "cause", None)
+
+class LockEntry():
+    __slots__ = ["holders", "queue"]
+
+    def __init__(self):
+        self.holders = {} #owner -> mode
+        self.queue = [] #owners blocked on this entry in arrival order, it stays in the table while there are any
+
+"""
+# Lock table of a table, granule -> holders and their modes
+# Granules form a hierarchy: the table (TABLE), its base page ranges (range_key(offset)) and the records (their rid).
+# A record lock takes intention locks on its table and range first, a scan or aggregate locks a whole range shared.
+# Once an owner holds LockEscalation record locks in a range its next record lock is escalated to the range.
+# The table is split into LockPartitions partitions by granule, each with its own latch and a condition variable that
+# blocked requests wait on. Entries exist only while a lock is held or awaited. Every owner (a thread running a
+# transaction) keeps the granules it locked with their modes, release_all goes through those instead of the table
+"""
+class LockManager():
+    def __init__(self, partitions = None):
+        partitions = lstore.config.LockPartitions if partitions is None else partitions
+        self.latches = [threading.Lock() for partition in range(partitions)]
+        self.released = [threading.Condition(latch) for latch in self.latches]
+        self.entries = [{} for partition in range(partitions)]
+        self.held = {} #owner -> granule -> mode, each dict is only changed by its owner
+        self.records = {} #owner -> range granule -> record locks taken under it
+        self.policy = lstore.config.LockPolicy
+        self.waits = 0 #counted without a common latch, statistics only
+        self.conflicts = 0
+        self.dies = 0
+        self.wounds = 0
+        self.escalations = 0
+
+    def __partition__(self, key):
+        return hash(key) % len(self.latches)
+
+    def __compatible__(self, entry, owner, mode):
+        wanted = combine(entry.holders.get(owner), mode)
+        return all(held in Compatible[wanted] for holder, held in entry.holders.items() if holder != owner)
+
+    #grants are first come first served: a new request doesn't pass blocked ones (a stream of scans would starve a
+    #writer), only an owner already holding the entry does since the blocked requests may wait for it
+    def __grantable__(self, entry, owner, mode):
+        if len(entry.queue) != 0 and entry.queue[0] != owner and owner not in entry.holders:
+            return False
+        return self.__compatible__(entry, owner, mode)
+
+    def __dequeue__(self, entry, owner, released):
+        if owner in entry.queue:
+            entry.queue.remove(owner)
+            if len(entry.queue) != 0:
+                released.notify_all() #the next request in line may be grantable now
+
+    #owners holding a lock on the entry that conflicts with the request
+    def __holders__(self, entry, owner, mode):
+        wanted = combine(entry.holders.get(owner), mode)
+        return [holder for holder, held in entry.holders.items() if holder != owner and held not in Compatible[wanted]]
+
+    #None if the owner should wait for the conflicting holders, the abort cause otherwise. Wound-wait wounds the younger holders
+    def __resolve__(self, entry, owner, mode):
+        stamp = timestamps.get(owner)
+        if stamp in wounded:
+            return WOUNDED
+        if self.policy == NO_WAIT or stamp is None:
+            return CONFLICT
+        holders = [timestamps.get(holder) for holder in self.__holders__(entry, owner, mode)]
+        if self.policy == WAIT_DIE:
+            if all(holder is None or stamp < holder for holder in holders):
+                return None
+            self.dies += 1
+            return DIED
+        for holder in holders:
+            if holder is not None and stamp < holder and holder not in wounded:
+                wounded.add(holder)
+                self.wounds += 1
+        return None
+
+    #mode the owner holds on a granule, None if it holds none
+    def mode(self, key, owner = None):
+        return self.held.get(threading.get_ident() if owner is None else owner, {}).get(key)
+
+    """
+    # Lock a granule for the owner (the calling thread by default) in one of the modes, alone (no intention locks)
+    # On a conflict the policy decides whether the request waits for the holders to release, for at most timeout
+    # seconds (LockTimeout by default). Returns False if the lock couldn't be granted, the transaction must abort
+    """
+    def acquire(self, key, mode, owner = None, timeout = None):
+        owner = threading.get_ident() if owner is None else owner
+        held = self.held.get(owner)
+        if held is not None and key in held and mode in Covers[held[key]]: #already granted, no latch needed
+            return True
+        timeout = lstore.config.LockTimeout if timeout is None else timeout
+        if timestamps.get(owner) in wounded: #an older transaction needs what this one holds
+            failures.cause = WOUNDED
+            return False
+        partition = self.__partition__(key)
+        released = self.released[partition]
+        entries = self.entries[partition]
+        with released:
+            entry = entries.get(key)
+            if entry is None:
+                entry = entries[key] = LockEntry()
+            deadline = None
+            while not self.__grantable__(entry, owner, mode):
+                if deadline is None:
+                    self.conflicts += 1
+                    deadline = time.monotonic() + timeout
+                remaining = deadline - time.monotonic()
+                cause = TIMEOUT if remaining <= 0 else self.__resolve__(entry, owner, mode)
+                if cause is not None:
+                    self.__dequeue__(entry, owner, released)
+                    if len(entry.holders) == 0 and len(entry.queue) == 0:
+                        del entries[key]
+                    failures.cause = cause
+                    return False
+                self.waits += 1
+                if owner not in entry.queue:
+                    entry.queue.append(owner)
+                released.wait(remaining)
+            self.__dequeue__(entry, owner, released)
+            entry.holders[owner] = combine(entry.holders.get(owner), mode)
+            self.held.setdefault(owner, {})[key] = entry.holders[owner]
+        return True
+
+    """
+    # Lock a record (SHARED or EXCLUSIVE) under the table and the base range at offset (None for a rid that has no
+    # range yet), taking the intention locks on the way down. A range lock the owner holds covering the request
+    # stands in for the record lock, and past LockEscalation record locks in the range the range itself is locked
+    """
+    def acquire_record(self, rid, offset, mode, owner = None, timeout = None):
+        owner = threading.get_ident() if owner is None else owner
+        held = self.mode(rid, owner)
+        if held is not None and mode in Covers[held]:
+            return True
+        if not self.acquire(TABLE, intention(mode), owner, timeout):
+            return False
+        if offset is not None:
+            granule = range_key(offset)
+            held = self.mode(granule, owner)
+            if held is not None and mode in Covers[held]:
+                return True
+            counts = self.records.setdefault(owner, {})
+            if counts.get(granule, 0) >= lstore.config.LockEscalation and self.acquire(granule, mode, owner, 0):
+                self.escalations += 1
+                return True
+            if not self.acquire(granule, intention(mode), owner, timeout):
+                return False
+            counts[granule] = counts.get(granule, 0) + 1
+        return self.acquire(rid, mode, owner, timeout)
+
+    #lock a whole base range (SHARED for a scan) under the table
+    def acquire_range(self, offset, mode, owner = None, timeout = None):
+        owner = threading.get_ident() if owner is None else owner
+        return self.acquire(TABLE, intention(mode), owner, timeout) and self.acquire(range_key(offset), mode, owner, timeout)
+
+    #drop every lock of the owner, blocked requests on the partitions touched are woken
+    def release_all(self, owner = None):
+        owner = threading.get_ident() if owner is None else owner
+        keys = self.held.pop(owner, {})
+        self.records.pop(owner, None)
+        for key in keys:
+            partition = self.__partition__(key)
+            with self.released[partition]:
+                entry = self.entries[partition].get(key)
+                if entry is None:
+                    continue
+                entry.holders.pop(owner, None)
+                if len(entry.queue) != 0:
+                    self.released[partition].notify_all()
+                elif len(entry.holders) == 0:
+                    del self.entries[partition][key]
+        return len(keys)
+
+    #True if an owner other than the given one (the calling thread by default) holds the granule in one of the modes
+    #a peek without the partition latch or an entry, optimistic and snapshot transactions use it to spot 2PL writers
+    def is_held(self, key, modes, owner = None):
+        entry = self.entries[self.__partition__(key)].get(key)
+        if entry is None:
+            return False
+        owner = threading.get_ident() if owner is None else owner
+        return any(held in modes for holder, held in list(entry.holders.items()) if holder != owner)
+
+    #True if another owner may be writing the record: it holds it, or its whole range, exclusive
+    def is_written(self, rid, offset, owner = None):
+        return self.is_held(rid, (EXCLUSIVE,), owner) or (offset is not None and self.is_held(range_key(offset), (EXCLUSIVE,), owner))
+
+    #number of granules the owner holds a lock on
+    def held_count(self, owner = None):
+        return len(self.held.get(threading.get_ident() if owner is None else owner, ()))
+
+    def stats(self):
+        return {"policy": self.policy, "entries": sum(len(entries) for entries in self.entries), "owners": len(self.held),
+                "conflicts": self.conflicts, "waits": self.waits, "dies": self.dies, "wounds": self.wounds, "escalations": self.escalations}
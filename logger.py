@@ -1 +1,320 @@
+import lstore.config
+import lstore.table
+from lstore.page import Page
+import itertools
+import os
+import pickle
+import threading
+import time
+
 LOG_LEVEL = 0
+
+#record types
+INSERT = "insert"
+BULK_INSERT = "bulk insert" #a run of inserts placed in one base range, the columns of the records (see Query.insert_many)
+UPDATE = "update"
+DELETE = "delete"
+INDIRECTION = "indirection"
+RANGE = "range" #a base or tail range was allocated, always redone so the offset counters never hand it out twice
+MERGE = "merge" #tail ranges were merged into a base range, the images of the new data pages and the tps (see Table.__prepare_merge__)
+DICTIONARY = "dictionary" #a string got a dictionary code, always redone since records of any transaction may use it
+COMMIT = "commit"
+ABORT = "abort"
+
+#records written outside of a transaction (e.g. a plain query.insert) belong to this id and are never undone
+AUTOCOMMIT = 0
+
+transaction_ids = itertools.count(1)
+current = threading.local() #id of the transaction running on this thread
+
+def next_transaction_id():
+    return next(transaction_ids)
+
+def set_transaction(txn_id):
+    current.txn_id = txn_id
+
+def current_transaction():
+    return getattr(current, "txn_id", AUTOCOMMIT)
+
+"""
+# Write-ahead log of a database, one record per insert (or run of bulk inserts), update, delete and indirection change
+# Records are appended to an in memory buffer, committing transactions share fsyncs through group commit:
+# the first committer to find no flush in progress becomes the leader, waits up to LogFlushInterval for
+# LogBatchSize records to pile up and writes them all with a single fsync for every waiting committer
+# Other flushes (the WAL rule before a page write) never wait for a batch, they join the flush in progress
+# or cut the leader's wait short
+"""
+class Logger():
+    def __init__(self, path_name):
+        self.file_name = path_name + "/wal.log"
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.buffer = [] #encoded records waiting for the next flush
+        self.next_lsn = 1
+        self.flushed_lsn = 0
+        self.flushing = False
+        self.urgent = False #a flush that must not wait for the batch is waiting on the leader
+        self.fd = os.open(self.file_name, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self.flushes = 0
+        self.commits = 0
+        self.active = {} #first lsn of every transaction that has neither committed nor aborted yet
+
+    #append a record and return its log sequence number, nothing is written to disk yet
+    def append(self, kind, table_name, payload, txn_id = None):
+        txn_id = current_transaction() if txn_id is None else txn_id
+        with self.lock:
+            lsn = self.next_lsn
+            self.next_lsn += 1
+            if kind == COMMIT or kind == ABORT:
+                self.active.pop(txn_id, None)
+            elif txn_id != AUTOCOMMIT and txn_id not in self.active:
+                self.active[txn_id] = lsn
+            record = pickle.dumps((lsn, txn_id, kind, table_name, payload))
+            self.buffer.append(len(record).to_bytes(4, "big") + lsn.to_bytes(8, "big") + record) #the lsn is repeated in the header so truncation doesn't unpickle
+            if len(self.buffer) >= lstore.config.LogBatchSize:
+                self.changed.notify_all() #wake the leader, the batch is full
+        return lsn
+
+    #block until every record up to lsn is on disk, sharing the fsync with the other committers
+    #only commits (batch) wait for the group to fill, anyone else writes as soon as no flush is in progress
+    def wait_flushed(self, lsn, batch = False):
+        with self.lock:
+            while self.flushed_lsn < lsn:
+                if self.flushing:
+                    if not batch and not self.urgent:
+                        self.urgent = True
+                        self.changed.notify_all() #wake a leader still waiting for its batch
+                    self.changed.wait()
+                    continue
+
+                self.flushing = True #this thread leads the next group
+                deadline = time.time() + lstore.config.LogFlushInterval
+                while batch and not self.urgent and len(self.buffer) < lstore.config.LogBatchSize and time.time() < deadline:
+                    self.changed.wait(deadline - time.time())
+                self.urgent = False
+                self.__write_buffer__()
+                self.flushing = False
+                self.changed.notify_all()
+
+    #called with the lock held, the lock is let go during the write so appenders are not blocked
+    def __write_buffer__(self):
+        batch = self.buffer
+        last_lsn = self.next_lsn - 1
+        self.buffer = []
+        self.lock.release()
+        try:
+            if len(batch) != 0:
+                os.write(self.fd, b"".join(batch))
+                os.fsync(self.fd)
+        finally:
+            self.lock.acquire()
+        self.flushed_lsn = max(self.flushed_lsn, last_lsn)
+        self.flushes += 1
+
+    #force everything appended so far without waiting for a batch, used before dirty pages are written back (WAL rule)
+    def flush(self):
+        with self.lock:
+            if self.next_lsn - 1 <= self.flushed_lsn:
+                return
+            lsn = self.next_lsn - 1
+        self.wait_flushed(lsn)
+
+    def commit(self, txn_id):
+        with self.lock:
+            self.commits += 1
+            if txn_id not in self.active: #wrote nothing (read only), there is nothing to force
+                return
+        self.wait_flushed(self.append(COMMIT, None, None, txn_id), True)
+
+    #the compensation records of the rollback were logged by the undo itself, no need to wait for the disk
+    def abort(self, txn_id):
+        self.append(ABORT, None, None, txn_id)
+
+    #(lsn, start, end) of every record in the log data, a torn record at the end from a crash mid write is dropped
+    def __frames__(self, data):
+        frames = []
+        position = 0
+        while position + 12 <= len(data):
+            length = int.from_bytes(data[position : position + 4], "big")
+            if position + 12 + length > len(data):
+                break
+            frames.append((int.from_bytes(data[position + 4 : position + 12], "big"), position, position + 12 + length))
+            position += 12 + length
+        return frames
+
+    #every record of the log in order
+    def read_records(self):
+        with open(self.file_name, "rb") as file:
+            data = file.read()
+        return [pickle.loads(data[start + 12 : end]) for lsn, start, end in self.__frames__(data)]
+
+    def last_lsn(self):
+        with self.lock:
+            return self.next_lsn - 1
+
+    #drop the records a checkpoint made unnecessary, the ones of transactions still running are kept for their undo
+    def truncate_before(self, lsn):
+        with self.lock:
+            while self.flushing:
+                self.changed.wait()
+            if len(self.active) != 0:
+                lsn = min(lsn, min(self.active.values()))
+
+            with open(self.file_name, "rb") as file:
+                data = file.read()
+            kept = [data[start : end] for record_lsn, start, end in self.__frames__(data) if record_lsn >= lsn]
+            with open(self.file_name + ".tmp", "wb") as file:
+                file.write(b"".join(kept))
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(self.file_name + ".tmp", self.file_name)
+            os.close(self.fd)
+            self.fd = os.open(self.file_name, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    #drop the log once everything it describes is stored in the table files
+    def truncate(self):
+        with self.lock:
+            self.buffer = []
+            self.active = {}
+            os.ftruncate(self.fd, 0)
+            os.fsync(self.fd)
+            self.flushed_lsn = self.next_lsn - 1
+
+    def close(self):
+        self.truncate()
+        os.close(self.fd)
+
+    def stats(self):
+        return {"flushes": self.flushes, "commits": self.commits, "flushed_lsn": self.flushed_lsn, "buffered": len(self.buffer)}
+
+    """
+    # Bring the tables back to the last committed state after a crash
+    # Redo repeats history for committed, aborted (their rollback is logged) and autocommit records in log order,
+    # then the records of transactions that never finished are undone newest first
+    """
+    def recover(self, db):
+        records = self.read_records()
+        if len(records) == 0:
+            return 0
+
+        finished = set([AUTOCOMMIT])
+        for lsn, txn_id, kind, table_name, payload in records:
+            if kind == COMMIT or kind == ABORT:
+                finished.add(txn_id)
+            elif kind == RANGE: #ranges placed again during redo must not reuse an offset the log hands out later
+                table = db.get_table(table_name)
+                table.base_offset_counter = max(table.base_offset_counter, payload[0])
+                table.tail_offset_counter = max(table.tail_offset_counter, payload[1])
+
+        for lsn, txn_id, kind, table_name, payload in records:
+            if txn_id in finished and table_name is not None:
+                redo(db.get_table(table_name), kind, payload)
+
+        for lsn, txn_id, kind, table_name, payload in reversed(records):
+            if txn_id not in finished and table_name is not None:
+                undo(db.get_table(table_name), kind, payload)
+
+        self.next_lsn = records[-1][0] + 1
+        return len(records)
+
+#write the columns of a record at the slot it was logged with, in every column page of the range. Redo is idempotent
+#and doesn't depend on the record counts the column pages came back from disk with, they may differ within a range
+def write_record(table, rid, location, columns):
+    page_index, slot_index = location
+    current_range = table.buffer.fetch_range(table.name, page_index)
+    for column_index in range(len(columns)):
+        current_range[column_index].write_at(slot_index, columns[column_index])
+    table.buffer.unpin_range(table.name, page_index)
+    table.page_directory[rid] = location
+
+def write_cell(table, rid, column_index, value):
+    page_index, slot_index = table.page_directory[rid]
+    current_range = table.buffer.fetch_range(table.name, page_index, [column_index])
+    current_range[column_index].inplace_update(slot_index, value)
+    table.buffer.unpin_range(table.name, page_index, [column_index])
+
+def redo(table, kind, payload):
+    RID_COLUMN = lstore.table.RID_COLUMN
+    if kind == INSERT:
+        location, columns = payload
+        write_record(table, columns[RID_COLUMN], location, columns)
+        table.base_RID = max(table.base_RID, columns[RID_COLUMN] + 1)
+    elif kind == BULK_INSERT:
+        (page_index, slot_index), columns = payload
+        current_range = table.buffer.fetch_range(table.name, page_index)
+        for column_index in range(len(columns)):
+            current_range[column_index].write_many(columns[column_index], slot_index)
+        table.buffer.unpin_range(table.name, page_index)
+        table.page_directory.set_range(columns[RID_COLUMN][0], page_index, slot_index, len(columns[RID_COLUMN]))
+        table.base_RID = max(table.base_RID, columns[RID_COLUMN][-1] + 1)
+    elif kind == UPDATE:
+        base_rid, columns, location = payload
+        write_record(table, columns[RID_COLUMN], location, columns)
+        table.tail_RID = min(table.tail_RID, columns[RID_COLUMN] - 1)
+    elif kind == DELETE:
+        rid = payload
+        if rid in table.page_directory:
+            write_cell(table, rid, RID_COLUMN, 0)
+    elif kind == INDIRECTION:
+        rid, before, after = payload
+        if rid in table.page_directory:
+            write_cell(table, rid, lstore.table.INDIRECTION_COLUMN, after)
+    elif kind == RANGE:
+        base_offset_counter, tail_offset_counter, previous_offset = payload[:3]
+        table.base_offset_counter = max(table.base_offset_counter, base_offset_counter)
+        table.tail_offset_counter = max(table.tail_offset_counter, tail_offset_counter)
+        if previous_offset is not None:
+            base_offset = payload[3] if len(payload) > 3 else table.tail_directory.owner(previous_offset) #logs before the base offset was logged
+            #chained again only if the chain still ends where it did then: a saved tail directory may already hold the range,
+            #or no longer hold it because a merge dropped it since (the chain moved past previous_offset)
+            if tail_offset_counter not in table.tail_directory and table.tail_directory.current(base_offset) == previous_offset:
+                table.disk.update_range_offset(table.name, previous_offset, tail_offset_counter)
+                table.tail_directory.append(base_offset, tail_offset_counter)
+    elif kind == MERGE:
+        base_offset, tail_offset, tps_value, pages = payload
+        if pages is not None:
+            new_range = [None] * lstore.config.Offset
+            for num_records, data in pages:
+                page = Page()
+                page.num_records = num_records
+                page.data = bytearray(data)
+                page.dirty = True
+                page.cold = True
+                new_range.append(page)
+            table.buffer.swap_range(table.name, base_offset, new_range)
+            metadata_columns = list(range(lstore.config.Offset))
+            base_range = table.buffer.fetch_range(table.name, base_offset, metadata_columns)
+            for column_index in metadata_columns:
+                base_range[column_index].update_tps(tps_value)
+            table.buffer.unpin_range(table.name, base_offset, metadata_columns)
+        chain = list(table.tail_directory.chain(base_offset))
+        if tail_offset in chain: #the merged ranges are dropped again, a saved tail directory may already have dropped them
+            table.disk.update_range_offset(table.name, base_offset, tail_offset)
+            table.tail_directory.drop(base_offset, chain.index(tail_offset))
+    elif kind == DICTIONARY:
+        code, value = payload
+        table.dictionary.restore(code, value)
+
+def undo(table, kind, payload):
+    RID_COLUMN = lstore.table.RID_COLUMN
+    if kind == INSERT:
+        location, columns = payload
+        if columns[RID_COLUMN] in table.page_directory:
+            write_cell(table, columns[RID_COLUMN], RID_COLUMN, 0) #invalidate the record
+    elif kind == BULK_INSERT:
+        location, columns = payload
+        for rid in columns[RID_COLUMN]:
+            if rid in table.page_directory:
+                write_cell(table, rid, RID_COLUMN, 0)
+    elif kind == UPDATE:
+        base_rid, columns, location = payload
+        if columns[RID_COLUMN] in table.page_directory:
+            write_cell(table, columns[RID_COLUMN], RID_COLUMN, 0)
+    elif kind == DELETE:
+        rid = payload
+        if rid in table.page_directory:
+            write_cell(table, rid, RID_COLUMN, rid)
+    elif kind == INDIRECTION:
+        rid, before, after = payload
+        if rid in table.page_directory:
+            write_cell(table, rid, lstore.table.INDIRECTION_COLUMN, before)
@@ -0,0 +1,129 @@
+from lstore.stats import Histogram
+import lstore.config
+import queue
+import threading
+import time
+
+"""
+# Merge daemon of a database, one thread merges the tail ranges of every table back into their base ranges
+# Updates put the offset of a base range whose tail chain grew past TailMergeLimit ranges on the merge_queue of its
+# table and wake the daemon. The daemon drains the queues into one set of candidates, a base range asked for again
+# before its merge ran is only counted once. The candidate merged next has the longest tail chain, ties go to the
+# range read the most since its last merge: long chains slow every update and hot ranges pay for their tails on
+# every read.
+# Merging competes with the queries for the disk and the buffer pool, so the daemon spends at most MergeDutyCycle of
+# its time merging: after a merge that took t seconds it rests t * (1 - MergeDutyCycle) / MergeDutyCycle seconds.
+# A chain of MergeChainLimit ranges or more is merged without resting, the tail ranges a record can be spread over
+# stay bounded however many threads update. A merge that would consolidate the tail of a running transaction is put
+# off to the next round, the transaction may still roll it back, and so is one that would overwrite base values a running
+# snapshot may still read. So is a merge that raised, the daemon keeps running
+"""
+class MergeDaemon():
+    def __init__(self, db):
+        self.db = db
+        self.thread = None
+        self.latch = threading.Lock() #thread start and stop
+        self.wake_event = threading.Event()
+        self.stop_event = threading.Event()
+        self.candidates = set() #(table, base offset) waiting for a merge
+        self.merges = 0
+        self.requests = 0
+        self.duplicates = 0 #requests for a range already waiting
+        self.deferred = 0 #merges put off for a running transaction or snapshot
+        self.failures = 0 #merges that raised, their ranges are tried again next round
+        self.last_failure = None #(table name, base offset, exception) of the last merge that raised
+        self.throttle_time = 0.0 #seconds rested to leave the disk to the queries
+        self.latency = Histogram()
+
+    #an update queued a base range on the merge_queue of its table, the daemon is started on the first request
+    def wake(self):
+        if self.thread is None:
+            self.start()
+        self.wake_event.set()
+
+    def start(self):
+        with self.latch:
+            if self.thread is not None:
+                return
+            self.stop_event.clear()
+            self.thread = threading.Thread(name = "merge_daemon", target = self.__loop__, daemon = True)
+            self.thread.start()
+
+    #waits for a running merge to finish, the queued ones are dropped: their chains queue them again once they grow
+    def stop(self):
+        with self.latch:
+            if self.thread is None:
+                return
+            self.stop_event.set()
+            self.wake_event.set()
+            self.thread.join()
+            self.thread = None
+
+    def __drain__(self):
+        for table in list(self.db.tables):
+            while True:
+                try:
+                    base_offset = table.merge_queue.get_nowait()
+                except queue.Empty:
+                    break
+                self.requests += 1
+                if (table, base_offset) in self.candidates:
+                    self.duplicates += 1
+                self.candidates.add((table, base_offset))
+
+    #candidate to merge next and the length of its tail chain, None when no chain is long enough anymore
+    def __pick__(self):
+        best, best_rank = None, None
+        for table, base_offset in list(self.candidates):
+            chain_length = table.__chain_length__(base_offset)
+            if chain_length <= lstore.config.TailMergeLimit: #merged meanwhile
+                self.candidates.discard((table, base_offset))
+                continue
+            rank = (chain_length, table.range_reads.get(base_offset, 0))
+            if best_rank is None or rank > best_rank:
+                best, best_rank = (table, base_offset), rank
+        if best is None:
+            return None
+        self.candidates.discard(best)
+        return best, best_rank[0]
+
+    def __loop__(self):
+        while not self.stop_event.is_set():
+            self.wake_event.wait(lstore.config.MergeInterval)
+            self.wake_event.clear()
+            self.__drain__()
+            deferred = set()
+            while not self.stop_event.is_set():
+                candidate = self.__pick__()
+                if candidate is None:
+                    break
+                (table, base_offset), chain_length = candidate
+                started = time.perf_counter()
+                try:
+                    merged = table.__prepare_merge__(base_offset)
+                except Exception as error: #e.g. the buffer pool had no frame to spare, the daemon goes on with the other ranges
+                    self.failures += 1
+                    self.last_failure = (table.name, base_offset, repr(error))
+                    deferred.add((table, base_offset))
+                    continue
+                if not merged: #a running transaction wrote into the chain or a snapshot is too old, tried again next round
+                    deferred.add((table, base_offset))
+                    self.deferred += 1
+                    continue
+                elapsed = time.perf_counter() - started
+                self.latency.add(elapsed)
+                self.merges += 1
+                self.__drain__()
+                if chain_length < lstore.config.MergeChainLimit and 0 < lstore.config.MergeDutyCycle < 1:
+                    rest = elapsed * (1 - lstore.config.MergeDutyCycle) / lstore.config.MergeDutyCycle
+                    self.throttle_time += rest
+                    if self.stop_event.wait(rest):
+                        break
+            self.candidates |= deferred
+
+    #queue depth counts the requests not drained yet, latency is the time of a whole merge
+    def stats(self):
+        return {"queue_depth": len(self.candidates) + sum(table.merge_queue.qsize() for table in list(self.db.tables)),
+                "merges": self.merges, "deferred": self.deferred, "failures": self.failures, "last_failure": self.last_failure,
+                "requests": self.requests, "duplicates": self.duplicates,
+                "throttle_time": self.throttle_time, "latency": self.latency.snapshot()}
@@ -0,0 +1,105 @@
+import threading
+import time
+
+#concurrency control of a transaction reading a snapshot, its writes lock like 2PL
+SNAPSHOT = "snapshot"
+
+#abort cause of a snapshot transaction updating a record that changed after its snapshot (first updater wins)
+SNAPSHOT_CONFLICT = "snapshot"
+
+"""
+# Multi-version snapshot reads
+# The tail records of a base record are its versions, newest first through their indirection column. The TIMESTAMP
+# column of a version holds when it became visible: for a record written outside of a transaction the time its update
+# pointed the base record at it (installed sets it), the commit time for one a transaction wrote (commit sets it). Until
+# then the tail rid is in the uncommitted set of its table. A snapshot transaction reads every record as of its start timestamp without any lock: the newest
+# version visible at that time. Merged tail records are still read as versions, but a merge overwrites the values of the
+# base record itself. The start timestamps of the running snapshots are kept so a merge can wait until none of them is
+# older than the tails it folds in, a snapshot that sees none of the versions of a record reads the base values it began with
+"""
+clock_latch = threading.Lock() #snapshots start and commits become visible one at a time, both are atomic to readers
+last_timestamp = 0
+current = threading.local() #snapshot start and tail rids written by the transaction running on this thread
+running = set() #start timestamps of the running snapshots, they are unique
+
+#unique increasing timestamp in nanoseconds, comparable to the time_ns() written by queries
+def __next_timestamp__():
+    global last_timestamp
+    last_timestamp = max(last_timestamp + 1, time.time_ns())
+    return last_timestamp
+
+def now():
+    with clock_latch:
+        return __next_timestamp__()
+
+#start timestamp of a new snapshot, running until end_snapshot is called with it
+def start_snapshot():
+    with clock_latch:
+        timestamp = __next_timestamp__()
+        running.add(timestamp)
+        return timestamp
+
+def end_snapshot(timestamp):
+    with clock_latch:
+        running.discard(timestamp)
+
+#start of the oldest running snapshot, None if none is running
+def oldest_snapshot():
+    with clock_latch:
+        return min(running) if len(running) != 0 else None
+
+#start tracking the writes of a transaction on this thread, with a snapshot for its reads if snapshot is set
+def begin(snapshot = False):
+    if getattr(current, "start", None) is not None: #left by a run that raised
+        end_snapshot(current.start)
+    current.written = []
+    current.start = start_snapshot() if snapshot else None
+
+#start timestamp of the snapshot transaction running on this thread, None for other transactions
+def snapshot():
+    return getattr(current, "start", None)
+
+#a tail record was written, hidden from snapshots and merges until the transaction running on this thread commits or,
+#outside of a transaction, until the update installed it. Called by the update under the tail latch, before the base
+#indirection points at it
+def wrote(table, tail_rid):
+    table.uncommitted.add(tail_rid)
+    written = getattr(current, "written", None)
+    if written is not None:
+        written.append((table, tail_rid))
+
+#the base indirection points at a tail record now, one written outside of a transaction becomes visible at once.
+#Stamped under the clock latch like a commit: a snapshot that started before sees the version before it
+def installed(table, tail_rid):
+    if getattr(current, "written", None) is not None: #commit makes it visible
+        return
+    with clock_latch:
+        table.__set_timestamp__(tail_rid, __next_timestamp__())
+        table.uncommitted.discard(tail_rid)
+
+#True if the tail record was written by the transaction running on this thread
+def own(table, tail_rid):
+    return tail_rid in table.uncommitted and (table, tail_rid) in getattr(current, "written", ())
+
+#make the writes visible at the commit timestamp, called once the commit record is on disk
+def commit():
+    written = getattr(current, "written", None) or []
+    if len(written) != 0:
+        with clock_latch:
+            timestamp = __next_timestamp__()
+            for table, tail_rid in written:
+                table.__set_timestamp__(tail_rid, timestamp)
+                table.uncommitted.discard(tail_rid)
+    end()
+
+#the rollback invalidated the tail records, they only leave the uncommitted sets
+def abort():
+    for table, tail_rid in getattr(current, "written", None) or []:
+        table.uncommitted.discard(tail_rid)
+    end()
+
+def end():
+    if getattr(current, "start", None) is not None:
+        end_snapshot(current.start)
+    current.written = None
+    current.start = None
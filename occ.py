@@ -0,0 +1,77 @@
+from lstore.mvcc import SNAPSHOT
+import lstore.lock
+import threading
+
+#concurrency control of a transaction
+TWO_PL = "2pl" #strict two phase locking, every read and write locks its record as it runs
+OCC = "occ" #optimistic: reads take no locks, writes are buffered and installed after a validation at commit
+Concurrency_modes = [TWO_PL, OCC, SNAPSHOT] #SNAPSHOT reads without locks and writes like 2PL, see mvcc.py
+
+#abort cause of an optimistic transaction whose read set changed or was being written
+VALIDATION = "validation"
+
+current = threading.local() #read and write sets of the optimistic transaction running on this thread
+
+"""
+# Read and write sets of an optimistic transaction
+# reads: (table, base rid) -> base indirection seen by the first read, the version of the record
+# writes: (table, base rid or None for an insert, query, args) in order, replayed through the 2PL paths at commit
+# overlay: (table, base rid) -> columns after the buffered updates, so the transaction reads its own writes
+"""
+class ReadWriteSet():
+    def __init__(self):
+        self.reads = {}
+        self.writes = []
+        self.overlay = {}
+
+    #record the version of a record before reading it, False if a 2PL transaction is writing it
+    def read(self, table, rid):
+        if table.is_write_locked(rid):
+            lstore.lock.failures.cause = VALIDATION
+            return False
+        if (table, rid) not in self.reads:
+            self.reads[(table, rid)] = table.__return_base_indirection__(rid)
+        return True
+
+    #check again once the record was read, a writer that locked it meanwhile may have shown uncommitted values
+    def check(self, table, rid):
+        if table.is_write_locked(rid):
+            lstore.lock.failures.cause = VALIDATION
+            return False
+        return True
+
+    def buffer(self, table, rid, query, args):
+        self.writes.append((table, rid, query, args))
+
+    def tables(self):
+        return set(table for table, rid in self.reads) | set(write[0] for write in self.writes)
+
+    """
+    # Validation, called on the committing thread after the read phase
+    # The rids written are locked exclusive first (no waiting, a conflict fails) so no other transaction can change them
+    # until the writes are installed and the locks released at commit. Then every record read must still have the
+    # version it was read at and not be locked by a writer. A read only transaction validates without any lock:
+    # each record was current from its read to its check, and every read happened before the first check
+    """
+    def validate(self):
+        for table, rid, query, args in self.writes:
+            if rid is not None and not table.acquire_write(rid, timeout = 0):
+                lstore.lock.failures.cause = VALIDATION
+                return False
+        for (table, rid), version in self.reads.items():
+            if table.is_write_locked(rid) or table.__return_base_indirection__(rid) != version:
+                lstore.lock.failures.cause = VALIDATION
+                return False
+        return True
+
+def begin():
+    lstore.lock.failures.cause = None
+    current.rw_set = ReadWriteSet()
+    return current.rw_set
+
+def end():
+    current.rw_set = None
+
+#read and write sets of the optimistic transaction in its read phase on this thread, None otherwise
+def active():
+    return getattr(current, "rw_set", None)
@@ -1,4 +1,15 @@
 import lstore.config
+from lstore.compression import decompress_page
+from array import array
+import sys
+import threading
+
+try:
+	import numpy #optional, the batch apis fall back to array copies without it
+except ImportError:
+	numpy = None
+
+BIG_ENDIAN = sys.byteorder == "big" #page words are big endian, array('q') is native
 
 class Page:
 
@@ -6,6 +17,7 @@ class Page:
 		self.num_records = 1 #reserve the 0th index for the tps
 		self.data = bytearray(lstore.config.PageLength)
 		self.dirty = False
+		self.cold = False #merged base page that gets no more inserts, stored compressed (see compression.py)
 
 	def has_capacity(self):
 		return (lstore.config.PageEntries - self.num_records) > 0
@@ -16,8 +28,6 @@ class Page:
 	#If return value is > -1, successful write and returns index written at. Else, need to allocate new page
 	def write(self, value):
 		if self.has_capacity():
-			self.dirty = True
-
 			if isinstance(value, int):
 				valueInBytes = value.to_bytes(8, "big")
 			elif isinstance(value, str):
@@ -28,28 +38,144 @@ class Page:
 			
 			self.data[self.num_records * 8 : (self.num_records + 1) * 8] = valueInBytes
 			self.num_records += 1
+			self.dirty = True #set after the change, a write back clearing it meanwhile leaves the page dirty
 			return self.num_records - 1
 
 		return -1
 
+	#write value at index and count the records up to it. The table places a record at the same slot of every column page
+	#of its range, the pages of a range are written back one by one and may come back from disk with different counts
+	def write_at(self, index, value):
+		self.data[index * 8 : (index + 1) * 8] = (value if isinstance(value, int) else 0).to_bytes(8, "big")
+		self.num_records = max(self.num_records, index + 1)
+		self.dirty = True
+
 	def read(self, index):
 		result = int.from_bytes(self.data[index * 8 : (index + 1) * 8], "big")
 		return result
 
 	def update_tps(self, value):
-		self.dirty = True
 		valueInBytes = value.to_bytes(8, "big")
 		self.data[0 : 8] = valueInBytes
+		self.dirty = True
 
 	def get_tps(self):
 		result = int.from_bytes(self.data[0 : 8], "big")
 		return result
 
 	def inplace_update(self, index, value):
-		self.dirty = True
 		if isinstance(value, int):
 			valueInBytes = value.to_bytes(8, "big")
 		elif isinstance(value, str):
 			valueInBytes = str.encode(value)
 
-		self.data[index * 8 : (index + 1) * 8] = valueInBytes
\ No newline at end of file
+		self.data[index * 8 : (index + 1) * 8] = valueInBytes
+		self.dirty = True
+
+	"""
+	# Batch access to the page words, slot i holds the int64 at data[8 * i : 8 * (i + 1)]
+	# With NumPy the data is viewed in place as '>i8' and the results are int64 numpy arrays,
+	# without it the words are copied through an array('q') and the results are arrays of 'q'
+	"""
+	#int64 view of the page data, writes through it change the page (mark it dirty yourself). None without NumPy
+	def view(self):
+		if numpy is None:
+			return None
+		return numpy.frombuffer(self.data, dtype = ">i8")
+
+	#values of the slots start to end, by default every record after the tps slot
+	def read_range(self, start = 1, end = None):
+		end = self.num_records if end is None else end
+		if numpy is not None:
+			return self.view()[start : end].astype(numpy.int64)
+		values = array('q', bytes(self.data[start * 8 : end * 8]))
+		if not BIG_ENDIAN:
+			values.byteswap()
+		return values
+
+	#values of the given slots, in order
+	def gather(self, slots):
+		if numpy is not None:
+			return self.view()[numpy.asarray(slots, dtype = numpy.intp)].astype(numpy.int64)
+		words = self.read_range(0, lstore.config.PageEntries)
+		return array('q', [words[slot] for slot in slots])
+
+	#set the given slots to the values, slots[i] gets values[i]
+	def scatter(self, slots, values):
+		if len(slots) == 0:
+			return
+		if numpy is not None:
+			self.view()[numpy.asarray(slots, dtype = numpy.intp)] = values
+		else:
+			words = self.read_range(0, lstore.config.PageEntries)
+			for slot, value in zip(slots, values):
+				words[slot] = value
+			if not BIG_ENDIAN:
+				words.byteswap()
+			self.data[:] = words.tobytes()
+		self.dirty = True
+
+	#write the values from slot first on (after the last record by default), returns first or -1 if they don't all fit
+	def write_many(self, values, first = None):
+		count = len(values)
+		first = self.num_records if first is None else first
+		if first + count > lstore.config.PageEntries:
+			return -1
+		if numpy is not None:
+			self.view()[first : first + count] = values
+		else:
+			words = array('q', values)
+			if not BIG_ENDIAN:
+				words.byteswap()
+			self.data[first * 8 : (first + count) * 8] = words.tobytes()
+		self.num_records = max(self.num_records, first + count)
+		self.dirty = True
+		return first
+
+	#set slot i to values[i] (or to values if it is a single int) wherever mask[i] is true, returns the number of slots set
+	def update_where(self, mask, values):
+		if numpy is not None:
+			mask = numpy.asarray(mask, dtype = bool)
+			words = self.view()[: len(mask)]
+			words[mask] = values if isinstance(values, int) else numpy.asarray(values, dtype = numpy.int64)[mask]
+			updated = int(mask.sum())
+		else:
+			updated = 0
+			for slot, selected in enumerate(mask):
+				if selected:
+					self.data[slot * 8 : (slot + 1) * 8] = (values if isinstance(values, int) else values[slot]).to_bytes(8, "big")
+					updated += 1
+		if updated != 0:
+			self.dirty = True
+		return updated
+
+	#pages in mmap mode are views of the mapped file, a copy gets its own buffer
+	def __deepcopy__(self, memo):
+		new_page = Page()
+		new_page.num_records = self.num_records
+		new_page.data = bytearray(self.data)
+		new_page.dirty = self.dirty
+		new_page.cold = self.cold
+		return new_page
+
+#cold page read in its compressed form, the data is only rebuilt the first time something touches it
+#a page that is evicted again without being read is written back from its blob
+class CompressedPage(Page):
+
+	def __init__(self, num_records, blob):
+		self.num_records = num_records
+		self.dirty = False
+		self.cold = True
+		self.blob = blob
+		self.latch = threading.Lock() #the first reader decompresses, the others wait for its data
+
+	def __getattr__(self, name): #only called while data is missing
+		if name != "data":
+			raise AttributeError(name)
+		with self.latch:
+			data = self.__dict__.get("data")
+			if data is None:
+				data = decompress_page(self.blob)
+				self.data = data #set before the blob is dropped, a write back uses one or the other
+				self.blob = None
+		return data
@@ -1,11 +1,14 @@
-from lstore.table import Table, Record
+from lstore.table import Table, Record, RID_COLUMN
 from lstore.index import Index
-from time import process_time
+from lstore.logger import AUTOCOMMIT, current_transaction
+import lstore.lock
+import lstore.mvcc
+import lstore.occ
+from time import time_ns
 import struct
+from array import array
 import lstore.config
 import threading
-from datetime import datetime
-import threading
 
 #if any new_columns are None type, give it the old_columns values
 def compare_cols(old_columns, new_columns):
@@ -25,7 +28,12 @@ class Query:
     # Returns True upon succesful deletion
     # Return False if record doesn't exist or is locked due to 2PL
     def delete(self, key):
+        key = self.table.__search_value__(key, self.table.key)
         rid = self.index.locate(key, self.table.key)[0] 
+        rw_set = lstore.occ.active()
+        if rw_set is not None: #optimistic transaction, deleted once it validates
+            rw_set.buffer(self.table, rid, self.delete, (key,))
+            return True, self.table, rid
         self.table.__delete__(rid)
         self.index.drop_index(key)
         return True, self.table, rid
@@ -35,28 +43,54 @@ class Query:
     # Returns False if insert fails for whatever reason
     def insert(self, *columns):
         base_rid = 0
-        timestamp = process_time()
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        rw_set = lstore.occ.active()
+        if rw_set is not None: #optimistic transaction, inserted once it validates
+            rw_set.buffer(self.table, None, self.insert, columns)
+            return True, self.table, base_rid
+        timestamp = time_ns() #int64 nanoseconds, stored as is
 
         indirection_index = 0
         key_index = self.table.key
-        rid = self.table.base_RID
-        columns = [indirection_index, rid, timestamp, base_rid] + list(columns)
+        rid = self.table.__next_base_rid__()
+        columns = [indirection_index, rid, timestamp, base_rid] + self.table.__encode__(list(columns)) #strings are stored as dictionary codes
 
         self.table.__insert__(columns) #table insert
         self.index.add_index(rid, columns[lstore.config.Offset:])
 
-        self.table.base_RID += 1
-
         # Insert is not being tested so might not need this statement
         return True, self.table, base_rid
 
+    # Insert many records at once, rows is a list of records (each a list of column values) or a NumPy 2-D array
+    # The rids are allocated as one block and the base pages are filled a whole run of records at a time
+    # Return True upon succesful insertion
+    def insert_many(self, rows):
+        base_rid = 0
+        rw_set = lstore.occ.active()
+        if rw_set is not None: #optimistic transaction, inserted once it validates
+            rw_set.buffer(self.table, None, self.insert_many, (rows,))
+            return True, self.table, base_rid
+        columns = self.table.__encode_columns__(rows) #strings are stored as dictionary codes
+        count = len(columns[0])
+        if count == 0:
+            return True, self.table, base_rid
+        timestamp = time_ns()
+
+        first_rid = self.table.__next_base_rids__(count)
+        rids = array('q', range(first_rid, first_rid + count))
+        zeros = array('q', bytes(8 * count)) #indirection and base rid
+        self.table.__insert_many__([zeros, rids, array('q', [timestamp]) * count, zeros] + columns)
+        self.index.add_many(rids, columns)
+        return True, self.table, base_rid
+
     # Read a record with specified key
     # Returns a list of Record objects upon success
     # Returns False if record locked by TPL
     # Assume that select will never be called on a key that doesn't exist
     def select(self, key, column, query_columns):
         thread_lock = threading.RLock()
+        key = self.table.__search_value__(key, column)
+        rw_set = lstore.occ.active() #optimistic transactions record the version they read instead of locking
+        snapshot = lstore.mvcc.snapshot() #snapshot transactions read the versions visible when they started, no locks
         thread_lock.acquire()
         entries = self.index.locate(key, column)
         thread_lock.release()
@@ -69,7 +103,13 @@ class Query:
                 thread_lock.release()
                 return False, self.table, rid #return false to the transaction class if rid not found or abort because of locks
                 # T F - thread has write lock, # F T - write lock is zero so can get read lock, T T - write lock held by someon else
-            if self.table.acquire_read(rid) == False:
+            if rw_set is not None:
+                if not rw_set.read(self.table, rid):
+                    thread_lock.release()
+                    return False, self.table, rid
+            elif snapshot is not None:
+                pass
+            elif self.table.acquire_read(rid) == False:
                 print("select returned false because of locking error: tid is " + str(threading.get_ident()) + "outstanding_write rid is" + str(rid))
                 thread_lock.release()
                 return False, self.table, rid
@@ -82,9 +122,17 @@ class Query:
 
         result = []
         for i in range(len(rids)):
+            if rw_set is not None and (self.table, rids[i]) in rw_set.overlay: #written by this transaction
+                columns = rw_set.overlay[(self.table, rids[i])]
+                result.append(Record(rids[i], columns[self.table.key], [columns[column_index] for column_index in range(self.table.num_columns) if query_columns[column_index] == 1]))
+                continue
             thread_lock.acquire()
-            result.append(self.table.__read__(rids[i], query_columns))
+            record = self.table.__read__(rids[i], query_columns, snapshot)
             thread_lock.release()
+            if record is not None: #None for a record inserted after the snapshot
+                result.append(record)
+            if rw_set is not None and not rw_set.check(self.table, rids[i]):
+                return False, self.table, rids[i]
         return result, self.table, None #TODO: inspect this later, might be a faulty way of returning the last value
 
     # Update a record with specified key and columns
@@ -92,37 +140,49 @@ class Query:
     # Returns False if no records exist with given key or if the target record cannot be accessed due to 2PL locking
     def update(self, key, *columns):
         thread_lock = threading.RLock()
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        timestamp = time_ns() #replaced when the update becomes visible (see mvcc.py)
         indirection_index = 0
 
-        thread_lock.acquire()
-        rid = self.table.tail_RID
-        self.table.tail_RID -= 1
-        thread_lock.release()
-
-        old_columns = self.select(key, self.table.key, [1] * self.table.num_columns)[0][0].columns #get every column and compare to the new one: cumulative update
+        old_records = self.select(key, self.table.key, [1] * self.table.num_columns)[0]
+        if old_records == False or len(old_records) == 0: #locked by another transaction, the caller aborts
+            return False, self.table, None
+        old_columns = old_records[0].columns #get every column and compare to the new one: cumulative update
         new_columns = list(columns)
 
-        old_rid = self.index.locate(key, self.table.key)[0] #get the IndexEntry of the old key val
+        old_rid = self.index.locate(self.table.__search_value__(key, self.table.key), self.table.key)[0] #get the IndexEntry of the old key val
+        rw_set = lstore.occ.active()
+        if rw_set is not None: #optimistic transaction, the update is installed once it validates
+            rw_set.overlay[(self.table, old_rid)] = compare_cols(old_columns, new_columns)
+            rw_set.buffer(self.table, old_rid, self.update, (key,) + columns)
+            return True, self.table, old_rid
 
         #2PL: acquire exlcusive locks
         thread_lock.acquire()
-        if self.table.acquire_write(rid) == False or self.table.acquire_write(old_rid) == False:
+        if self.table.acquire_write(old_rid) == False:
             thread_lock.release()
             return False, self.table, old_rid #return false to the transaction class if rid not found or abort
         thread_lock.release()
+        snapshot = lstore.mvcc.snapshot()
+        if snapshot is not None and not self.table.__is_current__(old_rid, snapshot): #updated since the snapshot, first updater wins
+            lstore.lock.failures.cause = lstore.mvcc.SNAPSHOT_CONFLICT
+            return False, self.table, old_rid
 
-        compared_cols = compare_cols(old_columns, new_columns)
-        columns = [indirection_index, rid, timestamp, old_rid] + compared_cols
-        self.table.__update__(columns, old_rid) #add record to tail pages
+        compared_cols = self.table.__encode__(compare_cols(old_columns, new_columns))
+        columns = [indirection_index, None, timestamp, old_rid] + compared_cols
+        self.table.__update__(columns, old_rid) #add record to tail pages, its rid is allocated there
+        rid = columns[RID_COLUMN]
 
-        old_indirection = self.table.__return_base_indirection__(old_rid) #base record, do not update index only insert
+        try:
+            old_indirection = self.table.__return_base_indirection__(old_rid) #base record, do not update index only insert
 
-        thread_lock.acquire()
-        self.table.__update_indirection__(rid, old_indirection) #tail record gets base record's indirection index
-        self.table.__update_indirection__(old_rid, rid) #base record's indirection column gets latest update RID
-        self.index.update_index(old_rid, compared_cols)
-        thread_lock.release()
+            thread_lock.acquire()
+            self.table.__update_indirection__(rid, old_indirection) #tail record gets base record's indirection index
+            self.table.__update_indirection__(old_rid, rid) #base record's indirection column gets latest update RID
+            self.index.update_index(old_rid, compared_cols)
+            thread_lock.release()
+        finally: #never left hidden, merges of the range would wait for it
+            self.table.__installed__(old_rid)
+            lstore.mvcc.installed(self.table, rid)
 
         return True, self.table, old_rid
 
@@ -133,17 +193,51 @@ class Query:
     """
     # Returns the summation of the given range upon success
     # Returns False if no record exists in the given range
+    # A snapshot transaction, and a sum run outside of any transaction, reads a snapshot without locks. A 2PL
+    # transaction locks every base range it reads from once instead of each record, optimistic ones validate every record
+    # Range locks are only taken inside a 2PL transaction: they are held until it commits or aborts, a sum returning
+    # False makes it abort and release them. Outside of a transaction nothing would release them, so the snapshot path
+    # is always taken there whatever the concurrency control of the table
     def sum(self, start_range, end_range, aggregate_column_index):
         result = 0
-        for key in range(start_range, end_range + 1):
-            temp_record = (self.select(key, self.table.key, [1] * self.table.num_columns)[0])
-            if temp_record == False:
-                return False, self.table
-            if temp_record == -1 or len(temp_record) == 0:
-                continue
-            result += temp_record[0].columns[aggregate_column_index]
+        if lstore.occ.active() is not None:
+            for key in range(start_range, end_range + 1):
+                temp_record = (self.select(key, self.table.key, [1] * self.table.num_columns)[0])
+                if temp_record == False:
+                    return False, self.table, None
+                if temp_record == -1 or len(temp_record) == 0:
+                    continue
+                result += temp_record[0].columns[aggregate_column_index]
+            return result, self.table, None
+
+        query_columns = [0] * self.table.num_columns
+        query_columns[aggregate_column_index] = 1 #only the aggregated column is loaded
+        snapshot = lstore.mvcc.snapshot()
+        own_snapshot = snapshot is None and current_transaction() == AUTOCOMMIT #not in a transaction, never locks
+        if own_snapshot:
+            snapshot = lstore.mvcc.start_snapshot() #registered so merges keep the base values it may read
+        try:
+            ranges = set() #base ranges locked shared
+            for key in range(start_range, end_range + 1):
+                entries = self.index.locate(key, self.table.key)
+                if len(entries) == 0:
+                    continue
+                if snapshot is None:
+                    if lstore.lock.is_wounded(): #a writer waits on the ranges this scan holds
+                        return False, self.table, None
+                    offset = self.table.__range_of__(entries[0])
+                    if offset not in ranges:
+                        if not self.table.acquire_range_read(offset):
+                            return False, self.table, None
+                        ranges.add(offset)
+                record = self.table.__read__(entries[0], query_columns, snapshot)
+                if record is not None:
+                    result += record.columns[0]
+        finally:
+            if own_snapshot:
+                lstore.mvcc.end_snapshot(snapshot)
 
-        return result, self.table
+        return result, self.table, None
 
 
     """
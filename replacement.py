@@ -0,0 +1,181 @@
+import lstore.config
+from collections import OrderedDict
+import heapq
+import itertools
+
+"""
+# Replacement policies of the buffer pool
+# A policy tracks the frames in use: admit(frame, key) when a frame is filled with the range at key, access(frame) on
+# every hit and victim(pinned) to pick the frame to evict, skipping the frames for which pinned(frame) is true.
+# The victim is forgotten by the policy, the buffer pool admits the frame again once it holds the new range (or once the
+# eviction is over for a victim whose range was busy), hits on a frame the policy doesn't track meanwhile are ignored.
+# victim returns None when every frame is pinned.
+"""
+class ReplacementPolicy():
+    def __init__(self, size):
+        self.size = size
+
+    def admit(self, frame, key):
+        pass
+
+    def access(self, frame):
+        pass
+
+    def victim(self, pinned):
+        return None
+
+#least frequently used with lifetime counts, a linear scan per eviction, kept as the baseline to compare against
+class LFUPolicy(ReplacementPolicy):
+    def __init__(self, size):
+        self.size = size
+        self.accesses = {} # frame to number of accesses since it was filled
+
+    def admit(self, frame, key):
+        self.accesses[frame] = 1
+
+    def access(self, frame):
+        if frame in self.accesses:
+            self.accesses[frame] += 1
+
+    def victim(self, pinned):
+        victim = None
+        for frame, count in self.accesses.items():
+            if not pinned(frame) and (victim is None or count < self.accesses[victim]):
+                victim = frame
+        if victim is not None:
+            del self.accesses[victim]
+        return victim
+
+#second chance: a hand sweeps the frames clearing reference bits and takes the first unpinned frame without one
+class ClockPolicy(ReplacementPolicy):
+    def __init__(self, size):
+        self.size = size
+        self.referenced = [False] * size
+        self.used = [False] * size
+        self.hand = 0
+
+    def admit(self, frame, key):
+        self.used[frame] = True
+        self.referenced[frame] = True
+
+    def access(self, frame):
+        self.referenced[frame] = True
+
+    def victim(self, pinned):
+        for step in range(2 * self.size): #after two sweeps every unpinned frame has lost its bit
+            frame = self.hand
+            self.hand = (self.hand + 1) % self.size
+            if not self.used[frame] or pinned(frame):
+                continue
+            if self.referenced[frame]:
+                self.referenced[frame] = False
+                continue
+            self.used[frame] = False
+            return frame
+        return None
+
+#LRU-K: evicts the frame whose K-th most recent access is the oldest, frames with fewer than K accesses go first (oldest first)
+#the K-th access times sit in a heap with lazy deletion, stale entries are dropped as they surface and the heap is rebuilt
+#from the live entries once it holds more than a few per tracked frame, hits without evictions don't grow it for ever
+class LRUKPolicy(ReplacementPolicy):
+    def __init__(self, size, k = 2):
+        self.size = size
+        self.k = k
+        self.clock = itertools.count()
+        self.history = {} # frame to its last k access times, oldest first
+        self.heap = [] # (k-th most recent access or -1, first access, frame)
+
+    def __push__(self, frame):
+        times = self.history[frame]
+        heapq.heappush(self.heap, (times[0] if len(times) == self.k else -1, times[0], frame))
+        if len(self.heap) > 4 * len(self.history) + 4: #too many stale entries, rebuild from the live ones
+            self.__compact__()
+
+    def __compact__(self):
+        self.heap = [entry for entry in self.heap if self.__current__(entry)]
+        heapq.heapify(self.heap)
+
+    def admit(self, frame, key):
+        self.history[frame] = [next(self.clock)]
+        self.__push__(frame)
+
+    def access(self, frame):
+        times = self.history.get(frame)
+        if times is None:
+            return
+        times.append(next(self.clock))
+        if len(times) > self.k:
+            del times[0]
+        self.__push__(frame)
+
+    def __current__(self, entry):
+        distance, first, frame = entry
+        times = self.history.get(frame)
+        return times is not None and times[0] == first and distance == (times[0] if len(times) == self.k else -1)
+
+    def victim(self, pinned):
+        skipped = []
+        victim = None
+        while len(self.heap) != 0:
+            entry = heapq.heappop(self.heap)
+            if not self.__current__(entry):
+                continue
+            if pinned(entry[2]):
+                skipped.append(entry)
+                continue
+            victim = entry[2]
+            del self.history[victim]
+            break
+        for entry in skipped:
+            heapq.heappush(self.heap, entry)
+        return victim
+
+#2Q: new ranges enter a FIFO (A1in), ranges referenced again after leaving it (remembered by key in A1out) go to an LRU (Am)
+#a one off scan only ever cycles through A1in and can't flush the hot ranges in Am
+class TwoQPolicy(ReplacementPolicy):
+    def __init__(self, size):
+        self.size = size
+        self.in_size = max(1, size // 4)
+        self.out_size = max(1, size // 2)
+        self.a1_in = OrderedDict() # frame to key, fifo
+        self.a1_out = OrderedDict() # keys evicted from a1_in, fifo of ghosts
+        self.am = OrderedDict() # frame to key, lru order
+
+    def admit(self, frame, key):
+        if key in self.a1_out:
+            del self.a1_out[key]
+            self.am[frame] = key
+        else:
+            self.a1_in[frame] = key
+
+    def access(self, frame):
+        if frame in self.am:
+            self.am.move_to_end(frame)
+        #a hit in a1_in is left alone, correlated references don't promote
+
+    def __take__(self, queue, pinned):
+        for frame in queue:
+            if not pinned(frame):
+                return frame, queue.pop(frame)
+        return None, None
+
+    def victim(self, pinned):
+        frame = None
+        if len(self.a1_in) >= self.in_size or len(self.am) == 0:
+            frame, key = self.__take__(self.a1_in, pinned)
+            if frame is not None:
+                self.a1_out[key] = True
+                if len(self.a1_out) > self.out_size:
+                    self.a1_out.popitem(last = False)
+                return frame
+        frame, key = self.__take__(self.am, pinned)
+        if frame is None:
+            frame, key = self.__take__(self.a1_in, pinned)
+        return frame
+
+Policies = {"LFU": LFUPolicy, "CLOCK": ClockPolicy, "LRU-K": LRUKPolicy, "2Q": TwoQPolicy}
+
+def make_policy(name, size):
+    if name not in Policies:
+        raise ValueError("unknown eviction policy " + str(name))
+    return Policies[name](size)
@@ -0,0 +1,80 @@
+import lstore.config
+import threading
+import time
+
+"""
+# Buffer pool and disk io statistics
+# A single collector is shared by the buffer pool and every disk, like the file pool. Counters are kept per table,
+# bytes read and written per file and latencies in histograms of power of two microsecond buckets.
+# With CollectStats off the hooks only test a flag.
+"""
+class Histogram():
+    def __init__(self):
+        self.buckets = [0] * 40 # bucket b counts the samples below 2**b microseconds
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, seconds):
+        self.buckets[min(int(seconds * 1000000).bit_length(), len(self.buckets) - 1)] += 1
+        self.count += 1
+        self.total += seconds
+
+    #upper bound in microseconds of the bucket holding the given fraction of the samples
+    def percentile(self, fraction):
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if count != 0 and seen >= fraction * self.count:
+                return 2 ** bucket
+        return 0
+
+    def snapshot(self):
+        return {"count": self.count, "mean_us": self.total * 1000000 / max(1, self.count),
+                "p50_us": self.percentile(0.5), "p99_us": self.percentile(0.99),
+                "buckets_us": dict((2 ** bucket, count) for bucket, count in enumerate(self.buckets) if count != 0)}
+
+class Stats():
+    def __init__(self):
+        self.enabled = lstore.config.CollectStats
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.tables = {} # table name to counter name to value
+            self.files = {} # file path to [bytes read, bytes written]
+            self.latency = {} # operation to Histogram
+
+    def count(self, name, counter, amount = 1):
+        with self.lock:
+            counters = self.tables.setdefault(name, {})
+            counters[counter] = counters.get(counter, 0) + amount
+
+    def io(self, path_name, read = 0, written = 0):
+        with self.lock:
+            totals = self.files.setdefault(path_name, [0, 0])
+            totals[0] += read
+            totals[1] += written
+
+    def time(self, operation, seconds):
+        with self.lock:
+            if operation not in self.latency:
+                self.latency[operation] = Histogram()
+            self.latency[operation].add(seconds)
+
+    def snapshot(self):
+        with self.lock:
+            return {"tables": dict((name, dict(counters)) for name, counters in self.tables.items()),
+                    "files": dict((path_name, {"read": totals[0], "written": totals[1]}) for path_name, totals in self.files.items()),
+                    "latency": dict((operation, histogram.snapshot()) for operation, histogram in self.latency.items())}
+
+stats = Stats()
+
+#time a call into the histogram of the operation, returns the result of the call
+def timed(operation, function, *args):
+    if not stats.enabled:
+        return function(*args)
+    started = time.perf_counter()
+    result = function(*args)
+    stats.time(operation, time.perf_counter() - started)
+    return result
@@ -1,5 +1,10 @@
 from lstore.disk import *
 from lstore.buffer import *
+from lstore.directory import PageDirectory, TailDirectory
+from lstore.dictionary import Dictionary
+from lstore.lock import LockManager, SHARED, EXCLUSIVE
+import lstore.mvcc
+from lstore.logger import INSERT, BULK_INSERT, UPDATE, DELETE, INDIRECTION, RANGE, MERGE, DICTIONARY, AUTOCOMMIT
 from time import time
 import lstore.config
 from pathlib import Path
@@ -9,25 +14,79 @@ import sys
 import pickle
 import copy
 import queue
+from array import array
 
 INDIRECTION_COLUMN = 0
 RID_COLUMN = 1
 TIMESTAMP_COLUMN = 2
 BASE_RID_COLUMN = 3
 
-#only return if there is a page directory file specified, only happens after the db has been closed
+#column types of a table schema, every column is stored as int64, strings as codes of the table dictionary
+INTEGER = "int"
+STRING = "string"
+Column_types = [INTEGER, STRING] #position is the type id stored in the counters file
+
+def directory_file(name, extension):
+    return os.getcwd() + lstore.config.DBName + "/" + name + "/page_directory." + extension
+
+#only return if there is a page directory file specified, only happens after the db has been closed or checkpointed
+#the full directory of the last compaction is followed by the entries changed at every checkpoint since
 def read_page_directory(name):
-    file_name = os.getcwd() + lstore.config.DBName + "/" + name + "/page_directory.pkl"
+    if os.path.exists(directory_file(name, "bin")):
+        page_directory = PageDirectory.load(directory_file(name, "bin"))
+    else:
+        page_directory = PageDirectory() #just return an empty directory
+        if os.path.exists(directory_file(name, "pkl")): #written before the array directory, migrated on the next write
+            with open(directory_file(name, "pkl"), 'rb') as file:
+                page_directory.update(pickle.load(file))
+    for delta in read_page_directory_deltas(name):
+        page_directory.apply_changes(delta)
+    page_directory.changed = (set(), set()) #everything loaded is already on disk
+    return page_directory
+
+#write the whole directory and drop the deltas it now contains
+def write_page_directory(name, page_directory):
+    page_directory.save(directory_file(name, "bin"))
+    for extension in ["pkl", "delta"]:
+        if os.path.exists(directory_file(name, extension)):
+            os.remove(directory_file(name, extension))
+
+#append the entries changed since the last checkpoint, a run per changed chunk (see PageDirectory.take_changes)
+def append_page_directory_delta(name, delta):
+    with open(directory_file(name, "delta"), "ab") as file:
+        file.write(len(delta).to_bytes(8, "big") + delta.tobytes())
+        file.flush()
+        os.fsync(file.fileno())
+
+def read_page_directory_deltas(name):
+    deltas = []
+    if os.path.exists(directory_file(name, "delta")):
+        with open(directory_file(name, "delta"), "rb") as file:
+            data = file.read()
+        position = 0
+        while position + 8 <= len(data):
+            length = int.from_bytes(data[position : position + 8], "big")
+            if position + 8 + 8 * length > len(data): #torn append from a crash mid checkpoint
+                break
+            delta = array('q')
+            delta.frombytes(data[position + 8 : position + 8 + 8 * length])
+            deltas.append(delta)
+            position += 8 + 8 * length
+    return deltas
+
+#tail directory saved by the last close or checkpoint, rebuilt from the range pointers on disk when there is none
+def tail_directory_file(name):
+    return os.getcwd() + lstore.config.DBName + "/" + name + "/tail_directory"
+
+def read_tail_directory(table):
+    file_name = tail_directory_file(table.name)
     if os.path.exists(file_name):
-        with open(file_name, 'rb') as file:
-            return pickle.load(file)
+        table.tail_directory = TailDirectory.load(file_name)
     else:
-        return {} #just return empty dict
+        table.__rebuild_tail_directory__()
 
-def write_page_directory(name, page_directory):
-    file_name = os.getcwd() + lstore.config.DBName + "/" + name + "/page_directory.pkl"
-    with open(file_name, "wb") as file:
-        pickle.dump(page_directory, file)
+def write_tail_directory(table):
+    table.tail_directory.save(tail_directory_file(table.name))
 
 def read_counters(name):
     counters = []
@@ -36,6 +95,13 @@ def read_counters(name):
         with open(file_name, "rb") as file:
             for counter in range(6):
                 counters.append(int.from_bytes(file.read(8), "big"))
+            layout = file.read(8) #layout id, missing from databases written before segment files
+            if len(layout) == 8:
+                counters.append(int.from_bytes(layout, "big"))
+            column_type = file.read(8) #then a type id per column, missing from databases written before schemas
+            while len(column_type) == 8:
+                counters.append(int.from_bytes(column_type, "big"))
+                column_type = file.read(8)
         return counters
 
 def write_counters(name, counters):
@@ -66,272 +132,349 @@ class Table:
         self.sum = 0
         self.buffer = buffer_pool
         self.disk = None
-        self.page_directory = {}
-        self.read_lock_manager = {}
-        self.write_lock_manager = {}
-        self.read_lock_manager_latch = False
-        self.write_lock_manager_latch = False
-        self.merge_queue = queue.Queue()
+        self.logger = None #write-ahead log of the database, None when the database was never opened
+        self.layout = lstore.config.DefaultLayout
+        self.types = [INTEGER] * num_columns
+        self.strings = [] #indexes of the STRING columns
+        self.dictionary = None #set once the table directory exists
+        self.page_directory = PageDirectory()
+        self.tail_directory = TailDirectory() #tail ranges of every base range, updates find their tail range without io
+        self.directory_deltas = 0 #checkpoints appended to the delta file since it was last compacted
+        self.lock_manager = LockManager()
+        self.concurrency = lstore.config.Concurrency #of transactions that don't choose, see occ.py
+        self.uncommitted = set() #tail rids of running transactions, no snapshot sees them (see mvcc.py)
+        self.installing = set() #base rids with a tail placed that their indirection doesn't point at yet, reads don't fill the cache
+        self.merge_queue = queue.Queue() #base offsets whose tail chain is due for a merge, drained by the merge daemon
+        self.merger = None #merge daemon of the database (see merge.py)
+        self.range_reads = {} #base offset -> reads since its last merge, counted without a latch to rank merges
+        self.latest = None #latest version cache (see cache.py), None when it is off
 
         self.base_RID = lstore.config.StartBaseRID
         self.tail_RID = lstore.config.StartTailRID
-        self.base_RID_lock = 0
-        self.tail_RID_lock = 0
+        self.rid_latch = threading.Lock() #RID allocation
+        self.base_latch = threading.RLock() #appends to the latest base range
+        self.range_latch = threading.RLock() #range offset counters
+        self.tail_latches = [threading.RLock() for latch in range(lstore.config.BufferStripes)] #appends to a tail chain, striped by base range
         self.base_offset_counter = 0
         self.tail_offset_counter = 0
 
-    def acquire_read(self, rid):
-        #print("acquire_read started")
-        # thread_lock = threading.RLock()
-
-        # thread_lock.acquire()
-        while self.read_lock_manager_latch == True or self.write_lock_manager_latch == True:
-            pass
-
-        self.write_lock_manager_latch = True
-        self.read_lock_manager_latch = True
-        if rid in self.write_lock_manager: 
-            if threading.get_ident() == self.write_lock_manager[rid]:
-                if self.read_lock_manager[rid] == None:
-                    # print("acquiring first new read lock on rid " + str(rid))
-                    self.read_lock_manager[rid] = [threading.get_ident()]
-                elif threading.get_ident() not in self.read_lock_manager[rid]: #only append if not in read lock list for record
-                    # print("appending read lock because not in list")
-                    self.read_lock_manager[rid].append(threading.get_ident())
-                else:
-                    # print("read lock already exists")
-                    self.write_lock_manager_latch = False
-                    self.read_lock_manager_latch = False
-                    # thread_lock.release()
-                    return True
-            else:
-                #print("acquiring read lock on value with a non-native exclusive lock")
-                self.write_lock_manager_latch = False
-                self.read_lock_manager_latch = False
-                # thread_lock.release()
-                return False #rid is in the outstanding writes, being used by another thread
-        elif rid in self.read_lock_manager:
-            if threading.get_ident() in self.read_lock_manager[rid]:
-                # print("read lock already exists")
-                self.write_lock_manager_latch = False
-                self.read_lock_manager_latch = False
-                # thread_lock.release()
-                return True
+    def set_types(self, types):
+        self.types = list(types)
+        self.strings = [column_index for column_index in range(self.num_columns) if self.types[column_index] == STRING]
+
+    #codes of the string values of a record, None (not updated) stays None. New codes are logged before the record using them
+    def __encode__(self, columns):
+        for column_index in self.strings:
+            if columns[column_index] is not None:
+                columns[column_index] = self.__code__(columns[column_index])
+        return columns
+
+    #rows given as columns of int64 words, strings as their codes. rows is a sequence of records or a NumPy 2-D array
+    def __encode_columns__(self, rows):
+        if hasattr(rows, "ndim"): #numpy is optional, its arrays are told apart without importing it
+            columns = [rows[:, column_index] for column_index in range(self.num_columns)]
         else:
-            # print("New read lock on thread " + str(threading.get_ident()) + " for rid " + str(rid))
-            self.read_lock_manager[rid] = [threading.get_ident()] #no write lock on record, can read
-            self.write_lock_manager_latch = False
-            self.read_lock_manager_latch = False
-            # thread_lock.release()
-            return True
-
-        self.write_lock_manager_latch = False
-        self.read_lock_manager_latch = False
-
-    def acquire_write(self, rid):
-        #print("acquire_write started")
-        #thread_lock = threading.RLock()
-
-        # thread_lock.acquire()
-        while self.read_lock_manager_latch == True:
-            pass
-
-        self.read_lock_manager_latch = True
-        for thread in threading.enumerate():
-            if rid in self.read_lock_manager: #key exists in read lock manager
-                if thread.ident in self.read_lock_manager[rid] and thread.ident != threading.get_ident(): #check if outstanding read exists
-                    # print("outstanding read exists on this record from a different txn")
-                    # thread_lock.release()
-                    self.read_lock_manager_latch = False
-                    return False
-        self.read_lock_manager_latch = False
-        # thread_lock.release()
-
-        # thread_lock.acquire()
-        while self.write_lock_manager_latch == True:
-            pass
-
-        self.write_lock_manager_latch = True
-        if rid in self.write_lock_manager:
-            # print("rid " + str(rid) + " exists in the lock manager on thread " + str(threading.get_ident()))
-            if threading.get_ident() == self.write_lock_manager[rid]:
-                self.write_lock_manager_latch = False
-                # thread_lock.release()
-                return True
+            columns = list(zip(*rows)) or [()] * self.num_columns
+        for column_index in range(self.num_columns):
+            column = columns[column_index]
+            if self.types[column_index] == STRING:
+                columns[column_index] = array('q', [self.__code__(value) for value in column])
+            elif hasattr(column, "astype"):
+                columns[column_index] = array('q', column.astype("q").tobytes()) #one copy of the whole column
             else:
-                self.write_lock_manager_latch = False
-                # thread_lock.release()
-                return False
-        else:
-            # print("no write lock for rid " + str(rid) + " in the write lock manager, creating new in thread " + str(threading.get_ident()))
-            self.write_lock_manager[rid] = threading.get_ident() #no current write locks on record
-            self.write_lock_manager_latch = False
-            # thread_lock.release()
-            return True
-
+                columns[column_index] = array('q', column)
+        return columns
+
+    def __code__(self, value):
+        code, assigned = self.dictionary.encode(value)
+        if assigned and self.logger is not None:
+            self.logger.append(DICTIONARY, self.name, (code, value), AUTOCOMMIT) #never undone, codes are not reused
+        return code
+
+    #value stored for a search key, None for a string no record holds
+    def __search_value__(self, value, column_index):
+        if self.types[column_index] == STRING and isinstance(value, str):
+            return self.dictionary.lookup(value)
+        return value
+
+    #strings back from the codes of the projected columns of a record
+    def __decode__(self, column_list, query_columns):
+        position = 0
+        for column_index in range(self.num_columns):
+            if query_columns[column_index] == 1:
+                if self.types[column_index] == STRING:
+                    column_list[position] = self.dictionary.decode(column_list[position])
+                position += 1
+        return column_list
+
+    #columns holding the record values, after the metadata columns
+    def __data_columns__(self):
+        return list(range(lstore.config.Offset, lstore.config.Offset + self.num_columns))
+
+    def __next_base_rid__(self):
+        with self.rid_latch:
+            rid = self.base_RID
+            self.base_RID += 1
+        return rid
+
+    #first of count consecutive base rids
+    def __next_base_rids__(self, count):
+        with self.rid_latch:
+            rid = self.base_RID
+            self.base_RID += count
+        return rid
+
+    def __next_tail_rid__(self):
+        with self.rid_latch:
+            rid = self.tail_RID
+            self.tail_RID -= 1
+        return rid
+
+    def __tail_latch__(self, base_offset):
+        return self.tail_latches[(base_offset // lstore.config.FilePageLength) % len(self.tail_latches)]
+
+    #base range holding a rid, None for a rid without a record yet (a tail rid about to be written)
+    def __range_of__(self, rid):
+        try:
+            return self.page_directory[rid][0]
+        except KeyError:
+            return None
+
+    #2PL record locks of the calling thread's transaction, False when another transaction holds a conflicting lock
+    def acquire_read(self, rid, timeout = None):
+        return self.lock_manager.acquire_record(rid, self.__range_of__(rid), SHARED, timeout = timeout)
+
+    def acquire_write(self, rid, timeout = None):
+        return self.lock_manager.acquire_record(rid, self.__range_of__(rid), EXCLUSIVE, timeout = timeout)
+
+    #one shared lock on a whole base range for a scan, writers of any of its records conflict with it
+    def acquire_range_read(self, offset, timeout = None):
+        return self.lock_manager.acquire_range(offset, SHARED, timeout = timeout)
+
+    #True if another transaction holds the record, or its range, exclusive
+    def is_write_locked(self, rid):
+        return self.lock_manager.is_written(rid, self.__range_of__(rid))
+
+    #drop every lock the calling thread holds, at commit or abort
     def release_locks(self):
-        #print("release_locks started")
-        # thread_lock = threading.RLock()
-        write_locks_to_delete = []
-        read_locks_to_delete = []
-
-        # thread_lock.acquire()
-        while self.read_lock_manager_latch == True:
-            pass
-
-        self.read_lock_manager_latch = True
-        for rid in list(self.read_lock_manager.keys()):
-            if threading.get_ident() in self.read_lock_manager[rid]:
-                read_locks_to_delete.append(rid)
-        self.read_lock_manager_latch = False
-        # thread_lock.release()
-
-        # thread_lock.acquire()
-        while self.write_lock_manager_latch == True:
-            pass
-
-        self.write_lock_manager_latch = True
-        for rid in list(self.write_lock_manager.keys()):
-            if threading.get_ident() == self.write_lock_manager[rid]:
-                write_locks_to_delete.append(rid)
-        self.write_lock_manager_latch = False
-        # thread_lock.release()
-
-        while self.read_lock_manager_latch == True or self.write_lock_manager_latch == True:
-            pass
-
-        self.read_lock_manager_latch = True
-        self.write_lock_manager_latch = True
-
-        for rid in read_locks_to_delete:
-            # thread_lock.acquire()
-            self.read_lock_manager[rid].remove(threading.get_ident())
-            # thread_lock.release()
-        for rid in write_locks_to_delete:
-            # thread_lock.acquire()
-            del self.write_lock_manager[rid]
-            # thread_lock.release()
-
-        self.read_lock_manager_latch = False
-        self.write_lock_manager_latch = False
-        #print("release_locks finished\n")
-
-    #TODO: implement TPS calculation
-    def __merge__(self, base_range_copy, tail_range_offsets):
-        for tail_range_offset in reversed(tail_range_offsets): #for every range reversed
-            tail_range = self.buffer.fetch_range(self.name, tail_range_offset)
-            for record_index in range(lstore.config.PageEntries - 1, 0, -1): #for each record backwards, starting at index 511 (PageEntries - 1)
-
-                tail_rid = tail_range[RID_COLUMN].read(record_index)
-                base_rid_for_tail = tail_range[BASE_RID_COLUMN].read(record_index)
+        self.lock_manager.release_all()
+
+    """
+    # Consolidate the tail ranges (oldest first) into new pages of the base data columns, a column at a time
+    # Every base record gets the values of its newest tail record in the ranges, whether its indirection points at it
+    # yet or not: the tps covers every tail merged, a reader finds all of them in the base. Rolled back tails (rid 0)
+    # are skipped. The newest tail of each base slot is found from the rid and base rid columns alone, then every data
+    # column gathers the values of those tails from each range and scatters them into a copy of its base page.
+    # Returns the new pages indexed by column (None for the metadata) and the tps, the smallest tail rid merged
+    """
+    def __merge__(self, base_offset, tail_range_offsets):
+        newest = {} #base slot -> (position of the tail range, tail slot) of its newest tail record
+        tps_value = 0
+        newest_timestamp = 0 #of the tails folded in, snapshots older than it may still need the base values
+        metadata_columns = [RID_COLUMN, TIMESTAMP_COLUMN, BASE_RID_COLUMN]
+        for position, tail_range_offset in enumerate(tail_range_offsets): #oldest range first, newer tails replace older ones
+            tail_range = self.buffer.fetch_range(self.name, tail_range_offset, metadata_columns)
+            try:
+                tail_rids = tail_range[RID_COLUMN].read_range()
+                timestamps = tail_range[TIMESTAMP_COLUMN].read_range()
+                base_rids = tail_range[BASE_RID_COLUMN].read_range()
+            finally: #a merge that fails leaves no page pinned, the daemon tries it again later
+                self.buffer.unpin_range(self.name, tail_range_offset, metadata_columns)
+            for tail_slot, tail_rid, timestamp, base_slot in zip(range(1, len(tail_rids) + 1), tail_rids, timestamps, self.page_directory.slots(base_rids)):
                 if tail_rid == 0: #if the tail record has been invalidated by an aborted transaction
-                    print("deleted tail record found, skipping")
                     continue
+                newest[base_slot] = (position, tail_slot)
+                tps_value = tail_rid #tail rids of a chain shrink in placement order, the newest is the smallest
+                newest_timestamp = max(newest_timestamp, timestamp)
+
+        moves = [([], []) for tail_range_offset in tail_range_offsets] #tail slots and the base slots they go to, per range
+        for base_slot, (position, tail_slot) in newest.items():
+            moves[position][0].append(tail_slot)
+            moves[position][1].append(base_slot)
+
+        data_columns = self.__data_columns__()
+        base_range = self.buffer.fetch_range(self.name, base_offset, data_columns)
+        try:
+            consolidated_range = [None] * lstore.config.Offset + [copy.deepcopy(base_range[column_index]) for column_index in data_columns] #page copies only, base data only changes by merges
+        finally:
+            self.buffer.unpin_range(self.name, base_offset, data_columns)
+        for tail_range_offset, (tail_slots, base_slots) in zip(tail_range_offsets, moves):
+            if len(tail_slots) == 0:
+                continue
+            tail_range = self.buffer.fetch_range(self.name, tail_range_offset, data_columns)
+            try:
+                for column_index in data_columns:
+                    consolidated_range[column_index].scatter(base_slots, tail_range[column_index].gather(tail_slots))
+            finally:
+                self.buffer.unpin_range(self.name, tail_range_offset, data_columns)
+        return (consolidated_range, tps_value, int(newest_timestamp))
 
-                _ , base_record_index = self.page_directory[base_rid_for_tail] #retrieve record index
-                base_indirection = base_range_copy[INDIRECTION_COLUMN].read(base_record_index) #get indirection column for comparison
-
-                if(base_indirection == tail_rid): #tail record is indeed the latest one
-                    for column_index in range(lstore.config.Offset, lstore.config.Offset + self.num_columns): #for each column
-                            tail_page_value = tail_range[column_index].read(record_index)
-                            base_range_copy[column_index].inplace_update(base_record_index, tail_page_value)
-            self.buffer.unpin_range(self.name, tail_range_offset)
-
-        last_tail_range_offset = tail_range_offsets[len(tail_range_offsets) - 1] #last offset 
-        last_tail_range = self.buffer.fetch_range(self.name, last_tail_range_offset)
-        tps_value = last_tail_range[RID_COLUMN].read(lstore.config.PageEntries - 1) #last record in last page is the TPS
-        self.buffer.unpin_range(self.name, last_tail_range_offset)
-
-        return (base_range_copy, tps_value)
-
+    """
+    # Merge every full tail range of a base range, all of its chain but the range updates append to. Called by the
+    # merge daemon, returns False if the merge has to wait: a running transaction wrote into one of the full ranges and
+    # may still roll its tail back, or a running snapshot is older than a tail folded in and may still read the base
+    # values the merge overwrites (see mvcc.py). The new data pages replace the old ones in their frames all at once, then the tps
+    # is raised: a reader that sees the new tps finds the merged values, one that still holds the old pages finishes
+    # with them. The merge is logged with the images of the new pages while the whole base range is pinned, so no write
+    # back puts the raised tps (or the new pages) on disk before redo can install both again
+    """
     def __prepare_merge__(self, base_offset):
-        base_range_copy = copy.deepcopy(self.buffer.fetch_range(self.name, base_offset)) #create a separate copy of the base range to put in the bg thread
-        next_offset = self.disk.get_offset(self.name, 0, base_offset)
-        self.buffer.unpin_range(self.name, base_offset) #update is finished, unpin
-        tail_ranges = []
-
-        counter = 0
-        previous_offset = next_offset
-        tail_offset = next_offset
-
-        while counter != lstore.config.TailMergeLimit and tail_offset != 0:
-            tail_ranges.append(tail_offset)
-            previous_offset = tail_offset
-            tail_offset = self.disk.get_offset(self.name, 0, previous_offset)
-            counter += 1
-
-        if counter < lstore.config.TailMergeLimit:
-            # not enough pages to merge
-            print("somehow counter is les than the tail merge limit, traversal error")
-            return
-
-        consolidated_range, tps_value = self.__merge__(base_range_copy, tail_ranges) #initiate merge, return a consolidated range
-        base_range = self.buffer.fetch_range(self.name, base_offset)
-
-        #get metadata
-        consolidated_range = base_range[:lstore.config.Offset] + consolidated_range[lstore.config.Offset:] #store the base metadata columns and the merged data columns
-        self.buffer.unpin_range(self.name, base_offset) #unpin base_range after consolidation
-        new_offset = (tail_offset if tail_offset == 0 else previous_offset) #either get the last tail_page's offset to point the base page to, or the previous offset if there is no next tail page
-        for column_index in range(lstore.config.Offset + self.num_columns):
-            consolidated_range[column_index].update_tps(tps_value) #update the tps in the consolidated pages before assignment
-            self.disk.update_offset(self.name, column_index, base_offset, tail_offset) #update the offset of the ranges
-
-        # for tail_range in tail_ranges:
-        #     for column_index in range(lstore.config.Offset + self.num_columns):
-        #         tail_range[column_index].empty_page() #empty out the tail pages
-
-        while self.buffer.is_pinned(self.name, base_offset):
-            print("pin count on range is " + str(self.buffer.get_pins(self.name, base_offset)))
-
-        self.buffer.page_map[self.buffer.frame_map[base_offset]] = consolidated_range #update buffer_pool
-
-    def __add_physical_base_range__(self): #calling function is thread safe
-        lock = threading.RLock()
-        lock.acquire()
-        if self.base_offset_counter < self.tail_offset_counter:
-            self.base_offset_counter = self.tail_offset_counter + lstore.config.FilePageLength
-        else:
-            self.base_offset_counter += lstore.config.FilePageLength #increase offset after adding a range
-        self.buffer.add_range(self.name, self.base_offset_counter)
-        lock.release()
-
-    def __add_physical_tail_range__(self, previous_offset_counter): #calling function is thread safe
-        lock = threading.RLock()
-        lock.acquire()
-        if self.tail_offset_counter < self.base_offset_counter:
-            self.tail_offset_counter = self.base_offset_counter + lstore.config.FilePageLength
-        else:
-            self.tail_offset_counter += lstore.config.FilePageLength #increase offset after adding a range
-        self.buffer.add_range(self.name, self.tail_offset_counter)
-        lock.release()
+        with self.__tail_latch__(base_offset): #the chain doesn't grow while it is walked
+            tail_ranges = list(self.tail_directory.chain(base_offset))
+            if len(tail_ranges) <= lstore.config.TailMergeLimit: #merged meanwhile
+                return True
+            tail_offset = tail_ranges.pop() #the current tail range stays chained to the base range
+            if any(self.page_directory[tail_rid][0] in tail_ranges for tail_rid in list(self.uncommitted)): #tails are marked before the latch is released
+                return False
 
-        for column_index in range(lstore.config.Offset + self.num_columns): #update all the offsets
-            lock.acquire()
-            self.disk.update_offset(self.name, column_index, previous_offset_counter, self.tail_offset_counter) #update offset value i
-            lock.release()
+        consolidated_range, tps_value, newest_timestamp = self.__merge__(base_offset, tail_ranges)
+        if tps_value == 0: #every tail was rolled back, the base is already current
+            if self.logger is not None:
+                self.logger.append(MERGE, self.name, (base_offset, tail_offset, tps_value, None), AUTOCOMMIT)
+            self.__unchain__(base_offset, tail_offset, len(tail_ranges))
+            return True
+        oldest = lstore.mvcc.oldest_snapshot() #a snapshot starting from now on sees every tail folded in
+        if oldest is not None and oldest <= newest_timestamp:
+            return False
+        self.range_reads.pop(base_offset, None)
+        for column_index in self.__data_columns__():
+            consolidated_range[column_index].update_tps(tps_value)
+            consolidated_range[column_index].cold = True #the base range is full and merged, its data pages are read-mostly from now on
+
+        base_range = self.buffer.fetch_range(self.name, base_offset) #pinned until the merge is in the log, write backs leave it alone
+        try:
+            self.buffer.swap_range(self.name, base_offset, consolidated_range) #one stripe latch, a fetch sees all the old pages or all the new
+            for column_index in range(lstore.config.Offset): #the metadata pages aren't swapped, base_range still holds them
+                base_range[column_index].update_tps(tps_value)
+            if self.logger is not None:
+                pages = [(consolidated_range[column_index].num_records, bytes(consolidated_range[column_index].data)) for column_index in self.__data_columns__()]
+                self.logger.append(MERGE, self.name, (base_offset, tail_offset, tps_value, pages), AUTOCOMMIT)
+                self.logger.flush()
+        finally:
+            self.buffer.unpin_range(self.name, base_offset)
+        self.__unchain__(base_offset, tail_offset, len(tail_ranges))
+        return True
+
+    #the first count ranges of the chain were merged, the chain goes on at tail_offset
+    def __unchain__(self, base_offset, tail_offset, count):
+        with self.__tail_latch__(base_offset):
+            self.disk.update_range_offset(self.name, base_offset, tail_offset)
+            self.tail_directory.drop(base_offset, count)
+
+    def __add_physical_base_range__(self): #called with the base latch held
+        with self.range_latch:
+            if self.base_offset_counter < self.tail_offset_counter:
+                self.base_offset_counter = self.tail_offset_counter + lstore.config.FilePageLength
+            else:
+                self.base_offset_counter += lstore.config.FilePageLength #increase offset after adding a range
+            self.buffer.add_range(self.name, self.base_offset_counter)
+            if self.logger is not None:
+                self.logger.append(RANGE, self.name, (self.base_offset_counter, self.tail_offset_counter, None), AUTOCOMMIT)
+
+    #returns the offset of the new range, the counter may move on as soon as the range latch is released
+    def __add_physical_tail_range__(self, base_offset, previous_offset_counter): #called with the tail latch of the base range held
+        with self.range_latch:
+            if self.tail_offset_counter < self.base_offset_counter:
+                self.tail_offset_counter = self.base_offset_counter + lstore.config.FilePageLength
+            else:
+                self.tail_offset_counter += lstore.config.FilePageLength #increase offset after adding a range
+            tail_offset = self.tail_offset_counter
+            self.buffer.add_range(self.name, tail_offset)
+
+            if self.logger is not None: #the tail pointer goes straight to disk, the allocation must be in the log before it
+                self.logger.append(RANGE, self.name, (self.base_offset_counter, tail_offset, previous_offset_counter, base_offset), AUTOCOMMIT)
+                self.logger.flush()
+        self.disk.update_range_offset(self.name, previous_offset_counter, tail_offset) #update the offsets of every column
+        self.tail_directory.append(base_offset, tail_offset)
+        return tail_offset
+
+    #timestamp of a record, its commit time when a transaction wrote it
+    def __timestamp__(self, rid):
+        offset, slot_index = self.page_directory[rid]
+        page = self.buffer.fetch_range(self.name, offset, [TIMESTAMP_COLUMN])[TIMESTAMP_COLUMN]
+        timestamp = page.read(slot_index)
+        self.buffer.unpin_range(self.name, offset, [TIMESTAMP_COLUMN])
+        return timestamp
+
+    def __set_timestamp__(self, rid, timestamp):
+        offset, slot_index = self.page_directory[rid]
+        page = self.buffer.fetch_range(self.name, offset, [TIMESTAMP_COLUMN])[TIMESTAMP_COLUMN]
+        page.inplace_update(slot_index, timestamp)
+        self.buffer.unpin_range(self.name, offset, [TIMESTAMP_COLUMN])
+
+    #newest version at or below tail rid that the snapshot sees, 0 for the base record. Merged tail records stay
+    #where they are, and merges wait for the snapshots older than the tails they fold in, so the base is the one it began with
+    def __visible__(self, rid, snapshot):
+        while rid != 0:
+            hidden = rid in self.uncommitted #tested before the timestamp is read, commit sets it before the rid leaves the set
+            offset, slot_index = self.page_directory[rid]
+            tail_range = self.buffer.fetch_range(self.name, offset, [INDIRECTION_COLUMN, RID_COLUMN, TIMESTAMP_COLUMN])
+            valid = tail_range[RID_COLUMN].read(slot_index) != 0 #0 for a rolled back update
+            timestamp = tail_range[TIMESTAMP_COLUMN].read(slot_index)
+            older = tail_range[INDIRECTION_COLUMN].read(slot_index)
+            self.buffer.unpin_range(self.name, offset, [INDIRECTION_COLUMN, RID_COLUMN, TIMESTAMP_COLUMN])
+            if valid and ((timestamp < snapshot and not hidden) or lstore.mvcc.own(self, rid)):
+                return rid
+            rid = older
+        return 0
+
+    #True if the snapshot sees the latest version of a base record, a snapshot transaction may only update those
+    def __is_current__(self, base_rid, snapshot):
+        offset, slot_index = self.page_directory[base_rid]
+        page = self.buffer.fetch_range(self.name, offset, [INDIRECTION_COLUMN])[INDIRECTION_COLUMN]
+        latest = page.read(slot_index)
+        self.buffer.unpin_range(self.name, offset, [INDIRECTION_COLUMN])
+        if latest == 0:
+            return True
+        return self.__visible__(latest, snapshot) == latest
+
+    #snapshot: start timestamp of a snapshot read, the version visible then is read and None returned for a record
+    #inserted after it. Without one the latest version is read, from the latest version cache when it holds the record
+    def __read__(self, RID, query_columns, snapshot = None):
+        latest = self.latest #the database may turn the cache on or off meanwhile
+        if snapshot is None and latest is not None:
+            values = latest.get(RID)
+            if values is not None:
+                column_list = [values[column_index] for column_index in range(self.num_columns) if query_columns[column_index] == 1]
+            elif all(query_columns[column_index] == 1 for column_index in range(self.num_columns)):
+                with self.__tail_latch__(self.page_directory[RID][0]): #no update of the record places its tail meanwhile
+                    filling = RID not in self.installing #tested before the indirection is read, an update points it at its tail first
+                    column_list = self.__read_stored__(RID, query_columns, None)
+                    if filling: #otherwise the values may predate the tail an update put in the cache, which could be evicted by now
+                        latest.fill(RID, column_list)
+            else:
+                column_list = self.__read_stored__(RID, query_columns, None)
+        else:
+            column_list = self.__read_stored__(RID, query_columns, snapshot)
+            if column_list is None:
+                return None
 
+        if len(self.strings) != 0:
+            column_list = self.__decode__(column_list, query_columns)
+        return Record(RID, query_columns[self.key], column_list)
 
-    def __read__(self, RID, query_columns):
-        lock = threading.RLock()
+    #stored values of the projected columns of a record, codes for the string columns
+    def __read_stored__(self, RID, query_columns, snapshot):
         # What the fick tail index and tails slots?
         tail_index = tail_slot_index = -1
         page_index, slot_index = self.page_directory[RID]
-
-        lock.acquire()
-        current_page = self.buffer.fetch_range(self.name, page_index)[INDIRECTION_COLUMN] #index into the physical location
-        lock.release()
-        self.buffer.unpin_range(self.name, page_index)
+        current_page = self.buffer.fetch_range(self.name, page_index, [INDIRECTION_COLUMN])[INDIRECTION_COLUMN] #index into the physical location
+        self.buffer.unpin_range(self.name, page_index, [INDIRECTION_COLUMN])
+        projected_columns = [column_index + lstore.config.Offset for column_index in range(self.num_columns) if query_columns[column_index] == 1] #only these pages are loaded
 
         current_page_tps = current_page.get_tps() #make sure the indirection column hasn't already been merged
+        self.range_reads[page_index] = self.range_reads.get(page_index, 0) + 1
         new_rid = current_page.read(slot_index)
+        if snapshot is not None:
+            if self.__timestamp__(RID) >= snapshot:
+                return None
+            new_rid = self.__visible__(new_rid, snapshot)
+            current_page_tps = 0 #the version seen is read from its tail record, merged or not
         column_list = []
         key_val = -1
         if new_rid != 0 and (current_page_tps == 0 or new_rid < current_page_tps):
             tail_index, tail_slot_index = self.page_directory[new_rid] #store values from tail record
-
-            lock.acquire()
-            current_tail_range = self.buffer.fetch_range(self.name, tail_index)
-            lock.release()
+            current_tail_range = self.buffer.fetch_range(self.name, tail_index, projected_columns)
 
             for column_index in range(lstore.config.Offset, self.num_columns + lstore.config.Offset):
                 if column_index == self.key + lstore.config.Offset:
@@ -341,11 +484,9 @@ class Table:
                     current_tail_page = current_tail_range[column_index] #get tail page from
                     column_val = current_tail_page.read(tail_slot_index)
                     column_list.append(column_val)
-            self.buffer.unpin_range(self.name, tail_index) #unpin at end of transaction
+            self.buffer.unpin_range(self.name, tail_index, projected_columns) #unpin at end of transaction
         else:
-            lock.acquire()
-            current_base_range = self.buffer.fetch_range(self.name, page_index)
-            lock.release()
+            current_base_range = self.buffer.fetch_range(self.name, page_index, projected_columns)
 
             for column_index in range(lstore.config.Offset, self.num_columns + lstore.config.Offset):
                 if column_index == self.key + lstore.config.Offset:
@@ -355,152 +496,185 @@ class Table:
                     current_base_page = current_base_range[column_index]
                     column_val = current_base_page.read(slot_index)
                     column_list.append(column_val)
-            self.buffer.unpin_range(self.name, page_index) #unpin at end of transaction
+            self.buffer.unpin_range(self.name, page_index, projected_columns) #unpin at end of transaction
 
         # check indir column record
         # update page and slot index based on if there is one or nah
-        return Record(RID, key_val, column_list) #return proper record, or -1 on key_val not found
+        return column_list
 
     def __insert__(self, columns):
-        lock = threading.RLock()
-        #returning any page in range will give proper size
-        lock.acquire()
-        current_range = self.buffer.fetch_range(self.name, self.base_offset_counter)[0]
-        lock.release()
+        with self.base_latch: #inserts fill the latest base range one slot at a time
+            #returning any page in range will give proper size
+            current_range = self.buffer.fetch_range(self.name, self.base_offset_counter, [INDIRECTION_COLUMN])[INDIRECTION_COLUMN]
+            self.buffer.unpin_range(self.name, self.base_offset_counter, [INDIRECTION_COLUMN]) #unpin after getting value
+            if not current_range.has_capacity(): #if latest slot index is -1, need to add another range
+                self.__add_physical_base_range__()
+
+            page_index = self.base_offset_counter
+            current_base_range = self.buffer.fetch_range(self.name, page_index)
+            slot_index = current_base_range[INDIRECTION_COLUMN].num_records #same slot in every column, redo places the record there again
 
-        self.buffer.unpin_range(self.name, self.base_offset_counter) #unpin after getting value
-        if not current_range.has_capacity(): #if latest slot index is -1, need to add another range
-            self.__add_physical_base_range__()
+            if self.logger is not None:
+                self.logger.append(INSERT, self.name, ((page_index, slot_index), columns))
 
-        page_index = self.base_offset_counter
+            for column_index in range(self.num_columns + lstore.config.Offset):
+                current_base_range[column_index].write_at(slot_index, columns[column_index])
+            self.page_directory[columns[RID_COLUMN]] = (page_index, slot_index) #on successful write, store to page directory
+            self.buffer.unpin_range(self.name, page_index) #unpin at the end of transaction
 
-        lock.acquire()
-        current_base_range = self.buffer.fetch_range(self.name, page_index)
-        lock.release()
+    """
+    # Bulk insert, columns holds every column (the metadata columns first) of records with consecutive rids
+    # The records are cut into runs that fit the free slots of the latest base range, a full range is followed by a new
+    # one. A run is logged as one record with its first slot and written with one write_many per column, its page
+    # directory entries are set in one slice
+    """
+    def __insert_many__(self, columns):
+        count = len(columns[RID_COLUMN])
+        written = 0
+        with self.base_latch:
+            while written < count:
+                page_index = self.base_offset_counter
+                current_base_range = self.buffer.fetch_range(self.name, page_index)
+                slot_index = current_base_range[INDIRECTION_COLUMN].num_records
+                free = lstore.config.PageEntries - slot_index
+                if free <= 0:
+                    self.buffer.unpin_range(self.name, page_index)
+                    self.__add_physical_base_range__()
+                    continue
 
-        for column_index in range(self.num_columns + lstore.config.Offset):
-            current_base_page = current_base_range[column_index]
-            slot_index = current_base_page.write(columns[column_index])
-        self.page_directory[columns[RID_COLUMN]] = (page_index, slot_index) #on successful write, store to page directory
-        self.buffer.unpin_range(self.name, page_index) #unpin at the end of transaction
+                end = min(count, written + free)
+                run = [column[written : end] for column in columns]
+                if self.logger is not None:
+                    self.logger.append(BULK_INSERT, self.name, ((page_index, slot_index), run))
+
+                for column_index in range(self.num_columns + lstore.config.Offset):
+                    current_base_range[column_index].write_many(run[column_index], slot_index)
+                self.page_directory.set_range(run[RID_COLUMN][0], page_index, slot_index, end - written)
+                self.buffer.unpin_range(self.name, page_index)
+                written = end
 
     #in place update of the indirection entry.
     def __update_indirection__(self, old_RID, new_RID):
-        lock = threading.RLock()
         page_index, slot_index = self.page_directory[old_RID]
+        current_page = self.buffer.fetch_range(self.name, page_index, [INDIRECTION_COLUMN])[INDIRECTION_COLUMN]
 
-        lock.acquire()
-        current_page = self.buffer.fetch_range(self.name, page_index)[INDIRECTION_COLUMN]
-        lock.release()
+        if self.logger is not None:
+            self.logger.append(INDIRECTION, self.name, (old_RID, current_page.read(slot_index), new_RID))
 
         current_page.inplace_update(slot_index, new_RID)
-        self.buffer.unpin_range(self.name, page_index) #unpin after inplace update
+        self.buffer.unpin_range(self.name, page_index, [INDIRECTION_COLUMN]) #unpin after inplace update
 
     # Set base page entry RID to 0 to invalidate it
     def __delete__ (self, RID):
-        lock = threading.RLock()
         page_index, slot_index = self.page_directory[RID]
+        current_page = self.buffer.fetch_range(self.name, page_index, [RID_COLUMN])[RID_COLUMN]
 
-        lock.acquire()
-        current_page = self.buffer.fetch_range(self.name, page_index)[RID_COLUMN]
-        lock.release()
+        if self.logger is not None:
+            self.logger.append(DELETE, self.name, RID)
 
         current_page.inplace_update(slot_index, 0)
-        self.buffer.unpin_range(self.name, page_index) #unpin after inplace update
+        self.buffer.unpin_range(self.name, page_index, [RID_COLUMN]) #unpin after inplace update
+        latest = self.latest
+        if latest is not None:
+            latest.discard(RID)
 
     def __return_base_indirection__(self, RID):
-        lock = threading.RLock()
         page_index, slot_index = self.page_directory[RID]
-
-        lock.acquire()
-        current_page = self.buffer.fetch_range(self.name, page_index)[INDIRECTION_COLUMN]
-        lock.release()
+        current_page = self.buffer.fetch_range(self.name, page_index, [INDIRECTION_COLUMN])[INDIRECTION_COLUMN]
 
         indirection_index = current_page.read(slot_index)
-        self.buffer.unpin_range(self.name, page_index) #unpin after reading indirection
+        self.buffer.unpin_range(self.name, page_index, [INDIRECTION_COLUMN]) #unpin after reading indirection
         return indirection_index
 
+    #follow the range pointers on disk from a base range, its tail ranges oldest first. Only used to rebuild the tail
+    #directory of a database saved without one
     def __traverse_tail__(self, page_index):
-        counter = 0
+        chain = []
         tail_offset = self.disk.get_offset(self.name, 0, page_index) #tail pointer at the specified base page in disk
-        prev_tail = page_index
         while tail_offset != 0:
-            prev_tail = tail_offset
-            tail_offset = self.disk.get_offset(self.name, 0, prev_tail)
-            counter += 1
+            chain.append(tail_offset)
+            tail_offset = self.disk.get_offset(self.name, 0, tail_offset)
+        return chain
+
+    def __rebuild_tail_directory__(self):
+        self.tail_directory = TailDirectory()
+        for base_offset in sorted(set(offset for rid, (offset, slot) in self.page_directory.items() if rid < lstore.config.StartTailRID // 2)):
+            for tail_offset in self.__traverse_tail__(base_offset):
+                self.tail_directory.append(base_offset, tail_offset)
 
-        tail_offset = prev_tail
-        return tail_offset, counter
+    #number of tail ranges chained to a base range
+    def __chain_length__(self, base_offset):
+        return len(self.tail_directory.chain(base_offset))
 
     def __update__(self, columns, base_rid):
-        thread_lock = threading.RLock()
         base_offset, _ = self.page_directory[base_rid]
-        current_tail = None
-        previous_offset, num_traversed = self.__traverse_tail__(base_offset)
-        page_offset = previous_offset
-
-        if previous_offset == base_offset: #if there is no tail page for the base page
-            thread_lock.acquire()
-            self.__add_physical_tail_range__(previous_offset)
-            page_offset = self.tail_offset_counter
-            thread_lock.release()
-
-        thread_lock.acquire()
-        current_tail = self.buffer.fetch_range(self.name, page_offset)[0]
-        thread_lock.release()
-
-        self.buffer.unpin_range(self.name, page_offset)  #just needed to read this once, unpin right after
-        if not current_tail.has_capacity(): #if the latest tail page is full
-            thread_lock.acquire()
-            self.__add_physical_tail_range__(previous_offset)
-            page_offset = self.tail_offset_counter #add the new range and update the tail offsets accordingly
-            thread_lock.release()
-
-            self.buffer.unpin_range(self.name, base_offset)
-
-            thread_lock.acquire()
-            base_range = self.buffer.fetch_range(self.name, base_offset)
-            thread_lock.release()
-
-            if (num_traversed >= lstore.config.TailMergeLimit) and (base_range[0].has_capacity() == False): # maybe should be >=, check to see if the base page is full
-                
-                thread_lock.acquire()
-                print("merge start")
-                merge_thread = (threading.get_ident() if lstore.config.merge_thread == -1 else lstore.config.merge_thread)
-                thread_lock.release()
-                self.buffer.unpin_range(self.name, base_offset)
-                self.merge_queue.put(base_offset) #add page offset to the queue
-                if len(threading.enumerate()) == 1: #TODO: check the name of the current thread, needs to make sure that merge isn't in the pool
-                    thread = threading.Thread(name = "merge_thread", target = self.__prepare_merge__, args = [self.merge_queue.get()]) # needs to be called in a threaded way, pass through the deep copy of the base range
-                    thread.start()
-
-        thread_lock.acquire()
-        current_tail_range = self.buffer.fetch_range(self.name, page_offset)
-        thread_lock.release()
-
-        for column_index in range(self.num_columns + lstore.config.Offset):
-            current_tail_page = current_tail_range[column_index]
-            slot_index = current_tail_page.write(columns[column_index])
-        self.page_directory[columns[RID_COLUMN]] = (page_offset, slot_index) #on successful write, store to page directory
-        self.buffer.unpin_range(self.name, page_offset) #update is finished, unpin
+        with self.__tail_latch__(base_offset): #one writer at a time per tail chain
+            current_tail = None
+            num_traversed = self.__chain_length__(base_offset)
+            previous_offset = page_offset = self.tail_directory.current(base_offset)
+
+            if previous_offset == base_offset: #if there is no tail page for the base page
+                page_offset = self.__add_physical_tail_range__(base_offset, previous_offset)
+
+            current_tail = self.buffer.fetch_range(self.name, page_offset, [INDIRECTION_COLUMN])[INDIRECTION_COLUMN]
+            self.buffer.unpin_range(self.name, page_offset, [INDIRECTION_COLUMN])  #just needed to read this once, unpin right after
+            if not current_tail.has_capacity(): #if the latest tail page is full
+                page_offset = self.__add_physical_tail_range__(base_offset, previous_offset) #add the new range and update the tail offsets accordingly
+
+                base_range = self.buffer.fetch_range(self.name, base_offset, [INDIRECTION_COLUMN])
+                self.buffer.unpin_range(self.name, base_offset, [INDIRECTION_COLUMN]) #only needed to check if the base range is full
+
+                if (num_traversed >= lstore.config.TailMergeLimit) and (base_range[0].has_capacity() == False): # maybe should be >=, check to see if the base page is full
+                    self.merge_queue.put(base_offset) #the merge daemon merges it in the background
+                    if self.merger is not None:
+                        self.merger.wake()
+
+            current_tail_range = self.buffer.fetch_range(self.name, page_offset)
+            if columns[RID_COLUMN] is None: #allocated under the tail latch, tail rids of a chain shrink in the order they are placed (merge tps relies on it)
+                columns[RID_COLUMN] = self.__next_tail_rid__()
+
+            slot_index = current_tail_range[INDIRECTION_COLUMN].num_records #same slot in every column, redo places the record there again
+            if self.logger is not None:
+                self.logger.append(UPDATE, self.name, (base_rid, columns, (page_offset, slot_index)))
+
+            for column_index in range(self.num_columns + lstore.config.Offset):
+                current_tail_range[column_index].write_at(slot_index, columns[column_index])
+            self.page_directory[columns[RID_COLUMN]] = (page_offset, slot_index) #on successful write, store to page directory
+            lstore.mvcc.wrote(self, columns[RID_COLUMN]) #hidden from snapshots and merges until the transaction commits or the update installed it
+            latest = self.latest
+            if latest is not None:
+                latest.put(base_rid, columns[lstore.config.Offset:])
+            self.installing.add(base_rid) #until the update points the base record at the tail (see __installed__)
+            self.buffer.unpin_range(self.name, page_offset) #update is finished, unpin
+
+    #the base indirection of the record points at the tail the update placed, reads may fill the cache again
+    def __installed__(self, base_rid):
+        self.installing.discard(base_rid)
 
     def __undo_update__(self, base_rid):
         base_offset, slot_index = self.page_directory[base_rid]
-        base_range = self.buffer.fetch_range(self.name, base_offset)
-        tail_rid = base_range[INDIRECTION_COLUMN].read(slot_index)
-        self.buffer.unpin_range(self.name, base_offset)
-
-        tail_offset, tail_slot_index = self.page_directory[tail_rid]
-        tail_range = self.buffer.fetch_range(self.name, tail_offset)
-
-        tail_rid_col = tail_range[RID_COLUMN]
-        tail_indirection_col = tail_range[INDIRECTION_COLUMN]
-
-        tail_rid_col.inplace_update(tail_slot_index, 0) #reset the rid column TODO: make sure merge checks the RID and continues if 0
-        next_latest_rid = tail_indirection_col.read(tail_slot_index)
-        self.buffer.unpin_range(tail_range, tail_offset)
-        # print("current tail is " + str(tail_rid) + " next latest tail_rid is " + str(next_latest_rid))
-        self.__update_indirection__(base_rid, next_latest_rid)
+        with self.__tail_latch__(base_offset): #the latest version cache isn't refilled with the rolled back values
+            base_range = self.buffer.fetch_range(self.name, base_offset, [INDIRECTION_COLUMN])
+            tail_rid = base_range[INDIRECTION_COLUMN].read(slot_index)
+            self.buffer.unpin_range(self.name, base_offset, [INDIRECTION_COLUMN])
+
+            tail_offset, tail_slot_index = self.page_directory[tail_rid]
+            tail_range = self.buffer.fetch_range(self.name, tail_offset, [RID_COLUMN, INDIRECTION_COLUMN])
+
+            tail_rid_col = tail_range[RID_COLUMN]
+            tail_indirection_col = tail_range[INDIRECTION_COLUMN]
+
+            if self.logger is not None:
+                self.logger.append(DELETE, self.name, tail_rid) #compensation record, the tail record is invalidated
+
+            tail_rid_col.inplace_update(tail_slot_index, 0) #reset the rid column TODO: make sure merge checks the RID and continues if 0
+            next_latest_rid = tail_indirection_col.read(tail_slot_index)
+            self.buffer.unpin_range(self.name, tail_offset, [RID_COLUMN, INDIRECTION_COLUMN])
+            # print("current tail is " + str(tail_rid) + " next latest tail_rid is " + str(next_latest_rid))
+            self.__update_indirection__(base_rid, next_latest_rid)
+            latest = self.latest
+            if latest is not None:
+                latest.discard(base_rid)
 
         # lock = threading.Lock()
         # lock.acquire()
@@ -0,0 +1,45 @@
+import pytest
+
+pytest.importorskip("lstore.db")
+
+import lstore.config
+from lstore.db import Database
+from lstore.query import Query
+from lstore.table import INDIRECTION_COLUMN
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(lstore.config, "CheckpointInterval", 0)
+    db = Database()
+    db.open("/BUFFER")
+    yield db
+    db.close()
+
+#columns of every range the table asks the buffer pool for while running a query
+def fetched_columns(db, run):
+    fetched = set()
+    fetch_range = db.buffer_pool.fetch_range
+    def recording_fetch_range(name, page_slot, columns = None):
+        fetched.update(db.buffer_pool.__columns__(name) if columns is None else columns)
+        return fetch_range(name, page_slot, columns)
+    db.buffer_pool.fetch_range = recording_fetch_range
+    try:
+        result = run()
+    finally:
+        del db.buffer_pool.fetch_range
+    return result, fetched
+
+def test_projected_select_loads_only_its_columns(db):
+    table = db.create_table("Grades", 5, 0)
+    query = Query(table)
+    for key in range(10):
+        query.insert(key, key, 2 * key, 0, 0)
+    query.update(5, None, None, 77, None, None)
+    table.release_locks()
+    offset = lstore.config.Offset
+    for key, projection, expected in ((6, [0, 0, 1, 0, 0], [12]), (5, [0, 0, 1, 0, 0], [77]), (5, [0, 1, 0, 0, 1], [5, 0])):
+        records, fetched = fetched_columns(db, lambda: query.select(key, 0, projection)[0])
+        assert [record.columns for record in records] == [expected]
+        assert fetched == set([INDIRECTION_COLUMN] + [offset + column for column in range(5) if projection[column] == 1])
+    table.release_locks()
@@ -0,0 +1,88 @@
+import threading
+
+import pytest
+
+pytest.importorskip("lstore.db")
+
+import lstore.config
+from lstore.cache import LatestVersionCache, ENTRY_OVERHEAD
+from lstore.db import Database
+from lstore.query import Query
+from lstore.transaction import Transaction
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(lstore.config, "CheckpointInterval", 0)
+    db = Database()
+    db.open("/CACHE")
+    db.set_cache_budget(1 << 20)
+    yield db
+    db.close()
+
+def columns(query, key):
+    return [record.columns for record in query.select(key, 0, [1, 1, 1, 1, 1])[0]]
+
+def test_least_recently_used_entries_leave_first():
+    cache = LatestVersionCache(2, 3 * (ENTRY_OVERHEAD + 16))
+    for rid in (1, 2, 3):
+        cache.put(rid, [rid, rid])
+    cache.get(1)
+    cache.put(4, [4, 4])
+    assert cache.get(2) is None
+    assert cache.get(1) == [1, 1] and cache.get(3) == [3, 3] and cache.get(4) == [4, 4]
+    assert cache.stats()["evictions"] == 1
+
+def test_fill_never_replaces_newer_values():
+    cache = LatestVersionCache(2, 1 << 10)
+    cache.put(1, [1, 20])
+    cache.fill(1, [1, 10])
+    assert cache.get(1) == [1, 20]
+    cache.discard(1)
+    cache.fill(1, [1, 30])
+    assert cache.get(1) == [1, 30]
+
+def test_reads_follow_updates_deletes_and_rollbacks(db):
+    table = db.create_table("Grades", 5, 0)
+    query = Query(table)
+    query.insert(1, 10, 0, 0, 0)
+    assert columns(query, 1) == [[1, 10, 0, 0, 0]] #fills the entry
+    query.update(1, None, 20, None, None, None)
+    assert table.latest.get(query.index.locate(1, 0)[0]) == [1, 20, 0, 0, 0]
+    assert columns(query, 1) == [[1, 20, 0, 0, 0]]
+    assert [record.columns for record in query.select(1, 0, [0, 1, 0, 0, 1])[0]] == [[20, 0]] #projected from the entry
+
+    transaction = Transaction()
+    transaction.add_query(query.update, 1, None, 30, None, None, None)
+    transaction.add_query(query.update, 2, None, 40, None, None, None) #no such key, the transaction rolls back
+    assert not transaction.run()
+    assert columns(query, 1) == [[1, 20, 0, 0, 0]]
+
+    query.delete(1)
+    assert columns(query, 1) == []
+
+def test_read_during_an_update_does_not_fill_the_older_version(db):
+    table = db.create_table("Grades", 5, 0)
+    query = Query(table)
+    query.insert(1, 10, 0, 0, 0)
+    rid = query.index.locate(1, 0)[0]
+    placed = threading.Event()
+    release = threading.Event()
+    return_base_indirection = table.__return_base_indirection__
+    def slow_return_base_indirection(base_rid): #the tail is placed and cached, the base indirection is not swung yet
+        placed.set()
+        release.wait()
+        return return_base_indirection(base_rid)
+    table.__return_base_indirection__ = slow_return_base_indirection
+
+    def update():
+        query.update(1, None, 20, None, None, None)
+        table.release_locks()
+    writer = threading.Thread(target = update)
+    writer.start()
+    placed.wait()
+    table.latest.discard(rid) #evicted meanwhile
+    assert table.__read__(rid, [1, 1, 1, 1, 1]).columns == [1, 10, 0, 0, 0]
+    release.set()
+    writer.join()
+    assert columns(query, 1) == [[1, 20, 0, 0, 0]]
@@ -0,0 +1,72 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+pytest.importorskip("lstore.db")
+
+import lstore.config
+from lstore.db import Database
+from lstore.query import Query
+
+#an insert logged before the checkpoint sets its page directory entry only after the checkpoint took its directory delta,
+#then the process dies right after the checkpoint cut the log
+CRASH = textwrap.dedent("""
+    import os, threading
+    import lstore.config
+    lstore.config.CheckpointInterval = 0
+    from lstore.db import Database
+    from lstore.directory import PageDirectory
+    from lstore.query import Query
+
+    db = Database()
+    db.open("/CHECKPOINT")
+    table = db.create_table("Grades", 5, 0)
+    query = Query(table)
+    for key in range(100):
+        query.insert(key, 0, 0, 0, 0)
+
+    entered = threading.Event()
+    release = threading.Event()
+    set_entry = PageDirectory.__setitem__
+    def slow_set_entry(directory, rid, location):
+        if threading.current_thread().name == "writer":
+            entered.set()
+            release.wait()
+        set_entry(directory, rid, location)
+    PageDirectory.__setitem__ = slow_set_entry
+
+    writer = threading.Thread(name = "writer", target = query.insert, args = (12345, 1, 2, 3, 4))
+    writer.start()
+    entered.wait()
+
+    take_changes = table.page_directory.take_changes
+    def take_changes_then_finish_insert():
+        delta = take_changes()
+        release.set()
+        writer.join()
+        return delta
+    table.page_directory.take_changes = take_changes_then_finish_insert
+
+    db.checkpoint()
+    assert [record.columns for record in query.select(12345, 0, [1, 1, 1, 1, 1])[0]] == [[12345, 1, 2, 3, 4]]
+    os._exit(0)
+""")
+
+def test_checkpoint_keeps_entries_set_during_it(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(lstore.config, "CheckpointInterval", 0)
+    environment = dict(os.environ, PYTHONPATH = os.pathsep.join(sys.path))
+    subprocess.run([sys.executable, "-c", CRASH], check = True, env = environment, stdout = subprocess.DEVNULL)
+
+    db = Database()
+    db.open("/CHECKPOINT")
+    query = Query(db.get_table("Grades"))
+    try:
+        assert [record.columns for record in query.select(12345, 0, [1, 1, 1, 1, 1])[0]] == [[12345, 1, 2, 3, 4]]
+        for key in range(100):
+            assert [record.columns for record in query.select(key, 0, [1, 1, 1, 1, 1])[0]] == [[key, 0, 0, 0, 0]]
+    finally:
+        db.close()
@@ -0,0 +1,59 @@
+import pytest
+
+pytest.importorskip("lstore.directory")
+
+import lstore.config
+from lstore.directory import PageDirectory, CHUNK_ENTRIES, EMPTY, SLOT_BITS
+from array import array
+
+BASE = lstore.config.StartBaseRID
+TAIL = lstore.config.StartTailRID
+
+def test_entries_of_base_and_tail_rids():
+    page_directory = PageDirectory()
+    page_directory[BASE] = (0, 1)
+    page_directory[TAIL - 1] = (4104, 511)
+    page_directory.set_range(BASE + 10, 8208, 3, 5)
+    assert page_directory[BASE] == (0, 1) and page_directory[TAIL - 1] == (4104, 511)
+    assert [page_directory[rid] for rid in range(BASE + 10, BASE + 15)] == [(8208, slot) for slot in range(3, 8)]
+    assert page_directory.slots(range(BASE + 10, BASE + 15)) == list(range(3, 8))
+    assert len(page_directory) == 7 and BASE + 1 not in page_directory
+    del page_directory[BASE]
+    with pytest.raises(KeyError):
+        page_directory[BASE]
+    assert page_directory.get(BASE) is None and len(page_directory) == 6
+
+def test_changes_are_taken_once_per_chunk():
+    page_directory = PageDirectory()
+    page_directory[BASE] = (0, 1)
+    page_directory[BASE + CHUNK_ENTRIES + 1] = (0, 2)
+    page_directory[TAIL] = (4104, 1)
+    delta = page_directory.take_changes()
+    assert [position for position, word in enumerate(delta) if word < 0] != [] #runs, not pairs
+    copy = PageDirectory()
+    copy.apply_changes(delta)
+    assert dict(copy.items()) == dict(page_directory.items()) and len(copy) == 3
+    assert len(page_directory.take_changes()) == 0 #nothing changed since
+
+    del page_directory[BASE]
+    page_directory[BASE + 5] = (0, 6)
+    copy.apply_changes(page_directory.take_changes())
+    assert dict(copy.items()) == dict(page_directory.items()) and len(copy) == 3
+
+def test_changes_of_the_older_pair_format_apply():
+    page_directory = PageDirectory()
+    page_directory[BASE] = (0, 1)
+    page_directory.apply_changes(array('q', [BASE, EMPTY, BASE + 1, (4104 << SLOT_BITS) | 2]))
+    assert dict(page_directory.items()) == {BASE + 1: (4104, 2)}
+
+def test_save_and_load_keep_the_entries(tmp_path):
+    page_directory = PageDirectory()
+    page_directory.set_range(BASE, 0, 1, 3 * CHUNK_ENTRIES)
+    page_directory[TAIL - 7] = (4104, 9)
+    page_directory.save(str(tmp_path / "page_directory"))
+    assert len(page_directory.take_changes()) == 0 #saving covers the changes
+    loaded = PageDirectory.load(str(tmp_path / "page_directory"))
+    assert dict(loaded.items()) == dict(page_directory.items()) and len(loaded) == len(page_directory)
+    (tmp_path / "other").write_bytes(b"not a directory" * 3)
+    with pytest.raises(ValueError):
+        PageDirectory.load(str(tmp_path / "other"))
@@ -0,0 +1,52 @@
+import pytest
+
+pytest.importorskip("lstore.db")
+
+import lstore.config
+from lstore.db import Database
+from lstore.query import Query
+from lstore.table import INTEGER, STRING
+
+ROWS = [[key, key * 2, "name" + str(key % 7), key % 3] for key in range(2 * lstore.config.PageEntries + 100)] #spans three base ranges
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(lstore.config, "CheckpointInterval", 0)
+    db = Database()
+    db.open("/BULK")
+    yield db
+    db.close()
+
+def columns(query, key):
+    return [record.columns for record in query.select(key, 0, [1, 1, 1, 1])[0]]
+
+def test_bulk_loaded_records_are_read_indexed_and_updated(db):
+    table = db.create_table("Grades", 4, 0, types = [INTEGER, INTEGER, STRING, INTEGER])
+    query = Query(table)
+    query.insert(len(ROWS), 0, "single", 0) #placed before the block
+    assert query.insert_many(ROWS)[0] and query.insert_many([])[0]
+    for row in ROWS[:: 37] + ROWS[-1:]:
+        assert columns(query, row[0]) == [row]
+    assert query.sum(0, len(ROWS) - 1, 1)[0] == sum(row[1] for row in ROWS)
+    query.update(5, None, 1, "other", None)
+    table.release_locks()
+    assert columns(query, 5) == [[5, 1, "other", 2]]
+    assert columns(query, len(ROWS)) == [[len(ROWS), 0, "single", 0]]
+
+def test_bulk_loaded_records_survive_reopening(db):
+    query = Query(db.create_table("Grades", 4, 0, types = [INTEGER, INTEGER, STRING, INTEGER]))
+    query.insert_many(ROWS)
+    query.insert(len(ROWS), 0, "after", 0) #takes the rid after the block
+    db.close()
+    db.open("/BULK")
+    query = Query(db.get_table("Grades"))
+    for row in ROWS[:: 53] + ROWS[-1:]:
+        assert columns(query, row[0]) == [row]
+    assert columns(query, len(ROWS)) == [[len(ROWS), 0, "after", 0]]
+
+def test_numpy_rows(db):
+    numpy = pytest.importorskip("numpy")
+    query = Query(db.create_table("Grades", 3, 0))
+    query.insert_many(numpy.arange(3000).reshape(1000, 3))
+    assert [record.columns for record in query.select(2997, 0, [1, 1, 1])[0]] == [[2997, 2998, 2999]]
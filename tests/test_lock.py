@@ -0,0 +1,115 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("lstore.lock")
+
+import lstore.config
+import lstore.lock
+from lstore.lock import LockManager, TABLE, range_key, combine, SHARED, EXCLUSIVE, INTENTION_SHARED, INTENTION_EXCLUSIVE, SHARED_INTENTION_EXCLUSIVE, NO_WAIT, WAIT_DIE, WOUND_WAIT, CONFLICT, DIED, WOUNDED, TIMEOUT
+
+OLD = 1001 #owners, with their timestamps below: OLD started first
+YOUNG = 1002
+
+@pytest.fixture(autouse = True)
+def transactions(monkeypatch):
+    monkeypatch.setattr(lstore.lock, "timestamps", {OLD: 1, YOUNG: 2})
+    monkeypatch.setattr(lstore.lock, "wounded", set())
+
+def manager(policy):
+    lock_manager = LockManager()
+    lock_manager.policy = policy
+    return lock_manager
+
+#request a lock on another thread, it may wait
+def acquire_elsewhere(lock_manager, key, mode, owner):
+    result = {}
+    def acquire():
+        result["granted"] = lock_manager.acquire(key, mode, owner, 5)
+        result["cause"] = lstore.lock.last_failure()
+    thread = threading.Thread(target = acquire)
+    thread.start()
+    return thread, result
+
+def wait_for_queue(lock_manager, key):
+    deadline = time.time() + 5
+    while lock_manager.entries[lock_manager.__partition__(key)][key].queue == [] and time.time() < deadline:
+        time.sleep(0.001)
+
+def test_modes_combine():
+    assert combine(None, SHARED) == SHARED
+    assert combine(SHARED, INTENTION_SHARED) == SHARED
+    assert combine(INTENTION_SHARED, EXCLUSIVE) == EXCLUSIVE
+    assert combine(SHARED, INTENTION_EXCLUSIVE) == SHARED_INTENTION_EXCLUSIVE
+    assert combine(SHARED_INTENTION_EXCLUSIVE, EXCLUSIVE) == EXCLUSIVE
+
+@pytest.mark.parametrize("policy", [NO_WAIT, WAIT_DIE, WOUND_WAIT])
+def test_shared_locks_are_shared_and_upgrades_conflict(policy):
+    lock_manager = manager(policy)
+    assert lock_manager.acquire(7, SHARED, OLD, 0) and lock_manager.acquire(7, SHARED, YOUNG, 0)
+    assert not lock_manager.acquire(7, EXCLUSIVE, YOUNG, 0)
+    assert lock_manager.mode(7, YOUNG) == SHARED
+    lock_manager.release_all(OLD)
+    assert lock_manager.acquire(7, EXCLUSIVE, YOUNG, 0)
+    lock_manager.release_all(YOUNG)
+    assert lock_manager.stats()["entries"] == 0 and lock_manager.stats()["owners"] == 0
+
+def test_no_wait_aborts_every_conflict():
+    lock_manager = manager(NO_WAIT)
+    assert lock_manager.acquire(7, EXCLUSIVE, YOUNG)
+    assert not lock_manager.acquire(7, SHARED, OLD)
+    assert lstore.lock.last_failure() == CONFLICT
+
+def test_queries_outside_of_a_transaction_never_wait():
+    lock_manager = manager(WAIT_DIE)
+    assert lock_manager.acquire(7, EXCLUSIVE, YOUNG)
+    assert not lock_manager.acquire(7, EXCLUSIVE, 1003) #no timestamp
+    assert lstore.lock.last_failure() == CONFLICT
+
+def test_wait_die_older_waits_younger_dies():
+    lock_manager = manager(WAIT_DIE)
+    assert lock_manager.acquire(7, EXCLUSIVE, OLD)
+    assert not lock_manager.acquire(7, SHARED, YOUNG)
+    assert lstore.lock.last_failure() == DIED
+    lock_manager.release_all(OLD)
+
+    assert lock_manager.acquire(7, EXCLUSIVE, YOUNG)
+    thread, result = acquire_elsewhere(lock_manager, 7, SHARED, OLD)
+    wait_for_queue(lock_manager, 7)
+    lock_manager.release_all(YOUNG)
+    thread.join()
+    assert result["granted"] and lock_manager.mode(7, OLD) == SHARED
+    assert lock_manager.stats()["dies"] == 1 and lock_manager.stats()["waits"] != 0
+
+def test_wound_wait_older_wounds_younger_holders():
+    lock_manager = manager(WOUND_WAIT)
+    assert lock_manager.acquire(7, EXCLUSIVE, YOUNG)
+    thread, result = acquire_elsewhere(lock_manager, 7, EXCLUSIVE, OLD)
+    wait_for_queue(lock_manager, 7)
+    assert 2 in lstore.lock.wounded
+    assert not lock_manager.acquire(8, SHARED, YOUNG) #its next request fails, the transaction aborts and releases
+    assert lstore.lock.last_failure() == WOUNDED
+    lock_manager.release_all(YOUNG)
+    thread.join()
+    assert result["granted"] and lock_manager.stats()["wounds"] == 1
+
+def test_wound_wait_younger_waits_for_older():
+    lock_manager = manager(WOUND_WAIT)
+    assert lock_manager.acquire(7, EXCLUSIVE, OLD)
+    assert not lock_manager.acquire(7, SHARED, YOUNG, 0.05)
+    assert lstore.lock.last_failure() == TIMEOUT
+    assert lstore.lock.wounded == set()
+
+def test_record_locks_take_intention_locks_and_escalate(monkeypatch):
+    monkeypatch.setattr(lstore.config, "LockEscalation", 3)
+    lock_manager = manager(NO_WAIT)
+    for rid in range(1, 4):
+        assert lock_manager.acquire_record(rid, 0, EXCLUSIVE, OLD)
+    assert lock_manager.mode(TABLE, OLD) == INTENTION_EXCLUSIVE and lock_manager.mode(range_key(0), OLD) == INTENTION_EXCLUSIVE
+    assert lock_manager.acquire_record(4, 0, EXCLUSIVE, OLD)
+    assert lock_manager.mode(range_key(0), OLD) == EXCLUSIVE and lock_manager.mode(4, OLD) is None #escalated
+    assert lock_manager.stats()["escalations"] == 1
+    assert lock_manager.is_written(5, 0, YOUNG) and not lock_manager.is_written(5, 0, OLD)
+    assert not lock_manager.acquire_range(0, SHARED, YOUNG)
+    assert lock_manager.release_all(OLD) == 5
@@ -0,0 +1,109 @@
+import json
+import os
+import subprocess
+import sys
+import textwrap
+import time
+
+import pytest
+
+pytest.importorskip("lstore.db")
+
+import lstore.config
+from lstore.db import Database
+from lstore.query import Query
+
+KEYS = list(range(600)) #a full base range and part of the next
+
+#every record of the full base range is updated once, then updates of one record grow its tail chain until the daemon
+#merged it a few times. Only the indirection page of the base range is written back (its tps says the tails are in the
+#base) and the process dies
+CRASH = textwrap.dedent("""
+    import json, os, sys, time
+    import lstore.config
+    lstore.config.TailMergeLimit = 1
+    lstore.config.CheckpointInterval = 0
+    lstore.config.WriterInterval = 0
+    from lstore.db import Database
+    from lstore.query import Query
+    from lstore.table import INDIRECTION_COLUMN
+
+    keys = json.loads(sys.argv[1])
+    db = Database()
+    db.open("/MERGE")
+    table = db.create_table("Grades", 5, 0)
+    query = Query(table)
+    for key in keys:
+        query.insert(key, 0, 0, 0, 0)
+
+    values = {}
+    for key in keys[: lstore.config.PageEntries - 1]: #the latest versions of these are merged below
+        query.update(key, None, 1000 + key, None, None, None)
+        values[key] = 1000 + key
+    for update_index in range(20 * lstore.config.PageEntries):
+        query.update(keys[0], None, update_index, None, None, None)
+        values[keys[0]] = update_index
+        if db.merger.stats()["merges"] >= 3:
+            break
+    db.merger.stop()
+    assert db.merger.stats()["merges"] >= 3
+
+    base_offset = table.page_directory[lstore.config.StartBaseRID][0]
+    pages = [None] * (table.num_columns + lstore.config.Offset)
+    pages[INDIRECTION_COLUMN] = db.buffer_pool.fetch_range(table.name, base_offset, [INDIRECTION_COLUMN])[INDIRECTION_COLUMN]
+    db.buffer_pool.unpin_range(table.name, base_offset, [INDIRECTION_COLUMN])
+    db.buffer_pool.__write_dirty__(table.name, base_offset, pages)
+    with open("values.json", "w") as file:
+        json.dump(values, file)
+    os._exit(0)
+""")
+
+def test_merged_range_survives_a_crash(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(lstore.config, "CheckpointInterval", 0)
+    environment = dict(os.environ, PYTHONPATH = os.pathsep.join(sys.path))
+    subprocess.run([sys.executable, "-c", CRASH, json.dumps(KEYS)], check = True, env = environment, stdout = subprocess.DEVNULL)
+    with open("values.json") as file:
+        values = {int(key): value for key, value in json.load(file).items()}
+
+    db = Database()
+    db.open("/MERGE")
+    query = Query(db.get_table("Grades"))
+    try:
+        for key in KEYS:
+            records = query.select(key, 0, [1, 1, 1, 1, 1])[0]
+            assert [record.columns for record in records] == [[key, values.get(key, 0), 0, 0, 0]]
+    finally:
+        db.close()
+
+def test_failed_merge_is_recorded_and_tried_again(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(lstore.config, "CheckpointInterval", 0)
+    monkeypatch.setattr(lstore.config, "TailMergeLimit", 1)
+    db = Database()
+    db.open("/MERGE")
+    table = db.create_table("Grades", 5, 0)
+    query = Query(table)
+    prepare_merge = table.__prepare_merge__
+    calls = []
+    def failing_prepare_merge(base_offset): #the first merge raises, as when the buffer pool has no frame to spare
+        calls.append(base_offset)
+        if len(calls) == 1:
+            raise MemoryError("no frame")
+        return prepare_merge(base_offset)
+    table.__prepare_merge__ = failing_prepare_merge
+    try:
+        for key in range(lstore.config.PageEntries - 1):
+            query.insert(key, 0, 0, 0, 0)
+        for update_index in range(4 * lstore.config.PageEntries):
+            query.update(update_index % 10, None, update_index, None, None, None)
+        deadline = time.time() + 5
+        while db.merger.stats()["merges"] == 0 and time.time() < deadline:
+            db.merger.wake()
+            time.sleep(0.01)
+        stats = db.merger.stats()
+        assert stats["failures"] == 1 and stats["merges"] != 0
+        assert stats["last_failure"] == (table.name, calls[0], repr(MemoryError("no frame")))
+        assert capsys.readouterr().out == ""
+    finally:
+        db.close()
@@ -0,0 +1,74 @@
+import threading
+
+import pytest
+
+pytest.importorskip("lstore.db")
+
+import lstore.config
+from lstore.db import Database
+from lstore.occ import OCC, VALIDATION
+from lstore.query import Query
+from lstore.transaction import Transaction
+
+@pytest.fixture
+def query(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(lstore.config, "CheckpointInterval", 0)
+    db = Database()
+    db.open("/OCC")
+    query = Query(db.create_table("Grades", 5, 0))
+    for key in range(3):
+        query.insert(key, 10, 0, 0, 0)
+    yield query
+    db.close()
+
+def values(query, key):
+    return [record.columns[1] for record in query.select(key, 0, [1, 1, 1, 1, 1])[0]]
+
+#a query of the transaction that runs another query outside of it, on another thread, in the middle of its read phase
+def meanwhile(query, *args):
+    def concurrent_query():
+        def run():
+            query.update(*args)
+            query.table.release_locks()
+        thread = threading.Thread(target = run)
+        thread.start()
+        thread.join()
+        return True, query.table, None
+    return concurrent_query
+
+#a select of the transaction whose records are kept in seen
+def seen_select(query, key, seen):
+    def select():
+        records = query.select(key, 0, [1, 1, 1, 1, 1])
+        seen.extend(record.columns[1] for record in records[0])
+        return records
+    return select
+
+def test_writes_are_installed_at_commit_and_read_by_the_transaction(query):
+    seen = []
+    transaction = Transaction(OCC)
+    transaction.add_query(query.update, 1, None, 20, None, None, None)
+    transaction.add_query(seen_select(query, 1, seen))
+    transaction.add_query(query.insert, 5, 50, 0, 0, 0)
+    assert transaction.run()
+    assert query.table.lock_manager.stats()["entries"] == 0
+    assert seen == [20] #its own buffered write
+    assert values(query, 1) == [20] and values(query, 5) == [50]
+
+def test_changed_read_fails_validation(query):
+    transaction = Transaction(OCC)
+    transaction.add_query(query.select, 0, 0, [1, 1, 1, 1, 1])
+    transaction.add_query(meanwhile(query, 0, None, 30, None, None, None))
+    transaction.add_query(query.update, 2, None, 40, None, None, None)
+    assert not transaction.run()
+    assert transaction.abort_cause == VALIDATION
+    assert values(query, 0) == [30] and values(query, 2) == [10] #the buffered write was never installed
+
+def test_unrelated_write_validates(query):
+    transaction = Transaction(OCC)
+    transaction.add_query(query.select, 0, 0, [1, 1, 1, 1, 1])
+    transaction.add_query(meanwhile(query, 1, None, 30, None, None, None))
+    transaction.add_query(query.update, 2, None, 40, None, None, None)
+    assert transaction.run()
+    assert values(query, 1) == [30] and values(query, 2) == [40]
@@ -0,0 +1,78 @@
+import json
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+pytest.importorskip("lstore.db")
+
+import lstore.config
+from lstore.db import Database
+from lstore.query import Query
+
+KEYS = [1000 + key for key in range(2000)]
+
+#workers increment records in transactions while checkpoints and a small buffer pool write the column pages of a range
+#back one by one, then the process dies without closing the database
+CRASH = textwrap.dedent("""
+    import json, os, random, threading, sys
+    import lstore.config
+    lstore.config.buffersize = 8
+    lstore.config.CheckpointInterval = 0.1
+    from lstore.db import Database
+    from lstore.query import Query
+    from lstore.transaction import Transaction
+
+    keys = json.loads(sys.argv[1])
+    db = Database()
+    db.open("/CRASH")
+    table = db.create_table("Grades", 5, 0)
+    query = Query(table)
+    for key in keys:
+        query.insert(key, 0, key * 2, key * 3, key % 7)
+
+    counts = {}
+    latch = threading.Lock()
+    def work(seed):
+        generator = random.Random(seed)
+        for transaction_index in range(150):
+            transaction = Transaction()
+            chosen = [generator.choice(keys) for query_index in range(4)]
+            for key in chosen:
+                transaction.add_query(query.increment, key, 1)
+            if transaction.run():
+                with latch:
+                    for key in chosen:
+                        counts[key] = counts.get(key, 0) + 1
+
+    workers = [threading.Thread(target = work, args = (seed,)) for seed in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    with open("counts.json", "w") as file:
+        json.dump(counts, file)
+    sys.stdout.flush()
+    os._exit(0)
+""")
+
+def test_crash_recovery_keeps_every_record(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(lstore.config, "buffersize", 8) #redo evicts and reads back the pages it writes
+    monkeypatch.setattr(lstore.config, "CheckpointInterval", 0.1)
+    environment = dict(os.environ, PYTHONPATH = os.pathsep.join(sys.path))
+    subprocess.run([sys.executable, "-c", CRASH, json.dumps(KEYS)], check = True, env = environment, stdout = subprocess.DEVNULL)
+    with open("counts.json") as file:
+        counts = {int(key): count for key, count in json.load(file).items()}
+
+    db = Database()
+    db.open("/CRASH")
+    query = Query(db.get_table("Grades"))
+    try:
+        for key in KEYS:
+            records = query.select(key, 0, [1, 1, 1, 1, 1])[0]
+            assert [record.columns for record in records] == [[key, counts.get(key, 0), key * 2, key * 3, key % 7]]
+    finally:
+        db.close()
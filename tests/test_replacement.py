@@ -0,0 +1,72 @@
+import pytest
+
+pytest.importorskip("lstore.replacement")
+
+from lstore.replacement import LFUPolicy, ClockPolicy, LRUKPolicy, TwoQPolicy, Policies, make_policy
+
+def unpinned(frame):
+    return False
+
+def filled(policy, frames):
+    for frame in range(frames):
+        policy.admit(frame, ("Grades", frame * 4104, 0))
+    return policy
+
+@pytest.mark.parametrize("name", sorted(Policies))
+def test_victim_skips_pinned_frames(name):
+    policy = filled(make_policy(name, 4), 4)
+    assert policy.victim(lambda frame: frame != 2) == 2
+    assert policy.victim(lambda frame: True) is None
+
+@pytest.mark.parametrize("name", sorted(Policies))
+def test_every_frame_is_evicted_once(name):
+    policy = filled(make_policy(name, 4), 4)
+    assert sorted(policy.victim(unpinned) for frame in range(4)) == [0, 1, 2, 3]
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        make_policy("MRU", 4)
+
+def test_lfu_evicts_the_least_accessed():
+    policy = filled(LFUPolicy(3), 3)
+    for frame in (0, 0, 2):
+        policy.access(frame)
+    assert policy.victim(unpinned) == 1
+    assert policy.victim(unpinned) == 2
+
+def test_clock_gives_referenced_frames_a_second_chance():
+    policy = filled(ClockPolicy(3), 3)
+    assert policy.victim(unpinned) == 0 #the sweep cleared every bit set on admission
+    policy.access(1)
+    assert policy.victim(unpinned) == 2
+    assert policy.victim(unpinned) == 1
+
+def test_lru_k_evicts_frames_with_fewer_than_k_accesses_first():
+    policy = filled(LRUKPolicy(3), 3)
+    policy.access(0)
+    policy.access(1)
+    assert policy.victim(unpinned) == 2
+    assert policy.victim(unpinned) == 0 #its second most recent access is the oldest
+
+def test_lru_k_heap_stays_bounded_without_evictions():
+    policy = filled(LRUKPolicy(8), 8)
+    for hit in range(100000):
+        policy.access(hit % 8)
+    assert len(policy.heap) <= 4 * 8 + 4
+    assert [policy.victim(unpinned) for frame in range(8)] == list(range(8))
+
+def test_untracked_hits_are_ignored():
+    for policy in (LFUPolicy(2), LRUKPolicy(2), TwoQPolicy(2)):
+        policy.admit(0, ("Grades", 0, 0))
+        policy.access(1)
+        assert policy.victim(unpinned) == 0
+        assert policy.victim(unpinned) is None
+
+def test_two_q_scan_leaves_hot_frames_alone():
+    policy = TwoQPolicy(8)
+    policy.admit(0, "hot")
+    assert policy.victim(unpinned) == 0 #remembered in A1out
+    policy.admit(0, "hot") #referenced again, goes to Am
+    for frame in range(1, 8):
+        policy.admit(frame, "scan" + str(frame))
+    assert [policy.victim(unpinned) for frame in range(1, 7)] == list(range(1, 7)) #A1in is cut down to its share first
@@ -0,0 +1,117 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("lstore.db")
+
+import lstore.config
+import lstore.mvcc
+from lstore.db import Database
+from lstore.lock import range_key
+from lstore.query import Query
+from lstore.transaction import Transaction
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(lstore.config, "CheckpointInterval", 0)
+    db = Database()
+    db.open("/SNAPSHOT")
+    yield db
+    db.close()
+
+def values(query, key, column_index = 1):
+    return [record.columns[column_index] for record in query.select(key, 0, [1, 1, 1, 1, 1])[0]]
+
+#reads run as a snapshot transaction on this thread from the call on
+def start_snapshot():
+    lstore.mvcc.begin(True)
+
+#run the queries outside of a transaction on another thread, the snapshot transaction of this one doesn't own their writes
+def run_elsewhere(table, target, *args):
+    def run():
+        target(*args)
+        table.release_locks() #nothing else releases the locks of queries run outside of a transaction
+    thread = threading.Thread(target = run)
+    thread.start()
+    return thread
+
+def test_snapshot_ignores_commits_after_it_started(db):
+    query = Query(db.create_table("Grades", 5, 0))
+    query.insert(1, 10, 0, 0, 0)
+    start_snapshot()
+    try:
+        transaction = Transaction()
+        transaction.add_query(query.update, 1, None, 20, None, None, None)
+        writer = threading.Thread(target = transaction.run)
+        writer.start()
+        writer.join()
+        query.insert(2, 30, 0, 0, 0)
+        assert values(query, 1) == [10]
+        assert values(query, 2) == [] #inserted after the snapshot
+    finally:
+        lstore.mvcc.end()
+    assert values(query, 1) == [20]
+
+def test_snapshot_ignores_update_installed_after_it_started(db):
+    table = db.create_table("Grades", 5, 0)
+    query = Query(table)
+    query.insert(1, 10, 0, 0, 0)
+    locked = threading.Event()
+    release = threading.Event()
+    acquire_write = table.acquire_write
+    def slow_acquire_write(rid, timeout = None): #the update took its time before it got here
+        locked.set()
+        release.wait()
+        return acquire_write(rid, timeout)
+    table.acquire_write = slow_acquire_write
+
+    writer = run_elsewhere(table, query.update, 1, None, 20, None, None, None)
+    locked.wait()
+    start_snapshot()
+    try:
+        release.set()
+        writer.join()
+        assert values(query, 1) == [10]
+    finally:
+        lstore.mvcc.end()
+    assert values(query, 1) == [20]
+
+def test_sum_outside_a_transaction_reads_a_snapshot(db):
+    table = db.create_table("Grades", 5, 0)
+    query = Query(table)
+    for key in range(10):
+        query.insert(key, key, 0, 0, 0)
+    run_elsewhere(table, query.update, 3, None, 100, None, None, None).join()
+    assert query.sum(0, 9, 1)[0] == sum(range(10)) - 3 + 100
+    assert lstore.mvcc.oldest_snapshot() is None #its snapshot ended
+    assert table.lock_manager.mode(range_key(table.page_directory[lstore.config.StartBaseRID][0])) is None #no range lock left behind
+
+def test_merge_waits_for_an_older_snapshot(db, monkeypatch):
+    monkeypatch.setattr(lstore.config, "TailMergeLimit", 1)
+    table = db.create_table("Grades", 5, 0)
+    query = Query(table)
+    for key in range(lstore.config.PageEntries - 1): #one full base range
+        query.insert(key, 0, 0, 0, 0)
+    latest = {}
+    def updates():
+        for update_index in range(4 * lstore.config.PageEntries):
+            query.update(update_index % 10, None, update_index + 1, None, None, None)
+            latest[update_index % 10] = update_index + 1
+    start_snapshot()
+    try:
+        run_elsewhere(table, updates).join()
+        deadline = time.time() + 5
+        while db.merger.stats()["deferred"] == 0 and time.time() < deadline:
+            time.sleep(0.01)
+        assert db.merger.stats()["merges"] == 0 and db.merger.stats()["deferred"] != 0
+        assert values(query, 0) == [0]
+    finally:
+        lstore.mvcc.end()
+    deadline = time.time() + 5
+    while db.merger.stats()["merges"] == 0 and time.time() < deadline:
+        db.merger.wake()
+        time.sleep(0.01)
+    assert db.merger.stats()["merges"] != 0
+    assert values(query, 0) == [latest[0]]
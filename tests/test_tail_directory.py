@@ -0,0 +1,111 @@
+import json
+import os
+import subprocess
+import sys
+import textwrap
+import types
+
+import pytest
+
+pytest.importorskip("lstore.db")
+
+import lstore.config
+from lstore.db import Database
+from lstore.directory import TailDirectory
+from lstore.logger import RANGE, redo
+from lstore.query import Query
+
+def test_chains_append_and_drop():
+    tail_directory = TailDirectory()
+    assert tail_directory.current(0) == 0
+    for tail_offset in (100, 200, 300):
+        tail_directory.append(0, tail_offset)
+    tail_directory.append(0, 200) #placed again by redo
+    assert list(tail_directory.chain(0)) == [100, 200, 300]
+    assert tail_directory.owner(200) == 0 and tail_directory.owner(0) == 0
+    tail_directory.drop(0, 2)
+    assert list(tail_directory.chain(0)) == [300]
+    assert 100 not in tail_directory and 300 in tail_directory
+    assert tail_directory.current(0) == 300
+
+def test_save_and_load(tmp_path):
+    tail_directory = TailDirectory()
+    for base_offset, tail_offsets in ((0, [100, 200]), (50, [150])):
+        for tail_offset in tail_offsets:
+            tail_directory.append(base_offset, tail_offset)
+    tail_directory.save(str(tmp_path / "tail_directory"))
+    loaded = TailDirectory.load(str(tmp_path / "tail_directory"))
+    assert loaded.chains == tail_directory.chains and loaded.owners == tail_directory.owners
+
+#a table with just what redo of a range allocation touches, the pointers it writes to disk are recorded
+def chained_table(chain):
+    table = types.SimpleNamespace(name = "Grades", base_offset_counter = 0, tail_offset_counter = 0, tail_directory = TailDirectory(), pointers = [])
+    table.disk = types.SimpleNamespace(update_range_offset = lambda name, offset, tail_offset: table.pointers.append((offset, tail_offset)))
+    for tail_offset in chain:
+        table.tail_directory.append(0, tail_offset)
+    return table
+
+def test_redo_places_missing_ranges():
+    table = chained_table([100])
+    redo(table, RANGE, (0, 200, 100, 0))
+    redo(table, RANGE, (0, 300, 200)) #logged before the base offset was
+    assert list(table.tail_directory.chain(0)) == [100, 200, 300]
+    assert table.pointers == [(100, 200), (200, 300)]
+    assert table.tail_offset_counter == 300
+
+def test_redo_skips_ranges_merged_since():
+    table = chained_table([300]) #saved after a merge dropped 100 and 200
+    for payload in ((0, 100, 0, 0), (0, 200, 100, 0), (0, 300, 200, 0)):
+        redo(table, RANGE, payload)
+    assert list(table.tail_directory.chain(0)) == [300]
+    assert table.pointers == []
+
+#merges drop the first tail ranges of a chain, then the tail directory is saved (as a checkpoint does before it cuts the log)
+#and the process dies: the log still holds the allocation of the ranges that were merged
+CRASH = textwrap.dedent("""
+    import json, os, sys
+    import lstore.config
+    lstore.config.TailMergeLimit = 1
+    lstore.config.CheckpointInterval = 0
+    from lstore.db import Database
+    from lstore.query import Query
+    from lstore.table import write_tail_directory
+
+    db = Database()
+    db.open("/CHAIN")
+    table = db.create_table("Grades", 5, 0)
+    query = Query(table)
+    for key in range(lstore.config.PageEntries - 1): #one full base range
+        query.insert(key, 0, 0, 0, 0)
+    value = 0
+    while db.merger.stats()["merges"] < 2 and value < 20 * lstore.config.PageEntries:
+        value += 1
+        query.update(value % 10, None, value, None, None, None)
+    db.merger.stop()
+
+    base_offset = table.page_directory[lstore.config.StartBaseRID][0]
+    db.logger.flush() #the updates are autocommit, nothing forced them yet
+    write_tail_directory(table)
+    with open("chain.json", "w") as file:
+        json.dump({"chain": list(table.tail_directory.chain(base_offset)), "values": dict((key, query.select(key, 0, [0, 1, 0, 0, 0])[0][0].columns[0]) for key in range(10))}, file)
+    os._exit(0)
+""")
+
+def test_redo_does_not_chain_merged_ranges_again(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(lstore.config, "CheckpointInterval", 0)
+    environment = dict(os.environ, PYTHONPATH = os.pathsep.join(sys.path))
+    subprocess.run([sys.executable, "-c", CRASH], check = True, env = environment, stdout = subprocess.DEVNULL)
+    with open("chain.json") as file:
+        saved = json.load(file)
+
+    db = Database()
+    db.open("/CHAIN")
+    table = db.get_table("Grades")
+    query = Query(table)
+    try:
+        assert list(table.tail_directory.chain(table.page_directory[lstore.config.StartBaseRID][0])) == saved["chain"]
+        for key, value in saved["values"].items():
+            assert query.select(int(key), 0, [0, 1, 0, 0, 0])[0][0].columns == [value]
+    finally:
+        db.close()
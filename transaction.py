@@ -1,16 +1,29 @@
 from lstore.table import Table, Record
 from lstore.index import Index
+from lstore.logger import AUTOCOMMIT, next_transaction_id, set_transaction, current_transaction
+from lstore.occ import TWO_PL, OCC, VALIDATION
+import lstore.lock
+import lstore.mvcc
+import lstore.occ
 import threading
 import sys
 
+#abort cause of a query that failed without a lock conflict (e.g. its key doesn't exist), running it again won't help
+FAILED_QUERY = "query"
+
 class Transaction:
 
     """
     # Creates a transaction object.
+    :param concurrency: string  #TWO_PL, OCC or SNAPSHOT, None for the mode of the database (Database.set_concurrency)
     """
-    def __init__(self):
+    def __init__(self, concurrency = None):
+        self.concurrency = concurrency
         self.queries = []
         self.uncommittedQueries = [] #tuples of the key value and the index structure pointer
+        self.txn_id = AUTOCOMMIT #log id, assigned when the transaction runs
+        self.timestamp = None #age for wait-die and wound-wait, assigned on the first run and kept by a restart
+        self.abort_cause = None #why the last run aborted, a lstore.lock cause or FAILED_QUERY
         pass
 
     """
@@ -23,18 +36,88 @@ class Transaction:
     def add_query(self, query, *args):
         self.queries.append((query, args))
 
+    #tables the queries run on
+    def __tables__(self):
+        tables = []
+        for query, args in self.queries:
+            table = getattr(getattr(query, "__self__", None), "table", None)
+            if table is not None and table not in tables:
+                tables.append(table)
+        return tables
+
+    def __concurrency__(self):
+        if self.concurrency is not None:
+            return self.concurrency
+        tables = self.__tables__()
+        return tables[0].concurrency if len(tables) != 0 else TWO_PL
+
     # If you choose to implement this differently this method must still return True if transaction commits or False on abort
+    # A query that raises aborts the transaction before the exception goes on, the thread keeps no lock and runs later
+    # queries outside of any transaction again
     def run(self):
+        try:
+            return self.__run__()
+        except BaseException:
+            lstore.occ.end()
+            if self.txn_id != AUTOCOMMIT and current_transaction() == self.txn_id: #neither committed nor aborted yet
+                tables = self.__tables__()
+                if len(tables) != 0:
+                    self.abort(tables[0])
+                else:
+                    lstore.mvcc.abort()
+                    set_transaction(AUTOCOMMIT)
+                    lstore.lock.end()
+            raise
+
+    def __run__(self):
+        self.txn_id = next_transaction_id()
+        set_transaction(self.txn_id) #log records written by the queries on this thread belong to this transaction
+        self.abort_cause = None
+        concurrency = self.__concurrency__()
+        lstore.mvcc.begin(concurrency == lstore.mvcc.SNAPSHOT)
+        if concurrency == OCC:
+            return self.__run_optimistic__()
+        if self.timestamp is None:
+            self.timestamp = lstore.lock.next_timestamp()
+        lstore.lock.begin(self.timestamp)
         for query, args in self.queries:
             result, table, rid = query(*args)
             self.uncommittedQueries.append((query, rid, table))
             if result == False: # If the query has failed the transaction should abort
                 # print("aborted " + str(threading.get_ident()))
                 self.uncommittedQueries.pop() #no need to "undo" the aborted transaction
+                self.abort_cause = lstore.lock.last_failure() or FAILED_QUERY
                 return self.abort(table)
         # print("committed "+ str(threading.get_ident()))
         return self.commit(table)
 
+    """
+    # Optimistic run: the queries read without locks and buffer their writes (read phase), the read set is validated
+    # and the buffered writes are installed through the 2PL paths holding the locks validation took (write phase)
+    """
+    def __run_optimistic__(self):
+        rw_set = lstore.occ.begin()
+        table = None
+        for query, args in self.queries:
+            result, table, rid = query(*args)
+            if result == False:
+                lstore.occ.end()
+                self.abort_cause = lstore.lock.last_failure() or FAILED_QUERY
+                return self.abort(table)
+        lstore.occ.end()
+
+        if not rw_set.validate():
+            self.abort_cause = VALIDATION
+            return self.abort(table)
+        for table, rid, query, args in rw_set.writes:
+            result, table, rid = query(*args)
+            self.uncommittedQueries.append((query, rid, table))
+            if result == False: #only a key that doesn't exist, the locks are held
+                self.uncommittedQueries.pop()
+                self.abort_cause = FAILED_QUERY
+                return self.abort(table)
+        return self.commit(table)
+
     def abort(self, table):
         #TODO: do roll-back and any other necessary operations
         thread_lock = threading.RLock()
@@ -49,10 +132,18 @@ class Transaction:
             else:
                 pass
                 # print("didn't find an update, val is " + fn_name)
+        self.uncommittedQueries = [] #rolled back, a restart starts over
+        lstore.mvcc.abort()
+
+        if table.logger is not None:
+            table.logger.abort(self.txn_id)
+        set_transaction(AUTOCOMMIT)
 
         thread_lock.acquire()
-        table.release_locks()
+        for table in self.__tables__():
+            table.release_locks()
         thread_lock.release()
+        lstore.lock.end()
         return False
 
     def commit(self, table):
@@ -61,7 +152,14 @@ class Transaction:
         while len(self.uncommittedQueries) != 0:
             query, key, index = self.uncommittedQueries.pop()
 
+        if table.logger is not None: #returns once the commit record is on disk, the fsync is shared with the other committers
+            table.logger.commit(self.txn_id)
+        lstore.mvcc.commit() #durable, snapshots starting from now see the writes
+        set_transaction(AUTOCOMMIT)
+
         thread_lock.acquire()
-        table.release_locks()
+        for table in self.__tables__():
+            table.release_locks()
         thread_lock.release()
+        lstore.lock.end()
         return True
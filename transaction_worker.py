@@ -1,21 +1,34 @@
 from lstore.table import Table, Record
 from lstore.index import Index
+from lstore.transaction import FAILED_QUERY
+import lstore.config
+import heapq
+import random
 import threading
+import time
 
 class TransactionWorker:
 
     """
     # Creates a transaction worker object.
     """
-    def __init__(self, transactions = []):
+    def __init__(self, transactions = None):
         self.stats = []
-        self.transactions = transactions
+        self.transactions = [] if transactions is None else transactions
         self.result = 0
+        self.attempts = 0 #runs of a transaction, restarts included
+        self.retries = 0
+        self.aborts = {} #abort cause to count, every aborted run is counted
+        self.backoff_time = 0.0 #seconds slept waiting for a restart to be due
         pass
 
     def add_transaction(self, t):
         self.transactions.append(t)
 
+    #random time before the given restart of a transaction, exponential with full jitter so conflicting restarts spread out
+    def __backoff__(self, retry):
+        return random.uniform(0, min(lstore.config.RetryBackoffMax, lstore.config.RetryBackoff * 2 ** (retry - 1)))
+
     """
     # Adds the given query to this transaction
     # Example:
@@ -25,8 +38,32 @@ class TransactionWorker:
     # transaction_worker = TransactionWorker([t])
     """
     def run(self):
-        for transaction in self.transactions:
+        # transactions run in order, one aborted by a lock conflict is queued again behind the others with a backoff,
+        # up to TransactionAttempts runs. The queue is ordered by the time a run is due, then by arrival
+        self.stats = [False] * len(self.transactions)
+        queue = [(0.0, position, position, 1) for position in range(len(self.transactions))] #(due, arrival, position, attempt)
+        arrivals = len(self.transactions)
+        while len(queue) != 0:
+            due, arrival, position, attempt = heapq.heappop(queue)
+            delay = due - time.monotonic()
+            if delay > 0: #nothing else is left to run meanwhile
+                time.sleep(delay)
+                self.backoff_time += delay
+
+            transaction = self.transactions[position]
+            self.attempts += 1
             # each transaction returns True if committed or False if aborted
-            self.stats.append(transaction.run())
+            self.stats[position] = transaction.run()
+            if self.stats[position]:
+                continue
+            cause = transaction.abort_cause
+            self.aborts[cause] = self.aborts.get(cause, 0) + 1
+            if cause != FAILED_QUERY and attempt < lstore.config.TransactionAttempts:
+                self.retries += 1
+                heapq.heappush(queue, (time.monotonic() + self.__backoff__(attempt), arrivals, position, attempt + 1))
+                arrivals += 1
         # stores the number of transactions that committed
-        self.result = len(list(filter(lambda x: x, self.stats)))
\ No newline at end of file
+        self.result = len(list(filter(lambda x: x, self.stats)))
+
+    def retry_stats(self):
+        return {"committed": self.result, "attempts": self.attempts, "retries": self.retries, "aborts": dict(self.aborts), "backoff_time": self.backoff_time}